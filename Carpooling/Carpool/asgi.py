@@ -0,0 +1,18 @@
+"""
+ASGI config for Carpool project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn Carpool.asgi:application``) so
+the async views share one event loop and their chain calls overlap.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Carpool.settings')
+
+application = get_asgi_application()
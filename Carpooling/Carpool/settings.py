@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'CarpoolApp.middleware.RequestIdMiddleware',
+    'CarpoolApp.middleware.RpcAccountingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,6 +71,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'Carpool.wsgi.application'
+# Chain-bound read views are async; under ASGI they share one event loop
+ASGI_APPLICATION = 'Carpool.asgi.application'
 
 
 # Database
@@ -82,6 +86,128 @@ DATABASES = {
 }
 
 
+# Blockchain node
+# Read by CarpoolApp.chain; every request shares one pooled keep-alive session.
+
+BLOCKCHAIN = {
+    'RPC_URL': os.environ.get('BLOCKCHAIN_RPC_URL', 'http://127.0.0.1:9545'),
+    'NETWORK_ID': '5777',
+    'BUILD_DIR': None,            # truffle artifacts, None for <repo>/build/contracts
+    'DEFAULT_ACCOUNT_INDEX': 0,
+    'RPC_TIMEOUT': 10,            # seconds per JSON-RPC request
+    'RPC_RETRIES': 3,             # retries for idempotent RPC methods, 0 disables
+    'RPC_POOL_CONNECTIONS': 4,    # host pools kept by the session
+    'RPC_POOL_MAXSIZE': 16,       # keep-alive connections per host
+    'RPC_POOL_BLOCK': True,       # wait for a free connection instead of opening extras
+    'BLOB_CACHE_BACKEND': 'local',  # 'local' (per process) or 'django' (uses CACHES[BLOB_CACHE_ALIAS])
+    'BLOB_CACHE_ALIAS': 'default',
+    # Local SQLite projection filled by `manage.py sync_chain --follow`
+    'READ_FROM_PROJECTION': False,  # read-only views query the projection instead of the chain
+    'INDEXER_BATCH_BLOCKS': 500,    # blocks applied per DB transaction
+    'INDEXER_CONFIRMATIONS': 0,     # blocks to stay behind the head (0 for Ganache)
+    'INDEXER_POLL_INTERVAL': 2,     # seconds between polls when following
+    # Background receipt tracking (CarpoolApp.txtracker, polled via /tx_status/<id>/)
+    'TX_WORKERS': 4,                # threads waiting for receipts
+    'TX_RECEIPT_TIMEOUT': 120,      # seconds before a job is marked failed
+    'TX_STATUS_ALIAS': 'default',   # CACHES alias holding job status, shared between workers
+    'TX_STATUS_TTL': 3600,          # seconds a finished job stays queryable
+    'CAS_RETRIES': 5,               # re-reads when a versioned write loses a race
+    # CarpoolToken balances (CarpoolApp.balances)
+    'BALANCE_TTL': 15,              # seconds a cached balance is trusted
+    'BALANCE_BATCH_WINDOW': 0.005,  # seconds to collect concurrent lookups into one RPC batch
+    'BALANCE_WATCH_INTERVAL': 2,    # seconds between Transfer log checks for invalidation
+    # Transfer log index and payment settlement (CarpoolApp.payments)
+    'TRANSFER_FOLLOW_INTERVAL': 5,  # seconds between polls of `manage.py follow_transfers`
+    # Bulk CPT distribution (CarpoolApp.distribution, `manage.py distribute_tokens_bulk`)
+    'DISTRIBUTION_CHUNK_SIZE': None,   # recipients per transaction, None to size from a gas estimate
+    'DISTRIBUTION_GAS_FRACTION': 0.5,  # share of the block gas limit one chunk may use
+    'DISTRIBUTION_MAX_CHUNK': 500,     # upper bound on estimated chunk sizes
+    # Pushed ride/payment updates (CarpoolApp.updates, /updates/ event stream)
+    'PUSH_POLL_INTERVAL': 1,        # seconds between block checks while anyone is subscribed
+    # Row format for the v1 string tables (CarpoolApp.codec); both are always readable
+    'RECORD_ENCODING': 'text',      # 'text' ('#'-delimited) or 'compact'
+}
+
+
+# Ride search
+# ViewDrivers radius and the grid cell size of CarpoolApp.spatial.ride_index.
+# /search_rides/ pages hold RIDE_SEARCH_PAGE_SIZE rides unless ?limit= asks
+# for more, up to RIDE_SEARCH_MAX_LIMIT. Searches given from/to expand
+# recurring rides into departures (CarpoolApp.schedule); /get_scheduled_rides/
+# defaults to the next SCHEDULE_WINDOW_DAYS days, and a search given only
+# `from` ends SCHEDULE_WINDOW_DAYS after it.
+
+RIDE_SEARCH_RADIUS_MILES = 3
+RIDE_SEARCH_PAGE_SIZE = 50
+RIDE_SEARCH_MAX_LIMIT = 500
+RIDE_INDEX_CELL_DEGREES = 0.05
+SCHEDULE_WINDOW_DAYS = 7
+
+
+# Ride dispatch
+# `python manage.py dispatch_rides` seats the pickup points queued through
+# /request_dispatch/ on waiting rides within RIDE_SEARCH_RADIUS_MILES.
+# 'greedy' takes the shortest pickups first; 'optimal' seats as many
+# passengers as possible at the least total pickup distance.
+
+DISPATCH_MODE = 'greedy'
+
+
+# RPC instrumentation
+# CarpoolApp.middleware.RpcAccountingMiddleware logs the JSON-RPC calls of
+# every request (and adds X-RPC-* headers when DEBUG); /metrics/ serves
+# the totals for Prometheus.
+
+RPC_METRICS_ENDPOINT = True
+
+
+# Logging
+# Records go through a queue to a background writer thread, so a slow
+# terminal never holds up a request; each line carries the request id set
+# by CarpoolApp.middleware.RequestIdMiddleware. CARPOOL_LOG_LEVEL sets the
+# app's level (DEBUG shows login attempts), and CARPOOL_RPC_LOG_SAMPLE_RATE
+# the share of per-request `rpc` lines kept.
+
+LOG_LEVEL = os.environ.get('CARPOOL_LOG_LEVEL', 'INFO').upper()
+RPC_LOG_SAMPLE_RATE = float(os.environ.get('CARPOOL_RPC_LOG_SAMPLE_RATE', '1.0'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            'format': '%(asctime)s %(levelname)s %(name)s request_id=%(request_id)s %(message)s',
+        },
+    },
+    'filters': {
+        'request_id': {
+            '()': 'CarpoolApp.logutils.RequestIdFilter',
+        },
+        'sample_rpc': {
+            '()': 'CarpoolApp.logutils.SamplingFilter',
+            'rate': RPC_LOG_SAMPLE_RATE,
+        },
+    },
+    'handlers': {
+        'console': {
+            '()': 'CarpoolApp.logutils.QueuedStreamHandler',
+            'formatter': 'structured',
+            'filters': ['request_id'],
+        },
+    },
+    'loggers': {
+        'CarpoolApp': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        'CarpoolApp.rpc': {
+            'filters': ['sample_rpc'],
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
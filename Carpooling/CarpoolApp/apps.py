@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
 
 
 class CarpoolappConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'CarpoolApp'
+
+    def ready(self):
+        # Warm the wallet registry from the users blob when the process
+        # serves its first request (not during migrate or other commands).
+        from .wallets import wallet_registry
+        request_started.connect(wallet_registry.warm_in_background, dispatch_uid='wallet_registry_warm')
+        # Token transfers are followed by one process only: `manage.py sync_chain --follow`
+        # or `manage.py follow_transfers`, never by the web workers.
@@ -0,0 +1,231 @@
+import asyncio, threading
+import aiohttp
+from asgiref.sync import sync_to_async
+from web3 import AsyncWeb3, AsyncHTTPProvider, Web3
+# Private web3 API, pinned like chain.SharedSessionManager's
+from web3._utils.http_session_manager import HTTPSessionManager
+import logging
+from .balances import balance_service
+from .blobcache import BLOB_GETTERS, blob_cache
+from .chain import CONTRACT_MAP, chain_setting, registry
+from .projection import query_table
+from .records import TABLE_TYPES, table_at
+from .rpcmetrics import instrument
+from .wallets import wallet_registry
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Provider --------------------
+
+class LoopSessionManager(HTTPSessionManager):
+    """Session manager that keeps one pooled aiohttp session per event loop.
+
+    web3's default manager opens its aiohttp sessions with force_close, so
+    every call pays for a new TCP connection. Here each loop gets a
+    keep-alive session bounded by BLOCKCHAIN['RPC_POOL_MAXSIZE']. Under
+    ASGI that is one pool for the whole process; the WSGI handler runs each
+    async view on a fresh loop, so sessions of loops that have since closed
+    are closed on the next call rather than left to the garbage collector.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._sessions = {}   # event loop -> ClientSession
+
+    async def async_cache_and_return_session(self, endpoint_uri, session=None, request_timeout=None):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.get(loop)
+            if session is None or session.closed:
+                session = self._sessions[loop] = build_async_session()
+            stale = [(l, s) for l, s in self._sessions.items() if l.is_closed()]
+            for l, s in stale:
+                del self._sessions[l]
+        for l, s in stale:
+            try:
+                await s.close()
+            except Exception as e:
+                logger.debug("Closing aiohttp session of a closed loop failed: %s", e)
+        return session
+
+def build_async_session():
+    """Return an aiohttp session with a bounded keep-alive connection pool."""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=chain_setting('RPC_POOL_MAXSIZE')),
+        raise_for_status=True,
+    )
+
+def build_async_provider():
+    """Return an AsyncHTTPProvider for the configured node using pooled sessions."""
+    provider = AsyncHTTPProvider(
+        chain_setting('RPC_URL'),
+        request_kwargs={'timeout': aiohttp.ClientTimeout(total=chain_setting('RPC_TIMEOUT'))},
+        # eth_chainId never changes; without this every eth_call re-asks for it
+        cache_allowed_requests=True,
+    )
+    provider._request_session_manager = LoopSessionManager()
+    retries = chain_setting('RPC_RETRIES')
+    if not retries:
+        provider.exception_retry_configuration = None
+    else:
+        provider.exception_retry_configuration.retries = retries
+    return provider
+
+# -------------------- Async Contract Registry --------------------
+
+class AsyncContractRegistry:
+    """AsyncWeb3 counterpart of chain.registry for the async views.
+
+    Shares the artifact cache of chain.registry, so both clients always
+    point at the same deployment. The client never blocks on connecting;
+    the first call that needs the node reports it unreachable.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._web3 = None
+        self._contracts = {}   # contract_type -> (mtime, contract)
+
+    def web3(self):
+        """Return the shared AsyncWeb3 client."""
+        web3 = self._web3
+        if web3 is None:
+            with self._lock:
+                if self._web3 is None:
+                    self._web3 = instrument(AsyncWeb3(build_async_provider()))
+                web3 = self._web3
+        return web3
+
+    async def contract(self, contract_type):
+        """Return (async contract, AsyncWeb3) for a contract type, reusing cached objects."""
+        contract_name = CONTRACT_MAP.get(contract_type)
+        if not contract_name:
+            raise ValueError(f"Unknown contract type: {contract_type}")
+
+        # Stats (and on a change reads) the artifact file, so off the loop
+        mtime, abi, address = await sync_to_async(registry.artifact, thread_sensitive=False)(contract_name)
+        web3 = self.web3()
+        cached = self._contracts.get(contract_type)
+        if cached and cached[0] == mtime:
+            return cached[1], web3
+
+        with self._lock:
+            contract = web3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+            self._contracts[contract_type] = (mtime, contract)
+        return contract, web3
+
+    def reset(self):
+        """Drop the client and every cached contract."""
+        with self._lock:
+            self._web3 = None
+            self._contracts.clear()
+
+async_registry = AsyncContractRegistry()
+
+# -------------------- Async Reads --------------------
+
+async def aread_versioned(contract_type):
+    """Async blob_cache.read_versioned(): ((address, block), blob) through the same cache."""
+    getter = BLOB_GETTERS.get(contract_type)
+    if not getter:
+        raise ValueError(f"No blob getter for contract type: {contract_type}")
+
+    contract, web3 = await async_registry.contract(contract_type)
+    block = await web3.eth.block_number
+    backend = blob_cache.backend
+    if backend.blocking:
+        blob = await sync_to_async(blob_cache.get_at)(contract, getter, block)
+    else:
+        blob = blob_cache.get_at(contract, getter, block)
+    if blob is not None:
+        return (contract.address, block), blob
+
+    blob = await getattr(contract.functions, getter)().call(block_identifier=block)
+    if backend.blocking:
+        await sync_to_async(blob_cache.set_at)(contract, getter, block, blob)
+    else:
+        blob_cache.set_at(contract, getter, block, blob)
+    logger.debug("Refreshed %s at block %s (%d chars)", getter, block, len(blob))
+    return (contract.address, block), blob
+
+async def aload_table(contract_type):
+    """Async records.load_table(); both share the per-version parsed tables."""
+    try:
+        version, blob = await aread_versioned(contract_type)
+    except Exception as e:
+        logger.error("Error reading %s from blockchain: %s", contract_type, e)
+        return TABLE_TYPES[contract_type]()
+    return table_at(contract_type, version, blob)
+
+async def aquery_table(contract_type):
+    """Async query_table(): the projection when READ_FROM_PROJECTION is on, else the chain table.
+
+    A projected table's lookups are SQLite queries, so callers run them
+    through sync_to_async().
+    """
+    if chain_setting('READ_FROM_PROJECTION'):
+        return query_table(contract_type)
+    return await aload_table(contract_type)
+
+async def alookup(contract_type, index, key):
+    """Return query_table(contract_type).lookup(index, key) without blocking the loop.
+
+    Projection reads are SQLite queries and run in Django's sync thread.
+    """
+    if chain_setting('READ_FROM_PROJECTION'):
+        return await sync_to_async(lambda: query_table(contract_type).lookup(index, key))()
+    return (await aload_table(contract_type)).lookup(index, key)
+
+async def awallet_address(username):
+    """Return the wallet registry address of `username`, or None."""
+    return await sync_to_async(wallet_registry.get)(username)
+
+# -------------------- Async Balances --------------------
+
+class AsyncBalanceReader:
+    """CarpoolToken balanceOf for the async views.
+
+    Shares balance_service's cache and Transfer log watch, so a balance
+    read by either kind of view is reused by the other and dropped when a
+    transfer touches it. Concurrent misses for one address on an event loop
+    wait for a single eth_call.
+    """
+
+    def __init__(self):
+        self._inflight = {}   # (loop, token, address) -> Task
+
+    async def balance(self, address):
+        """Return the CarpoolToken balance of `address` in wei."""
+        token, web3 = await async_registry.contract('token')
+        await self.watch_transfers(token, web3)
+        address = Web3.to_checksum_address(address)
+        wei = balance_service.cached(token.address, address)
+        if wei is not None:
+            return wei
+        key = (asyncio.get_running_loop(), token.address, address)
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch(token, address))
+            task.add_done_callback(lambda done: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def watch_transfers(self, token, web3):
+        """Async balance_service.watch_transfers()."""
+        due, start = balance_service.watch_due()
+        if not due:
+            return
+        try:
+            head = await web3.eth.block_number
+            logs = await token.events.Transfer().get_logs(from_block=start + 1, to_block=head) \
+                if start is not None and start < head else []
+            balance_service.watched(head, logs)
+        except Exception as e:
+            logger.warning("Watching token transfers failed: %s", e)
+
+    async def _fetch(self, token, address):
+        wei = await token.functions.balanceOf(address).call()
+        balance_service.remember(token.address, address, wei)
+        return wei
+
+async_balances = AsyncBalanceReader()
@@ -0,0 +1,150 @@
+import itertools, threading, time
+from concurrent.futures import Future
+from web3 import Web3
+import logging
+from .chain import chain_setting, load_contract
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Balance Service --------------------
+
+class BalanceService:
+    """Cached and coalesced CarpoolToken balanceOf lookups.
+
+    Balances are kept per address for BLOCKCHAIN['BALANCE_TTL'] seconds and
+    dropped early when a Transfer log touches the address. Cache misses that
+    arrive within BALANCE_BATCH_WINDOW of each other, from any thread, are
+    answered by one JSON-RPC batch instead of one eth_call each.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}      # (token, address) -> (expires, wei), oldest write first
+        self._pending = {}    # (token, address) -> Future
+        self._flushing = False
+        self._last_block = None
+        self._next_watch = 0
+
+    def balance(self, address):
+        """Return the CarpoolToken balance of `address` in wei."""
+        return self.balances([address])[Web3.to_checksum_address(address)]
+
+    def balances(self, addresses):
+        """Return {checksum address: wei} for several addresses."""
+        token, web3 = load_contract('token')
+        self.watch_transfers(token, web3)
+        now = time.monotonic()
+        result, waiting = {}, {}
+        with self._lock:
+            for address in {Web3.to_checksum_address(a) for a in addresses}:
+                key = (token.address, address)
+                cached = self._cache.get(key)
+                if cached and cached[0] > now:
+                    result[address] = cached[1]
+                    continue
+                future = self._pending.get(key)
+                if future is None:
+                    future = self._pending[key] = Future()
+                waiting[address] = future
+            leader = bool(waiting) and not self._flushing
+            if leader:
+                self._flushing = True
+
+        if leader:
+            # Give concurrent requests a moment to join this batch
+            time.sleep(chain_setting('BALANCE_BATCH_WINDOW'))
+            self._flush(token, web3)
+        for address, future in waiting.items():
+            result[address] = future.result(timeout=chain_setting('RPC_TIMEOUT'))
+        return result
+
+    def _flush(self, token, web3):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushing = False
+        keys = list(pending)
+        try:
+            with web3.batch_requests() as batch:
+                for token_address, address in keys:
+                    batch.add(token.functions.balanceOf(address))
+                values = batch.execute()
+        except Exception as e:
+            for future in pending.values():
+                future.set_exception(e)
+            return
+
+        expires = time.monotonic() + chain_setting('BALANCE_TTL')
+        with self._lock:
+            for key, wei in zip(keys, values):
+                self._store(key, expires, wei)
+        for key, wei in zip(keys, values):
+            pending[key].set_result(wei)
+        logger.debug(f"Fetched {len(keys)} token balances in one batch")
+
+    def cached(self, token_address, address):
+        """Return the cached balance of a checksum address if still fresh, else None."""
+        cached = self._cache.get((token_address, address))
+        return cached[1] if cached and cached[0] > time.monotonic() else None
+
+    def remember(self, token_address, address, wei):
+        """Cache a balance read elsewhere (e.g. by the async views)."""
+        with self._lock:
+            self._store((token_address, address), time.monotonic() + chain_setting('BALANCE_TTL'), wei)
+
+    def _store(self, key, expires, wei):
+        """Cache one balance and evict the expired ones; call with the lock held.
+
+        Entries are re-inserted on every write, so with one TTL for all of
+        them the dict stays in expiry order and the expired ones sit at
+        its front.
+        """
+        self._cache.pop(key, None)
+        self._cache[key] = (expires, wei)
+        now = time.monotonic()
+        for stale in list(itertools.takewhile(lambda k: self._cache[k][0] <= now, self._cache)):
+            del self._cache[stale]
+
+    def invalidate(self, *addresses):
+        """Forget the cached balances of `addresses`."""
+        targets = {Web3.to_checksum_address(a) for a in addresses if a}
+        with self._lock:
+            for key in [key for key in self._cache if key[1] in targets]:
+                del self._cache[key]
+
+    def watch_transfers(self, token, web3):
+        """Invalidate addresses touched by Transfer logs since the last check.
+
+        Runs at most once per BALANCE_WATCH_INTERVAL seconds, so a busy
+        dashboard costs one eth_getLogs per interval rather than per page.
+        """
+        due, start = self.watch_due()
+        if not due:
+            return
+        try:
+            head = web3.eth.block_number
+            logs = token.events.Transfer().get_logs(from_block=start + 1, to_block=head) \
+                if start is not None and start < head else []
+            self.watched(head, logs)
+        except Exception as e:
+            logger.warning(f"Watching token transfers failed: {e}")
+
+    def watch_due(self):
+        """Return (due, last watched block), claiming the check when it is due.
+
+        Shared with the async views' reader, so both kinds of views make one
+        eth_getLogs per interval between them.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_watch:
+                return False, None
+            self._next_watch = now + chain_setting('BALANCE_WATCH_INTERVAL')
+            return True, self._last_block
+
+    def watched(self, head, logs):
+        """Invalidate the addresses of Transfer `logs` and record `head` as checked."""
+        self.invalidate(*[a for log in logs for a in (log['args']['from'], log['args']['to'])])
+        with self._lock:
+            self._last_block = head
+
+balance_service = BalanceService()
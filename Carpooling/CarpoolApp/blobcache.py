@@ -0,0 +1,232 @@
+import threading
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+import logging
+from .chain import chain_setting, has_function, load_contract, nonce_manager, notify_write, write_hooks
+
+logger = logging.getLogger(__name__)
+
+# Contract type -> getter returning the whole '\n'-separated table
+BLOB_GETTERS = {
+    'signup': 'getUser',
+    'ride': 'getRide',
+    'passengers': 'getPassengers',
+    'ratings': 'getRatings',
+}
+
+# Contract type -> (versioned getter, compare-and-set setter, plain setter)
+VERSIONED_WRITES = {
+    'signup': ('getUserVersioned', 'setUserIfVersion', 'setUser'),
+    'ride': ('getRideVersioned', 'setRideIfVersion', 'setRide'),
+    'passengers': ('getPassengersVersioned', 'setPassengersIfVersion', 'setPassengers'),
+    'ratings': ('getRatingsVersioned', 'setRatingsIfVersion', 'setRatings'),
+}
+
+VERSION_CONFLICT = 'version conflict'
+
+# -------------------- Backends --------------------
+
+class LocalBlobBackend:
+    """Per-process dictionary backend."""
+
+    blocking = False   # get/set never wait on I/O, so async code may call them directly
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+class DjangoBlobBackend:
+    """Backend on top of Django's cache framework, shared between workers
+    when the configured cache is (Redis, Memcached, database...)."""
+
+    blocking = True
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, None)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+def build_backend():
+    """Return the backend selected by BLOCKCHAIN['BLOB_CACHE_BACKEND']."""
+    name = chain_setting('BLOB_CACHE_BACKEND')
+    if name == 'local':
+        return LocalBlobBackend()
+    if name == 'django':
+        return DjangoBlobBackend(chain_setting('BLOB_CACHE_ALIAS'))
+    raise ValueError(f"Unknown blob cache backend: {name}")
+
+# -------------------- Blob Cache --------------------
+
+class BlobCache:
+    """Read-through cache for the users/rides/passengers/ratings strings.
+
+    Entries are keyed by contract address and getter and tagged with the block
+    they were read at. A read costs one eth_blockNumber call and only pulls
+    the full string again when a new block has been mined or after one of our
+    own writes invalidated the entry.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = build_backend()
+        return self._backend
+
+    def _key(self, contract, getter):
+        return f"carpool:blob:{contract.address}:{getter}"
+
+    def read_versioned(self, contract_type):
+        """Return ((address, block), blob) for a contract type."""
+        getter = BLOB_GETTERS.get(contract_type)
+        if not getter:
+            raise ValueError(f"No blob getter for contract type: {contract_type}")
+
+        contract, web3 = load_contract(contract_type)
+        block = web3.eth.block_number
+        blob = self.get_at(contract, getter, block)
+        if blob is not None:
+            return (contract.address, block), blob
+
+        blob = getattr(contract.functions, getter)().call(block_identifier=block)
+        self.set_at(contract, getter, block, blob)
+        logger.debug(f"Refreshed {getter} at block {block} ({len(blob)} chars)")
+        return (contract.address, block), blob
+
+    def get_at(self, contract, getter, block):
+        """Return the blob cached for `getter` if it was read at `block`, else None."""
+        cached = self.backend.get(self._key(contract, getter))
+        return cached[1] if cached is not None and cached[0] == block else None
+
+    def set_at(self, contract, getter, block, blob):
+        """Cache the blob `getter` returned at `block`."""
+        self.backend.set(self._key(contract, getter), (block, blob))
+
+    def read(self, contract_type):
+        """Return the cached blob for a contract type."""
+        return self.read_versioned(contract_type)[1]
+
+    def invalidate(self, contract_type):
+        """Drop the cached blob after a write to it."""
+        getter = BLOB_GETTERS.get(contract_type)
+        if not getter:
+            return
+        contract, web3 = load_contract(contract_type)
+        self.backend.delete(self._key(contract, getter))
+
+blob_cache = BlobCache()
+
+def read_blob(contract_type):
+    """Return the users/rides/passengers/ratings string through the cache."""
+    return blob_cache.read(contract_type)
+
+write_hooks.append(blob_cache.invalidate)
+
+# -------------------- Versioned Writes --------------------
+
+class WriteConflict(Exception):
+    """A compare-and-set write kept losing to concurrent writers."""
+
+def update_blob(contract_type, mutate, wait=True):
+    """Read-modify-write one table without losing concurrent updates.
+
+    Reads the blob together with its version, applies `mutate(blob)` and
+    writes the result with set*IfVersion. When another writer got there
+    first the contract reverts with "version conflict" and the delta is
+    re-applied to a fresh read, up to BLOCKCHAIN['CAS_RETRIES'] times.
+    With `wait=False` the receipt is left to the caller (e.g. tx_tracker);
+    conflicts are still caught when the node estimates the transaction.
+    Returns (new blob, tx hash).
+    """
+    getter, cas_setter, setter = VERSIONED_WRITES[contract_type]
+    contract, web3 = load_contract(contract_type)
+
+    if not has_function(contract, cas_setter):
+        # Carpool deployed before version counters: plain overwrite
+        updated = mutate(blob_cache.read(contract_type))
+        tx_hash = nonce_manager.send(web3, getattr(contract.functions, setter)(updated))
+        if wait:
+            web3.eth.wait_for_transaction_receipt(tx_hash)
+            notify_write(contract_type)
+        return updated, tx_hash
+
+    updated, tx_hash = update_blobs([(contract_type, mutate)], wait=wait)
+    return updated[0], tx_hash
+
+def update_blobs(changes, wait=True):
+    """Read-modify-write several tables in one transaction.
+
+    Like update_blob() for [(contract_type, mutate), ...], but the
+    set*IfVersion calls go out as one multicall, so the tables change
+    together or not at all; a conflict on any of them re-applies every
+    change to fresh reads. Tables on contracts without multicall or version
+    counters fall back to one update_blob() per change.
+    Returns ([new blob per change], tx hash of the last transaction).
+    """
+    contracts = [load_contract(contract_type) for contract_type, mutate in changes]
+    contract, web3 = contracts[0]
+    batched = (all(other.address == contract.address and has_function(other, VERSIONED_WRITES[contract_type][1])
+                   for (contract_type, mutate), (other, _) in zip(changes, contracts))
+               and (len(changes) == 1 or has_function(contract, 'multicall')))
+    if not batched:
+        results = [update_blob(contract_type, mutate, wait=wait) for contract_type, mutate in changes]
+        return [updated for updated, tx_hash in results], results[-1][1]
+
+    cas_setter = '+'.join(VERSIONED_WRITES[contract_type][1] for contract_type, mutate in changes)
+    retries = chain_setting('CAS_RETRIES')
+    for attempt in range(retries + 1):
+        writes = []
+        for contract_type, mutate in changes:
+            getter, setter = VERSIONED_WRITES[contract_type][:2]
+            blob, version = getattr(contract.functions, getter)().call()
+            writes.append((setter, mutate(blob), version))
+        updated = [blob for setter, blob, version in writes]
+        version = ', '.join(str(version) for setter, blob, version in writes)
+        if len(writes) == 1:
+            setter, blob, expected = writes[0]
+            function_call = getattr(contract.functions, setter)(blob, expected)
+        else:
+            data = [Web3.to_bytes(hexstr=contract.encode_abi(setter, args=[blob, expected]))
+                    for setter, blob, expected in writes]
+            function_call = contract.functions.multicall(data)
+        try:
+            tx_hash = nonce_manager.send(web3, function_call)
+        except ContractLogicError as e:
+            if VERSION_CONFLICT not in str(e):
+                raise
+            logger.info(f"{cas_setter} conflict at version {version} (attempt {attempt + 1}/{retries + 1})")
+            continue
+        if not wait:
+            return updated, tx_hash
+        receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+        for contract_type, mutate in changes:
+            notify_write(contract_type)
+        if receipt['status'] == 1:
+            return updated, tx_hash
+        logger.info(f"{cas_setter} reverted at version {version} (attempt {attempt + 1}/{retries + 1})")
+    raise WriteConflict(f"{cas_setter} still conflicting after {retries} retries")
@@ -0,0 +1,331 @@
+import json, os, threading
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from web3 import Web3, HTTPProvider
+# Private web3 API (pinned web3==7.14.0, see Requirements.txt): the public `session=`
+# argument only caches a session for the constructing thread. ProviderSessionTests
+# fail if an upgrade changes the hooks the managers below override.
+from web3._utils.http_session_manager import HTTPSessionManager
+import logging
+from .rpcmetrics import instrument
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Configuration --------------------
+# Defaults for settings.BLOCKCHAIN; any key set there wins.
+CHAIN_DEFAULTS = {
+    'RPC_URL': 'http://127.0.0.1:9545',
+    'NETWORK_ID': '5777',
+    'BUILD_DIR': None,
+    'DEFAULT_ACCOUNT_INDEX': 0,
+    'RPC_TIMEOUT': 10,
+    'RPC_RETRIES': 3,
+    'RPC_POOL_CONNECTIONS': 4,
+    'RPC_POOL_MAXSIZE': 16,
+    'RPC_POOL_BLOCK': True,
+    'BLOB_CACHE_BACKEND': 'local',
+    'BLOB_CACHE_ALIAS': 'default',
+    'READ_FROM_PROJECTION': False,
+    'INDEXER_BATCH_BLOCKS': 500,
+    'INDEXER_CONFIRMATIONS': 0,
+    'INDEXER_POLL_INTERVAL': 2,
+    'TX_WORKERS': 4,
+    'TX_RECEIPT_TIMEOUT': 120,
+    'TX_STATUS_ALIAS': 'default',
+    'TX_STATUS_TTL': 3600,
+    'CAS_RETRIES': 5,
+    'BALANCE_TTL': 15,
+    'BALANCE_BATCH_WINDOW': 0.005,
+    'BALANCE_WATCH_INTERVAL': 2,
+    'TRANSFER_FOLLOW_INTERVAL': 5,
+    'DISTRIBUTION_CHUNK_SIZE': None,
+    'DISTRIBUTION_GAS_FRACTION': 0.5,
+    'DISTRIBUTION_MAX_CHUNK': 500,
+    'PUSH_POLL_INTERVAL': 1,
+    'RECORD_ENCODING': 'text',
+}
+
+# Contract type used by the views -> truffle artifact name
+CONTRACT_MAP = {
+    'signup': 'Carpool',
+    'ride': 'Carpool',
+    'passengers': 'Carpool',
+    'ratings': 'Carpool',
+    'token': 'CarpoolToken',
+    'v2': 'CarpoolV2'
+}
+
+def chain_setting(name):
+    """Return a blockchain setting from settings.BLOCKCHAIN or its default."""
+    return getattr(settings, 'BLOCKCHAIN', {}).get(name, CHAIN_DEFAULTS[name])
+
+# -------------------- Helpers --------------------
+
+def build_contract_path(name):
+    """Return absolute path to build/contracts/<name>.json (or BLOCKCHAIN['BUILD_DIR'])"""
+    root_build_dir = chain_setting('BUILD_DIR') or os.path.join(os.path.dirname(__file__), '../../build/contracts')
+    return os.path.join(os.path.abspath(root_build_dir), f"{name}.json")
+
+def deployed_address(contract_json):
+    """Return the deployed address from a truffle artifact, or None."""
+    networks = contract_json.get('networks', {})
+    deployed = networks.get(chain_setting('NETWORK_ID')) or (next(iter(networks.values())) if networks else None)
+    return deployed.get('address') if deployed else None
+
+# -------------------- Provider --------------------
+
+class SharedSessionManager(HTTPSessionManager):
+    """Session manager that hands every thread the same pooled session.
+
+    web3's default manager keeps one `requests.Session` per thread, so each
+    worker thread opens its own connections to the node. Sharing a single
+    session lets all threads draw from one bounded keep-alive pool.
+    """
+
+    def __init__(self, session):
+        super().__init__()
+        self._shared_session = session
+
+    def cache_and_return_session(self, endpoint_uri, session=None, request_timeout=None):
+        return self._shared_session
+
+def build_session():
+    """Return a requests.Session with a bounded keep-alive connection pool."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=chain_setting('RPC_POOL_CONNECTIONS'),
+        pool_maxsize=chain_setting('RPC_POOL_MAXSIZE'),
+        pool_block=chain_setting('RPC_POOL_BLOCK'),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def build_provider():
+    """Return an HTTPProvider for the configured node using the pooled session."""
+    provider = HTTPProvider(
+        chain_setting('RPC_URL'),
+        request_kwargs={'timeout': chain_setting('RPC_TIMEOUT')},
+    )
+    provider._request_session_manager = SharedSessionManager(build_session())
+    retries = chain_setting('RPC_RETRIES')
+    if not retries:
+        provider.exception_retry_configuration = None
+    else:
+        provider.exception_retry_configuration.retries = retries
+    return provider
+
+def connect_web3():
+    """Return a Web3 instance connected to the node and set default account."""
+    web3 = instrument(Web3(build_provider()))
+    if not web3.is_connected():
+        raise ConnectionError(f"Unable to connect to blockchain at {chain_setting('RPC_URL')}")
+    try:
+        web3.eth.default_account = web3.eth.accounts[chain_setting('DEFAULT_ACCOUNT_INDEX')]
+    except Exception as e:
+        logger.warning(f"Could not set default account: {e}")
+        web3.eth.default_account = None
+    return web3
+
+# -------------------- Contract Registry --------------------
+
+class ContractRegistry:
+    """Process-wide cache of the Web3 client and contract objects.
+
+    The client is connected once and shared by every request. Contracts are
+    keyed by contract type and rebuilt only when the artifact file under
+    build/contracts changes on disk (e.g. after `truffle migrate`).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._web3 = None
+        self._contracts = {}   # contract_type -> (mtime, contract)
+        self._artifacts = {}   # artifact name -> (mtime, abi, address)
+
+    def web3(self):
+        """Return the shared Web3 client, connecting on first use."""
+        web3 = self._web3
+        if web3 is None:
+            with self._lock:
+                if self._web3 is None:
+                    self._web3 = connect_web3()
+                web3 = self._web3
+        return web3
+
+    def artifact(self, name):
+        """Return (mtime, abi, address) for build/contracts/<name>.json"""
+        path = build_contract_path(name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Contract JSON not found: {path}")
+
+        cached = self._artifacts.get(name)
+        if cached and cached[0] == mtime:
+            return cached
+
+        with self._lock:
+            cached = self._artifacts.get(name)
+            if cached and cached[0] == mtime:
+                return cached
+            with open(path) as f:
+                contract_json = json.load(f)
+            address = deployed_address(contract_json)
+            if not address:
+                raise ValueError(f"Contract {name} has no deployed address in build JSON")
+            cached = (mtime, contract_json.get('abi'), address)
+            self._artifacts[name] = cached
+            logger.info(f"Loaded contract artifact {name} at {address}")
+            return cached
+
+    def contract(self, contract_type):
+        """Return (contract, web3) for a contract type, reusing cached objects."""
+        contract_name = CONTRACT_MAP.get(contract_type)
+        if not contract_name:
+            raise ValueError(f"Unknown contract type: {contract_type}")
+
+        mtime, abi, address = self.artifact(contract_name)
+        web3 = self.web3()
+        cached = self._contracts.get(contract_type)
+        if cached and cached[0] == mtime:
+            return cached[1], web3
+
+        with self._lock:
+            contract = web3.eth.contract(address=web3.to_checksum_address(address), abi=abi)
+            self._contracts[contract_type] = (mtime, contract)
+        return contract, web3
+
+    def attach(self, web3):
+        """Use `web3` as the shared client, e.g. an in-process test chain."""
+        with self._lock:
+            self._web3 = web3
+            self._contracts.clear()
+            self._artifacts.clear()
+
+    def reset(self):
+        """Drop the client and every cached contract."""
+        with self._lock:
+            self._web3 = None
+            self._contracts.clear()
+            self._artifacts.clear()
+
+registry = ContractRegistry()
+
+def get_web3():
+    """Return the shared Web3 instance."""
+    return registry.web3()
+
+def load_contract(contract_type):
+    """Return (contract, web3) for `contract_type` from the process-wide registry."""
+    return registry.contract(contract_type)
+
+# Callables run with the contract type after every write we send
+write_hooks = []
+
+def notify_write(contract_type):
+    """Run the registered write hooks for `contract_type`."""
+    for hook in write_hooks:
+        try:
+            hook(contract_type)
+        except Exception as e:
+            logger.warning(f"Write hook {hook} failed: {e}")
+
+# -------------------- Nonces & Batched Writes --------------------
+
+class NonceManager:
+    """Hands out consecutive nonces for the server account.
+
+    The first nonce comes from the node's pending transaction count, then
+    they are assigned locally. Sends happen under the lock so two requests
+    never get the same nonce and a failed send never leaves a gap; a
+    rejected nonce (e.g. another process used it) resyncs and retries once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = {}   # account -> next nonce
+
+    def send(self, web3, function_call):
+        """Transact `function_call` from the default account; return the tx hash."""
+        account = web3.eth.default_account
+        with self._lock:
+            for attempt in range(2):
+                nonce = self._next.get(account)
+                if nonce is None:
+                    nonce = web3.eth.get_transaction_count(account, 'pending')
+                try:
+                    tx_hash = function_call.transact({'from': account, 'nonce': nonce})
+                except Exception as e:
+                    self._next.pop(account, None)
+                    if attempt == 0 and 'nonce' in str(e).lower():
+                        logger.warning(f"Nonce {nonce} rejected for {account}, resyncing: {e}")
+                        continue
+                    raise
+                self._next[account] = nonce + 1
+                return tx_hash
+
+    def reset(self):
+        with self._lock:
+            self._next.clear()
+
+nonce_manager = NonceManager()
+
+def has_function(contract, name):
+    """True if the deployed ABI of `contract` has a function called `name`."""
+    return any(item.get('type') == 'function' and item.get('name') == name for item in contract.abi)
+
+def group_writes(calls):
+    """Fold [(contract_type, function_name, args), ...] into as few transactions as possible.
+
+    Consecutive calls on the same deployed contract become one multicall()
+    when its ABI has it; everything else is sent as is. Returns a list of
+    (contract_types, labels, function_call) in the original order.
+    """
+    groups = []
+    for contract_type, function_name, args in calls:
+        contract, web3 = load_contract(contract_type)
+        label = f'{contract_type}.{function_name}'
+        last = groups[-1] if groups else None
+        if last and last[0].address == contract.address and has_function(contract, 'multicall'):
+            last[1].append(contract_type)
+            last[2].append(label)
+            last[3].append((function_name, args))
+        else:
+            groups.append((contract, [contract_type], [label], [(function_name, args)]))
+
+    writes = []
+    for contract, contract_types, labels, functions in groups:
+        if len(functions) == 1:
+            function_name, args = functions[0]
+            function_call = getattr(contract.functions, function_name)(*args)
+        else:
+            data = [Web3.to_bytes(hexstr=contract.encode_abi(name, args=list(args))) for name, args in functions]
+            function_call = contract.functions.multicall(data)
+        writes.append((contract_types, labels, function_call))
+    return writes
+
+def send_writes(calls):
+    """Send grouped writes with consecutive nonces; return [(contract_types, labels, tx_hash)]."""
+    web3 = get_web3()
+    return [(contract_types, labels, nonce_manager.send(web3, function_call))
+            for contract_types, labels, function_call in group_writes(calls)]
+
+def transact_many(calls):
+    """Send several writes pipelined (and multicalled where possible); wait for every receipt."""
+    web3 = get_web3()
+    receipts = []
+    for contract_types, labels, tx_hash in send_writes(calls):
+        receipts.append(web3.eth.wait_for_transaction_receipt(tx_hash))
+        for contract_type in set(contract_types):
+            notify_write(contract_type)
+    return receipts
+
+def transact(contract_type, function_name, *args):
+    """Send a transaction calling `function_name(*args)` and wait for its receipt."""
+    return transact_many([(contract_type, function_name, args)])[0]
+
+def send_transaction(contract_type, function_name, data):
+    """Send a transaction calling `function_name` with a single string argument `data`."""
+    return transact(contract_type, function_name, data)
@@ -0,0 +1,345 @@
+import base64, re
+from datetime import date, timedelta
+from web3 import Web3
+
+# -------------------- Compact Row Codec --------------------
+# Compact form of one table row for the v1 string tables:
+#
+#   COMPACT_PREFIX + base64(binary part) + STRINGS_SEPARATOR + text part
+#
+# The binary part (urlsafe base64 without padding, so it never contains
+# '#' or '\n') holds the typed columns: fixed-point coordinates and
+# amounts, enum statuses, dates as day numbers, times as minutes,
+# addresses and tx hashes as raw bytes. Free-text columns are not worth
+# base64's 4/3 overhead, so only their lengths go in the binary part and
+# the strings themselves follow the separator verbatim.
+#
+# Binary layout (version 1):
+#   kind * 16 + version, field count * 2 + has extras, fallback bitmask
+#   one value per field; a field whose text would not survive its typed
+#   encoding unchanged is stored as a string and flagged in the bitmask
+#   if has extras: count of extra legacy columns, then one string each
+# Varints are LEB128; a string is varint (length + 1), 0 meaning None.
+#
+# Legacy '#' rows and compact rows can share a blob; records.parse_record()
+# tells them apart by the prefix.
+
+COMPACT_PREFIX = '~'
+STRINGS_SEPARATOR = ':'
+CODEC_VERSION = 1
+
+STATUSES = ['waiting', 'completed', 'paid', 'cancelled', 'accepted', 'verified']
+RECURRENCES = ['none', 'daily', 'weekly', 'weekdays', 'weekends', 'monthly']
+USER_TYPES = ['Passenger', 'Driver']
+DATE_EPOCH = date(2000, 1, 1)
+
+_DECIMAL = re.compile(r'-?\d+(\.\d{1,7})?$')
+_HEX20 = re.compile(r'0x[0-9a-fA-F]{40}$')
+_HEX32 = re.compile(r'0x[0-9a-f]{64}$')
+
+class CodecError(ValueError):
+    """Raised for rows that are not valid compact encodings."""
+
+# -------------------- Primitives --------------------
+
+class _Writer:
+    def __init__(self):
+        self.data = bytearray()
+        self.strings = []
+
+    def varint(self, n):
+        while n > 0x7f:
+            self.data.append((n & 0x7f) | 0x80)
+            n >>= 7
+        self.data.append(n)
+
+    def string(self, value):
+        if value is None:
+            self.data.append(0)
+        else:
+            self.varint(len(value) + 1)
+            self.strings.append(value)
+
+class _Reader:
+    def __init__(self, data, strings):
+        self.data = data
+        self.pos = 0
+        self.strings = strings
+        self.string_pos = 0
+
+    def byte(self):
+        if self.pos >= len(self.data):
+            raise CodecError("truncated row")
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def bytes(self, size):
+        end = self.pos + size
+        if end > len(self.data):
+            raise CodecError("truncated row")
+        chunk, self.pos = self.data[self.pos:end], end
+        return chunk
+
+    def varint(self):
+        n = shift = 0
+        while True:
+            byte = self.byte()
+            n |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return n
+            shift += 7
+
+    def string(self):
+        length = self.varint()
+        if length == 0:
+            return None
+        end = self.string_pos + length - 1
+        if end > len(self.strings):
+            raise CodecError("truncated strings")
+        value, self.string_pos = self.strings[self.string_pos:end], end
+        return value
+
+def _zigzag(n):
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+def _unzigzag(n):
+    return n // 2 if not n & 1 else -(n + 1) // 2
+
+def _checksum(lower_hex):
+    return Web3.to_checksum_address('0x' + lower_hex)[2:]
+
+# -------------------- Field Types --------------------
+# pack(writer, text) returns False, writing nothing, when `text` cannot be
+# represented exactly; the row then stores it as a string instead.
+# unpack(reader) returns the text.
+
+class Str:
+    @staticmethod
+    def pack(w, text):
+        w.string(text)
+        return True
+
+    @staticmethod
+    def unpack(r):
+        return r.string()
+
+class Int:
+    """Non-negative decimal integer without leading zeros, e.g. ids and seats."""
+
+    @staticmethod
+    def pack(w, text):
+        if not (text.isascii() and text.isdigit()) or str(int(text)) != text:
+            return False
+        w.varint(int(text))
+        return True
+
+    @staticmethod
+    def unpack(r):
+        return str(r.varint())
+
+class Decimal:
+    """Fixed-point decimal as zigzag(mantissa) * 8 + decimals, so '40.712776'
+    is 40712776 at scale 10**6 and comes back with the same digits."""
+
+    @staticmethod
+    def pack(w, text):
+        if not (text.isascii() and _DECIMAL.match(text)):
+            return False
+        negative = text.startswith('-')
+        whole, _, frac = text.lstrip('-').partition('.')
+        if str(int(whole)) != whole or (negative and not (whole + frac).strip('0')):
+            return False
+        mantissa = int(whole + frac) * (-1 if negative else 1)
+        w.varint(_zigzag(mantissa) * 8 + len(frac))
+        return True
+
+    @staticmethod
+    def unpack(r):
+        n = r.varint()
+        mantissa, decimals = _unzigzag(n >> 3), n & 7
+        digits = str(abs(mantissa)).rjust(decimals + 1, '0')
+        text = digits[:len(digits) - decimals] + ('.' + digits[-decimals:] if decimals else '')
+        return ('-' if mantissa < 0 else '') + text
+
+class Enum:
+    def __init__(self, values):
+        self.values = values
+
+    def pack(self, w, text):
+        if text not in self.values:
+            return False
+        w.data.append(self.values.index(text))
+        return True
+
+    def unpack(self, r):
+        index = r.byte()
+        if index >= len(self.values):
+            raise CodecError(f"enum value {index} out of range")
+        return self.values[index]
+
+class Date:
+    """'YYYY-MM-DD' as days since 2000-01-01."""
+
+    @staticmethod
+    def pack(w, text):
+        try:
+            day = date.fromisoformat(text)
+        except ValueError:
+            return False
+        if day < DATE_EPOCH or day.isoformat() != text:
+            return False
+        w.varint((day - DATE_EPOCH).days)
+        return True
+
+    @staticmethod
+    def unpack(r):
+        return (DATE_EPOCH + timedelta(days=r.varint())).isoformat()
+
+class Time:
+    """'HH:MM' as minutes after midnight."""
+
+    @staticmethod
+    def pack(w, text):
+        if len(text) != 5 or text[2] != ':' or not (text.isascii() and (text[:2] + text[3:]).isdigit()):
+            return False
+        hours, minutes = int(text[:2]), int(text[3:])
+        if hours > 23 or minutes > 59:
+            return False
+        w.varint(hours * 60 + minutes)
+        return True
+
+    @staticmethod
+    def unpack(r):
+        n = r.varint()
+        return f"{n // 60:02d}:{n % 60:02d}"
+
+class Hex:
+    """0x-prefixed hex of a fixed byte length. With `checksum`, a flag byte
+    keeps the case: 0 lowercase, 1 uppercase, 2 EIP-55 checksum; without
+    it only lowercase hex is packed."""
+
+    def __init__(self, size, pattern, checksum=False):
+        self.size = size
+        self.pattern = pattern
+        self.checksum = checksum
+
+    def pack(self, w, text):
+        if not self.pattern.match(text):
+            return False
+        body = text[2:]
+        if body == body.lower():
+            case = 0
+        elif self.checksum and body == body.upper():
+            case = 1
+        elif self.checksum and _checksum(body.lower()) == body:
+            case = 2
+        else:
+            return False
+        if self.checksum:
+            w.data.append(case)
+        w.data += bytes.fromhex(body)
+        return True
+
+    def unpack(self, r):
+        case = r.byte() if self.checksum else 0
+        body = r.bytes(self.size).hex()
+        if case == 1:
+            body = body.upper()
+        elif case == 2:
+            body = _checksum(body)
+        elif case:
+            raise CodecError(f"bad hex case flag {case}")
+        return '0x' + body
+
+# -------------------- Record Schemas --------------------
+# Field types per record, in the column order of the records NamedTuples.
+# Kind numbers are part of the format: never renumber, only append.
+
+ADDRESS = Hex(20, _HEX20, checksum=True)
+TX_HASH = Hex(32, _HEX32)
+
+SCHEMAS = {
+    'User': (1, [Str, Str, Str, Str, Str, Enum(USER_TYPES), ADDRESS]),
+    'Ride': (2, [Int, Str, Str, Decimal, Decimal, Int, Date, Enum(STATUSES), Time, Enum(RECURRENCES)]),
+    'PassengerRequest': (3, [Str, Int, Str, Str, Decimal, Decimal, TX_HASH, Int, Enum(STATUSES)]),
+    'Rating': (4, [Str, Str, Int]),
+}
+KINDS = {kind: name for name, (kind, fields) in SCHEMAS.items()}
+
+def is_compact(row):
+    """Return True if `row` is a compact encoding rather than a '#' row."""
+    return row.startswith(COMPACT_PREFIX)
+
+def _trim(values):
+    values = list(values)
+    while values and values[-1] is None:
+        values.pop()
+    return values
+
+def encode_row(record_type, values, extras=()):
+    """Return the compact row for column values (None for missing trailing columns)."""
+    kind, fields = SCHEMAS[record_type.__name__]
+    values = _trim(values)
+    if len(values) > len(fields):
+        raise CodecError(f"{len(values)} values for a {record_type.__name__} row")
+    w = _Writer()
+    w.data += bytes([kind * 16 + CODEC_VERSION, len(values) * 2 + bool(extras)])
+    body = _Writer()
+    fallback = 0
+    for i, (field, value) in enumerate(zip(fields, values)):
+        if value is None or not field.pack(body, value):
+            fallback |= 1 << i
+            body.string(value)
+    w.varint(fallback)
+    w.data += body.data
+    w.strings = body.strings
+    if extras:
+        w.varint(len(extras))
+        for extra in extras:
+            w.string(extra)
+    packed = base64.urlsafe_b64encode(bytes(w.data)).decode('ascii').rstrip('=')
+    return COMPACT_PREFIX + packed + STRINGS_SEPARATOR + ''.join(w.strings)
+
+def decode_row(row):
+    """Decode a compact row into (record type name, values, extras)."""
+    packed, separator, strings = row[len(COMPACT_PREFIX):].rstrip('\r\n').partition(STRINGS_SEPARATOR)
+    if not separator:
+        raise CodecError("compact row without a strings part")
+    try:
+        data = base64.urlsafe_b64decode(packed + '=' * (-len(packed) % 4))
+    except ValueError as e:
+        raise CodecError(f"bad compact row: {e}")
+    r = _Reader(data, strings)
+    header = r.byte()
+    if header % 16 != CODEC_VERSION:
+        raise CodecError(f"unsupported compact row version {header % 16}")
+    name = KINDS.get(header // 16)
+    if name is None:
+        raise CodecError(f"unknown record kind {header // 16}")
+    fields = SCHEMAS[name][1]
+    counts = r.byte()
+    count, has_extras = counts // 2, counts & 1
+    if count > len(fields):
+        raise CodecError(f"{count} fields for a {name} row")
+    fallback = r.varint()
+    values = [(Str if fallback & (1 << i) else fields[i]).unpack(r) for i in range(count)]
+    extras = [r.string() for _ in range(r.varint())] if has_extras else []
+    return name, values, extras
+
+def encode_smallest(record_type, values, extras=()):
+    """Return whichever of the '#' and compact rows is shorter in UTF-8.
+
+    Rows of only free text (most ratings) pay more for the compact header
+    than they save, so they stay '#'-delimited. Rows the '#' form cannot
+    represent (a '#' inside a value, a leading COMPACT_PREFIX, a None
+    between values) are always compact.
+    """
+    values = _trim(values)
+    parts = values + list(extras)
+    compact = encode_row(record_type, values, extras)
+    if None in parts or any('#' in part for part in parts):
+        return compact
+    text = '#'.join(parts)
+    if is_compact(text) or len(compact.encode('utf-8')) < len(text.encode('utf-8')):
+        return compact
+    return text
@@ -0,0 +1,108 @@
+from django.contrib.auth.hashers import check_password, make_password
+from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+import logging
+from .models import Credential
+from .records import load_table
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Credential Index --------------------
+
+class CredentialIndex:
+    """Username -> salted password hash, user type and wallet, for logins.
+
+    Passwords are hashed with Django's configured PASSWORD_HASHERS, so a
+    login is one indexed query plus one hash verify however many users are
+    registered. Signup adds its user straight away and the chain indexer
+    adds users registered elsewhere as new rows appear. A username the index
+    has not seen yet is looked up on the chain once and then added.
+    """
+
+    def authenticate(self, username, password):
+        """Return the Credential for `username` if `password` matches, else None."""
+        if not username or password is None:
+            return None
+        credential = Credential.objects.filter(username=username).first()
+        if credential is None:
+            credential = self._index_from_chain(username, password)
+            if credential is None:
+                # Hash anyway so an unknown username costs as much as a wrong password
+                make_password(password)
+                return None
+            return credential
+
+        def upgrade(raw_password):
+            # Called by check_password when the hasher or its work factor changed
+            credential.password_hash = make_password(raw_password)
+            credential.save(update_fields=['password_hash', 'updated_at'])
+        return credential if check_password(password, credential.password_hash, setter=upgrade) else None
+
+    def exists(self, username):
+        """Return True if `username` is registered.
+
+        Misses are checked against the chain itself rather than the
+        projection, which may lag behind a signup on another server.
+        """
+        if Credential.objects.filter(username=username).exists():
+            return True
+        return load_table('signup').first('username', username) is not None
+
+    def add(self, user):
+        """Index a User record, unless its username is already indexed.
+
+        The first row registered under a username keeps it, as in the
+        users table.
+        """
+        if not user.username or user.password is None:
+            return None
+        credential, created = Credential.objects.get_or_create(username=user.username, defaults={
+            'password_hash': make_password(user.password),
+            'user_type': user.user_type,
+            'wallet': user.wallet,
+        })
+        return credential
+
+    def add_many(self, users):
+        """Index User records; return how many credentials were added or changed.
+
+        New usernames are added, and indexed ones are re-hashed when the
+        record's password no longer matches (changed on chain).
+        """
+        candidates = {}
+        for user in users:
+            if user.username and user.password is not None:
+                candidates.setdefault(user.username, user)
+        known = {c.username: c for c in Credential.objects.filter(username__in=list(candidates))}
+        rows = [Credential(username=u.username, password_hash=make_password(u.password),
+                           user_type=u.user_type, wallet=u.wallet)
+                for name, u in candidates.items() if name not in known]
+        changed = []
+        for name, credential in known.items():
+            user = candidates[name]
+            if not check_password(user.password, credential.password_hash):
+                credential.password_hash = make_password(user.password)
+                credential.user_type, credential.wallet = user.user_type, user.wallet
+                credential.updated_at = timezone.now()
+                changed.append(credential)
+        try:
+            Credential.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+            Credential.objects.bulk_update(changed, ['password_hash', 'user_type', 'wallet', 'updated_at'],
+                                           batch_size=500)
+        except IntegrityError as e:
+            logger.warning("Indexing credentials failed: %s", e)
+            return 0
+        if rows or changed:
+            logger.info("Indexed credentials for %d users, re-hashed %d", len(rows), len(changed))
+        return len(rows) + len(changed)
+
+    def _index_from_chain(self, username, password):
+        # Users registered before the index existed and not synced yet; read
+        # from the chain, as the projection does not keep passwords
+        for user in load_table('signup').lookup('username', username):
+            if user.password is not None and constant_time_compare(user.password, password):
+                return self.add(user)
+        return None
+
+credential_index = CredentialIndex()
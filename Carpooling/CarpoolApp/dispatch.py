@@ -0,0 +1,227 @@
+import heapq
+from collections import Counter
+from typing import NamedTuple
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+import logging
+from .blobcache import update_blob
+from .matching import ride_matcher
+from .models import DispatchRequest
+from .records import PassengerRequest, PassengerTable, load_table, record_to_row
+from .spatial import search_radius_miles
+
+logger = logging.getLogger(__name__)
+
+# Passenger request statuses that hold a seat on their ride
+SEAT_HOLDING_STATUSES = ('waiting', 'accepted')
+DISPATCH_MODES = ('greedy', 'optimal')
+
+class RideFull(Exception):
+    """The ride has no free seats left."""
+
+def ride_seats(ride):
+    """Return the seat count of a ride, None (no limit) when it is missing or garbled.
+
+    Rides were never limited before seat checks, so a row without a usable
+    count keeps taking passengers rather than reporting itself full.
+    """
+    try:
+        return max(int(float(ride.seats)), 0)
+    except (TypeError, ValueError):
+        return None
+
+def seats_left(seats, taken):
+    """Return the free seats for a ride_seats() count, infinite when it is None."""
+    return float('inf') if seats is None else seats - taken
+
+def seats_taken(passengers):
+    """Return {ride_id: seats held} for a passenger table."""
+    return Counter(req.ride_id for status in SEAT_HOLDING_STATUSES for req in passengers.lookup('status', status))
+
+def free_seats(rides, passengers):
+    """Return {ride_id: (ride, free seats)} for waiting rides with room left."""
+    taken = seats_taken(passengers)
+    free = {}
+    for ride in rides.lookup('status', 'waiting'):
+        if ride.ride_id not in free:
+            free[ride.ride_id] = (ride, seats_left(ride_seats(ride), taken[ride.ride_id]))
+    return {ride_id: entry for ride_id, entry in free.items() if entry[1] > 0}
+
+# -------------------- Assignment --------------------
+
+def greedy_assignment(edges, capacity):
+    """Take (miles, passenger, ride_id) edges shortest first while seats last.
+
+    Returns {passenger: (ride_id, miles)}. Fast, but can strand a passenger
+    whose only ride was taken by someone who had alternatives.
+    """
+    left = dict(capacity)
+    assigned = {}
+    for miles, passenger, ride_id in sorted(edges):
+        if passenger not in assigned and left.get(ride_id, 0) > 0:
+            assigned[passenger] = (ride_id, miles)
+            left[ride_id] -= 1
+    return assigned
+
+def min_cost_assignment(edges, capacity):
+    """Seat as many passengers as possible, then minimize the total pickup miles.
+
+    Min-cost flow (source -> passenger -> ride -> sink, ride capacity =
+    free seats) solved by successive shortest paths with Dijkstra and node
+    potentials. Returns {passenger: (ride_id, miles)}.
+    """
+    passengers = sorted({p for _, p, _ in edges})
+    rides = sorted({r for _, _, r in edges if capacity.get(r, 0) > 0})
+    p_node = {p: 1 + i for i, p in enumerate(passengers)}
+    r_node = {r: 1 + len(passengers) + i for i, r in enumerate(rides)}
+    source, sink = 0, len(passengers) + len(rides) + 1
+    graph = [[] for _ in range(sink + 1)]   # node -> [[to, cap, cost, reverse edge index]]
+
+    def add_edge(a, b, cap, cost):
+        graph[a].append([b, cap, cost, len(graph[b])])
+        graph[b].append([a, 0, -cost, len(graph[a]) - 1])
+
+    for p in passengers:
+        add_edge(source, p_node[p], 1, 0.0)
+    for miles, p, r in edges:
+        if r in r_node:
+            add_edge(p_node[p], r_node[r], 1, float(miles))
+    for r in rides:
+        add_edge(r_node[r], sink, capacity[r], 0.0)
+
+    potential = [0.0] * len(graph)
+    for _ in passengers:
+        dist = [float('inf')] * len(graph)
+        prev = [None] * len(graph)   # node -> (from node, edge index)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > dist[node]:
+                continue
+            for i, (to, cap, cost, _) in enumerate(graph[node]):
+                nd = d + cost + potential[node] - potential[to]
+                if cap > 0 and nd < dist[to] - 1e-12:
+                    dist[to] = nd
+                    prev[to] = (node, i)
+                    heapq.heappush(heap, (nd, to))
+        if prev[sink] is None:
+            break
+        for node, d in enumerate(dist):
+            if d < float('inf'):
+                potential[node] += d
+        node = sink
+        while node != source:
+            frm, i = prev[node]
+            edge = graph[frm][i]
+            edge[1] -= 1
+            graph[node][edge[3]][1] += 1
+            node = frm
+
+    ride_of_node = {n: r for r, n in r_node.items()}
+    assigned = {}
+    for p in passengers:
+        for to, cap, cost, _ in graph[p_node[p]]:
+            if to in ride_of_node and cap == 0 and cost >= 0:
+                assigned[p] = (ride_of_node[to], cost)
+    return assigned
+
+class Assignment(NamedTuple):
+    request: DispatchRequest
+    ride_id: str
+    driver: str
+    miles: float
+
+# -------------------- Dispatcher --------------------
+
+class Dispatcher:
+    """Assigns every open DispatchRequest to a waiting ride with free seats in one go.
+
+    Candidate rides within the search radius of each pickup point come from
+    one batched ride_matcher pass. `greedy` seats passengers shortest pickup
+    first; `optimal` solves the seat-constrained min-cost assignment. The
+    resulting passenger requests are appended with a single versioned write
+    that re-checks the seats against the latest table, so a seat taken by a
+    concurrent ShareLocationAction is never double-booked; requests that
+    lose their seat that way stay open for the next run. The open requests
+    are re-read under select_for_update() for that write, so one cancelled
+    during the run is never seated.
+    """
+
+    def __init__(self, mode=None, radius_miles=None):
+        self.mode = mode or getattr(settings, 'DISPATCH_MODE', 'greedy')
+        if self.mode not in DISPATCH_MODES:
+            raise ValueError(f"Unknown dispatch mode: {self.mode}")
+        self.radius_miles = radius_miles if radius_miles is not None else search_radius_miles()
+
+    def plan(self, requests, rides=None, passengers=None):
+        """Return [Assignment] for the given open requests, without writing anything."""
+        rides = rides if rides is not None else load_table('ride')
+        passengers = passengers if passengers is not None else load_table('passengers')
+        free = free_seats(rides, passengers)
+        if not requests or not free:
+            return []
+
+        candidates = ride_matcher.nearest_many([(r.lat, r.long) for r in requests],
+                                               radius_miles=self.radius_miles, exact=False, table=rides)
+        edges = [(miles, i, ride.ride_id)
+                 for i, (request, matches) in enumerate(zip(requests, candidates))
+                 for miles, ride in matches
+                 if ride.ride_id in free and ride.driver != request.passenger]
+        capacity = {ride_id: seats for ride_id, (ride, seats) in free.items()}
+        solve = min_cost_assignment if self.mode == 'optimal' else greedy_assignment
+        assigned = solve(edges, capacity)
+        return [Assignment(requests[i], ride_id, free[ride_id][0].driver, miles)
+                for i, (ride_id, miles) in sorted(assigned.items())]
+
+    def run(self, dry_run=False):
+        """Plan and write the assignments; return the ones that were written."""
+        requests = list(DispatchRequest.objects.filter(status='open'))
+        plan = self.plan(requests)
+        if dry_run or not plan:
+            return plan
+
+        written = []
+        def append_assignments(current):
+            # Recomputed on every compare-and-set retry against the latest rows
+            written.clear()
+            # Locked until the statuses below are saved, so a request cannot be
+            # cancelled between this check and its row being written on chain
+            still_open = set(DispatchRequest.objects.select_for_update()
+                             .filter(pk__in=[a.request.pk for a in plan], status='open')
+                             .values_list('pk', flat=True))
+            table = PassengerTable(current)
+            taken = seats_taken(table)
+            seats = {ride.ride_id: ride_seats(ride) for ride in load_table('ride').lookup('status', 'waiting')}
+            rows = []
+            for assignment in plan:
+                if assignment.request.pk not in still_open:
+                    continue
+                # Rides that stopped waiting since the plan have no seats
+                if seats_left(seats.get(assignment.ride_id, 0), taken[assignment.ride_id]) <= 0:
+                    continue
+                taken[assignment.ride_id] += 1
+                passenger_id = str(len(table) + len(rows) + 1)
+                rows.append(record_to_row(PassengerRequest(
+                    passenger_id, assignment.ride_id, assignment.driver, assignment.request.passenger,
+                    '0', '0', '0', '0', 'waiting')) + '\n')
+                written.append((assignment, passenger_id))
+            if current and current.strip() and not current.endswith('\n'):
+                current += '\n'
+            return current + ''.join(rows)
+
+        now = timezone.now()
+        with transaction.atomic():
+            update_blob('passengers', append_assignments)
+            for assignment, passenger_id in written:
+                updated = DispatchRequest.objects.filter(pk=assignment.request.pk, status='open').update(
+                    status='assigned', ride_id=assignment.ride_id, driver=assignment.driver,
+                    passenger_id=passenger_id, miles=round(assignment.miles, 3), assigned_at=now)
+                if not updated:
+                    logger.warning("Dispatch request %s closed while seating it on ride %s (passenger id %s)",
+                                   assignment.request.pk, assignment.ride_id, passenger_id)
+        total = sum(assignment.miles for assignment, passenger_id in written)
+        logger.info("Dispatched %d of %d open requests (%s, %.2f pickup miles)",
+                    len(written), len(requests), self.mode, total)
+        return [assignment for assignment, passenger_id in written]
@@ -0,0 +1,211 @@
+import hashlib, json, threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from django.db import close_old_connections, transaction
+from web3 import Web3
+from web3.exceptions import TimeExhausted
+import logging
+from .balances import balance_service
+from .chain import chain_setting, has_function, load_contract, nonce_manager
+from .models import DistributionChunk
+from .wallets import wallet_registry
+
+logger = logging.getLogger(__name__)
+
+# Distribution mode -> CarpoolToken function
+MODES = {'transfer': 'batchTransfer', 'mint': 'batchMint'}
+# Entries sent in the gas estimate that sizes the chunks
+ESTIMATE_SAMPLE = 50
+
+def parse_entries(entries, default_amount=None):
+    """Turn [(wallet or username, CPT amount), ...] into [(checksum address, wei)].
+
+    Usernames are resolved through the wallet registry. Raises ValueError
+    naming the first entry that has no usable wallet or amount.
+    """
+    parsed = []
+    for n, entry in enumerate(entries, start=1):
+        who, amount = (entry[0], entry[1] if len(entry) > 1 and entry[1] not in (None, '') else default_amount)
+        who = str(who).strip()
+        address = who if Web3.is_address(who) else wallet_registry.get(who)
+        if not address or not Web3.is_address(address):
+            raise ValueError(f"Entry {n}: no wallet for {who!r}")
+        try:
+            wei = Web3.to_wei(Decimal(str(amount).strip()), 'ether')
+        except (InvalidOperation, ValueError, TypeError):
+            raise ValueError(f"Entry {n}: bad amount {amount!r}")
+        if wei <= 0:
+            raise ValueError(f"Entry {n}: amount must be positive")
+        parsed.append((Web3.to_checksum_address(address), wei))
+    return parsed
+
+def entries_digest(mode, entries):
+    """Return a digest of a job's mode and [(address, wei)] entries, in order."""
+    payload = json.dumps([mode, [[address, str(wei)] for address, wei in entries]])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def batch_id(job, index):
+    """Return the on-chain batch id of a chunk; the same job and index always give the same id."""
+    return Web3.to_hex(Web3.solidity_keccak(['string', 'uint256'], [job, index]))
+
+# -------------------- Token Distributor --------------------
+
+class TokenDistributor:
+    """Sends CPT to thousands of wallets with a few batchTransfer/batchMint calls.
+
+    plan() splits the entries into chunks sized from a gas estimate to use
+    at most BLOCKCHAIN['DISTRIBUTION_GAS_FRACTION'] of the block gas limit
+    and stores them as DistributionChunk rows. run() sends the chunks that
+    are not mined yet, one transaction each. Every chunk carries a batch id
+    that CarpoolToken accepts only once per sender, so re-running a job
+    after a crash or timeout resumes it without paying anyone twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._running = set()
+
+    def _function(self, mode):
+        if mode not in MODES:
+            raise ValueError(f"Unknown distribution mode: {mode}")
+        contract, web3 = load_contract('token')
+        if not has_function(contract, MODES[mode]):
+            raise ValueError(f"Deployed CarpoolToken has no {MODES[mode]}(); redeploy it (npm run migrate)")
+        return contract, web3, getattr(contract.functions, MODES[mode])
+
+    def chunk_size(self, mode, entries):
+        """Return how many entries fit in one transaction."""
+        configured = chain_setting('DISTRIBUTION_CHUNK_SIZE')
+        if configured:
+            return configured
+        contract, web3, function = self._function(mode)
+        sample = entries[:ESTIMATE_SAMPLE]
+        gas = function(batch_id('estimate', 0), [a for a, w in sample], [w for a, w in sample]).estimate_gas(
+            {'from': web3.eth.default_account})
+        budget = web3.eth.get_block('latest')['gasLimit'] * chain_setting('DISTRIBUTION_GAS_FRACTION')
+        return max(1, min(chain_setting('DISTRIBUTION_MAX_CHUNK'), int(budget * len(sample) // gas)))
+
+    def plan(self, job, entries, mode='transfer', chunk_size=None):
+        """Store the chunks of a new job; return its chunks.
+
+        A job that already exists is returned as stored, so planning the
+        same job again is how a caller resumes it.
+        """
+        existing = list(DistributionChunk.objects.filter(job=job).order_by('index'))
+        if existing:
+            stored = [(a, int(w)) for chunk in existing for a, w in json.loads(chunk.entries)]
+            if entries_digest(existing[0].mode, stored) != entries_digest(mode, entries):
+                raise ValueError(f"Job {job} already exists with different entries")
+            return existing
+        if not entries:
+            return []
+        size = chunk_size or self.chunk_size(mode, entries)
+        # Logs of the job's batches can only appear after this block
+        contract, web3, function = self._function(mode)
+        start_block = web3.eth.block_number
+        chunks = [DistributionChunk(job=job, index=i, mode=mode, batch_id=batch_id(job, i), start_block=start_block,
+                                    entries=json.dumps([[a, str(w)] for a, w in entries[start:start + size]]))
+                  for i, start in enumerate(range(0, len(entries), size))]
+        with transaction.atomic():
+            DistributionChunk.objects.bulk_create(chunks)
+        logger.info("Planned distribution %s: %d entries in %d chunks of up to %d", job, len(entries), len(chunks), size)
+        return chunks
+
+    def run(self, job, progress=None):
+        """Send every chunk of `job` that is not mined yet, in order; return status().
+
+        `progress(chunk, status)` is called after each chunk. Stops at the
+        first chunk that failed or is still pending; running the job again
+        retries it.
+        """
+        with self._lock:
+            if job in self._running:
+                raise ValueError(f"Job {job} is already running")
+            self._running.add(job)
+        try:
+            for chunk in DistributionChunk.objects.filter(job=job).exclude(status='mined').order_by('index'):
+                self._send(chunk)
+                if progress:
+                    progress(chunk, self.status(job))
+                if chunk.status != 'mined':
+                    break
+        finally:
+            with self._lock:
+                self._running.discard(job)
+        return self.status(job)
+
+    def _distributed(self, contract, account, chunk, amounts):
+        """True if `account` already distributed this chunk.
+
+        batchDone only says the id was used; the chunk counts as paid when
+        the account's BatchDistributed event for the id also carries the
+        chunk's recipient count and total.
+        """
+        if not contract.functions.batchDone(account, chunk.batch_id).call():
+            return False
+        logs = contract.events.BatchDistributed().get_logs(
+            from_block=chunk.start_block, argument_filters={'sender': account, 'batchId': chunk.batch_id})
+        if any(log['args']['count'] == len(amounts) and log['args']['total'] == sum(amounts) for log in logs):
+            return True
+        raise ValueError(f"Batch id {chunk.batch_id} was already used for different entries")
+
+    def _send(self, chunk):
+        contract, web3, function = self._function(chunk.mode)
+        account = web3.eth.default_account
+        entries = json.loads(chunk.entries)
+        addresses, amounts = [a for a, w in entries], [int(w) for a, w in entries]
+        try:
+            if not self._distributed(contract, account, chunk, amounts):
+                if chunk.status != 'sent' or not chunk.tx_hash:
+                    tx_hash = nonce_manager.send(web3, function(chunk.batch_id, addresses, amounts))
+                    chunk.status, chunk.tx_hash, chunk.error = 'sent', Web3.to_hex(tx_hash), None
+                    chunk.save()
+                # A chunk left 'sent' by an earlier run may still be in the mempool
+                receipt = web3.eth.wait_for_transaction_receipt(chunk.tx_hash, timeout=chain_setting('TX_RECEIPT_TIMEOUT'))
+                if receipt['status'] != 1 and not self._distributed(contract, account, chunk, amounts):
+                    raise ValueError(f"Transaction {chunk.tx_hash} reverted")
+            chunk.status, chunk.error = 'mined', None
+        except TimeExhausted as e:
+            # Still pending: stay 'sent' so the next run waits for the same transaction
+            chunk.error = str(e)
+        except Exception as e:
+            logger.error("Distribution %s chunk %d failed: %s", chunk.job, chunk.index, e)
+            chunk.status, chunk.error = 'failed', str(e)
+        chunk.save()
+        if chunk.status == 'mined':
+            balance_service.invalidate(web3.eth.default_account, *addresses)
+
+    def status(self, job):
+        """Return chunk and recipient counts per status for a job."""
+        summary = {'job': job, 'chunks': 0, 'recipients': 0, 'mined_chunks': 0, 'mined_recipients': 0,
+                   'failed_chunks': 0, 'running': job in self._running}
+        for status, entries, error in DistributionChunk.objects.filter(job=job).values_list('status', 'entries', 'error'):
+            count = len(json.loads(entries))
+            summary['chunks'] += 1
+            summary['recipients'] += count
+            if status == 'mined':
+                summary['mined_chunks'] += 1
+                summary['mined_recipients'] += count
+            elif status == 'failed':
+                summary['failed_chunks'] += 1
+                summary['error'] = error
+        return summary
+
+    def run_in_background(self, job):
+        """Run a job on the distributor's worker thread."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='token-distribution')
+        def run():
+            close_old_connections()
+            try:
+                self.run(job)
+            except Exception as e:
+                logger.error("Distribution %s stopped: %s", job, e)
+            finally:
+                close_old_connections()
+        self._executor.submit(run)
+
+token_distributor = TokenDistributor()
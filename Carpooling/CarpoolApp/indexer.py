@@ -0,0 +1,237 @@
+import hashlib, time
+from django.db import transaction
+from web3 import Web3
+import logging
+from .chain import chain_setting, get_web3, load_contract
+from .blobcache import BLOB_GETTERS
+from .credentials import credential_index
+from .payments import ingest_transfers, payment_settler
+from .records import TABLE_TYPES, user_from_v2, ride_from_v2, request_from_v2
+from .models import ChainUser, ChainRide, ChainPassengerRequest, ChainRating, SyncCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# Contract type -> projection model for the v1 string tables
+PROJECTION_MODELS = {
+    'signup': ChainUser,
+    'ride': ChainRide,
+    'passengers': ChainPassengerRequest,
+    'ratings': ChainRating,
+}
+
+CHECKPOINT = 'chain'
+
+def marker_column(model):
+    """Return the column telling whether a projected row changed.
+
+    Models keep the raw row, except ChainUser: user rows hold passwords, so
+    it stores their SHA-256 digest instead.
+    """
+    return 'digest' if model is ChainUser else 'raw'
+
+def row_marker(model, record):
+    """Return the marker_column() value for a parsed record."""
+    if model is ChainUser:
+        return hashlib.sha256(record.raw.encode('utf-8')).hexdigest() if record.raw is not None else None
+    return record.raw
+
+def projected_fields(model, record_type):
+    """Return the model columns written for a record type, marker column last."""
+    names = {field.name for field in model._meta.concrete_fields}
+    return [name for name in record_type._fields if name in names and name != 'raw'] + [marker_column(model)]
+
+def record_fields(model, record):
+    """Return a projection model's field values for a parsed record.
+
+    Record fields the model does not have (the user password) are left out.
+    """
+    values = {name: getattr(record, name) for name in projected_fields(model, type(record))[:-1]}
+    values[marker_column(model)] = row_marker(model, record)
+    return values
+
+# -------------------- Chain Indexer --------------------
+
+class ChainIndexer:
+    """Follows new blocks and applies them to the local projection tables.
+
+    Each step handles a bounded block range in one DB transaction:
+    CarpoolToken Transfer logs, CarpoolV2 events (when deployed) and the v1
+    string tables, which have no events and are re-projected only when
+    their digest changes. The last applied block is stored in
+    SyncCheckpoint so a restart resumes where it left off.
+    """
+
+    def __init__(self, batch_blocks=None, confirmations=None):
+        self.batch_blocks = batch_blocks or chain_setting('INDEXER_BATCH_BLOCKS')
+        self.confirmations = chain_setting('INDEXER_CONFIRMATIONS') if confirmations is None else confirmations
+
+    def checkpoint(self, name=CHECKPOINT):
+        cp, _ = SyncCheckpoint.objects.get_or_create(name=name)
+        return cp
+
+    def reset(self):
+        """Forget every checkpoint and projected row so the next sync replays from block 0.
+
+        The v2 handlers number users and ratings by arrival, so a replay
+        over the old rows would add them a second time.
+        """
+        with transaction.atomic():
+            for model in PROJECTION_MODELS.values():
+                model.objects.all().delete()
+            SyncCheckpoint.objects.all().delete()
+
+    def sync_once(self):
+        """Apply the next block range; return the number of blocks applied."""
+        web3 = get_web3()
+        head = web3.eth.block_number - self.confirmations
+        cp = self.checkpoint()
+        start = cp.block_number + 1
+        if start > head:
+            return 0
+        end = min(head, start + self.batch_blocks - 1)
+
+        with transaction.atomic():
+            transfers = self.apply_transfers(start, end)
+            events = self.apply_v2_events(start, end)
+            tables = self.apply_v1_tables(end)
+            cp.block_number = end
+            cp.save()
+        logger.info(f"Indexed blocks {start}-{end}: {transfers} transfers, {events} v2 events, {tables} v1 tables changed")
+        if transfers:
+            # Chain writes stay outside the DB transaction
+            payment_settler.settle_pending()
+        return end - start + 1
+
+    def sync(self):
+        """Catch up to the chain head."""
+        applied = 0
+        while True:
+            blocks = self.sync_once()
+            if not blocks:
+                return applied
+            applied += blocks
+
+    def follow(self, poll_interval=None, stop_event=None):
+        """Keep syncing until `stop_event` is set."""
+        poll_interval = poll_interval or chain_setting('INDEXER_POLL_INTERVAL')
+        while not (stop_event and stop_event.is_set()):
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Indexer step failed: {e}")
+            time.sleep(poll_interval)
+
+    # -------------------- Token transfers --------------------
+
+    def apply_transfers(self, start, end):
+        return len(ingest_transfers(start, end))
+
+    # -------------------- CarpoolV2 events --------------------
+
+    def apply_v2_events(self, start, end):
+        try:
+            contract, web3 = load_contract('v2')
+        except (FileNotFoundError, ValueError):
+            return 0
+
+        handlers = {}
+        for name in ('UserAdded', 'RideAdded', 'RideStatusUpdated', 'PassengerRequestAdded',
+                     'PassengerRequestCompleted', 'PassengerRequestPaid', 'RatingAdded'):
+            event = getattr(contract.events, name)()
+            handlers[event.topic] = (event, getattr(self, f'on_{name}'))
+
+        logs = web3.eth.get_logs({'address': contract.address, 'fromBlock': start, 'toBlock': end})
+        applied = 0
+        for log in logs:
+            handler = handlers.get(Web3.to_hex(log['topics'][0]))
+            if handler:
+                event, apply = handler
+                apply(contract, end, event.process_log(log)['args'])
+                applied += 1
+        return applied
+
+    def on_UserAdded(self, contract, block, args):
+        user = user_from_v2(contract.functions.getUserByName(args['username']).call(block_identifier=block))
+        # Usernames are unique on CarpoolV2, so a replayed event updates the same row
+        existing = ChainUser.objects.filter(source='v2', username=user.username).first()
+        if existing is None:
+            position = ChainUser.objects.filter(source='v2').count() + 1
+            ChainUser.objects.create(source='v2', position=position, **record_fields(ChainUser, user))
+        else:
+            ChainUser.objects.filter(pk=existing.pk).update(**record_fields(ChainUser, user))
+        credential_index.add(user)
+
+    def on_RideAdded(self, contract, block, args):
+        ride = ride_from_v2(contract.functions.getRideById(args['id']).call(block_identifier=block))
+        ChainRide.objects.update_or_create(source='v2', position=args['id'], defaults=record_fields(ChainRide, ride))
+
+    def on_RideStatusUpdated(self, contract, block, args):
+        ChainRide.objects.filter(source='v2', position=args['id']).update(status=args['status'])
+
+    def on_PassengerRequestAdded(self, contract, block, args):
+        rows = contract.functions.getPassengerRequests(args['id'] - 1, 1).call(block_identifier=block)
+        if rows:
+            req = request_from_v2(rows[0])
+            ChainPassengerRequest.objects.update_or_create(source='v2', position=args['id'], defaults=record_fields(ChainPassengerRequest, req))
+
+    def on_PassengerRequestCompleted(self, contract, block, args):
+        ChainPassengerRequest.objects.filter(source='v2', position=args['id']).update(
+            miles=args['miles'], amount=args['amount'], status='completed')
+
+    def on_PassengerRequestPaid(self, contract, block, args):
+        ChainPassengerRequest.objects.filter(source='v2', position=args['id']).update(
+            tx_hash=args['txHash'], status='paid')
+
+    def on_RatingAdded(self, contract, block, args):
+        position = ChainRating.objects.filter(source='v2').count() + 1
+        ChainRating.objects.create(source='v2', position=position, user=args['user'],
+                                   driver=args['driver'], rating=str(args['rating']))
+
+    # -------------------- v1 string tables --------------------
+
+    def apply_v1_tables(self, block):
+        changed = 0
+        for contract_type, model in PROJECTION_MODELS.items():
+            contract, web3 = load_contract(contract_type)
+            blob = getattr(contract.functions, BLOB_GETTERS[contract_type])().call(block_identifier=block)
+            digest = hashlib.sha256(blob.encode('utf-8')).hexdigest()
+            cp = self.checkpoint(f'v1:{contract_type}')
+            if cp.digest == digest:
+                continue
+            table = TABLE_TYPES[contract_type](blob)
+            changed_records = self.project_table(model, table)
+            if contract_type == 'signup':
+                # The first row registered under a username keeps it
+                credential_index.add_many([user for user in changed_records
+                                           if table.first('username', user.username) is user])
+            cp.block_number = block
+            cp.digest = digest
+            cp.save()
+            changed += 1
+        return changed
+
+    def project_table(self, model, table):
+        """Apply a parsed v1 table to its model, only writing rows that changed.
+
+        Returns the records that were added or changed.
+        """
+        column = marker_column(model)
+        existing = {position: (pk, marker) for pk, position, marker in
+                    model.objects.filter(source='v1').values_list('pk', 'position', column)}
+        to_create, to_update, changed = [], [], []
+        for position, record in enumerate(table, start=1):
+            current = existing.pop(position, None)
+            if current is None:
+                to_create.append(model(source='v1', position=position, **record_fields(model, record)))
+                changed.append(record)
+            elif current[1] != row_marker(model, record):
+                to_update.append(model(pk=current[0], source='v1', position=position, **record_fields(model, record)))
+                changed.append(record)
+
+        fields = projected_fields(model, table.record_type)
+        model.objects.bulk_create(to_create, batch_size=500)
+        if to_update:
+            model.objects.bulk_update(to_update, fields, batch_size=500)
+        if existing:
+            model.objects.filter(pk__in=[pk for pk, marker in existing.values()]).delete()
+        return changed
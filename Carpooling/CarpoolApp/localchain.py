@@ -0,0 +1,95 @@
+import json, os
+from web3 import Web3, EthereumTesterProvider
+from web3.providers.base import JSONBaseProvider
+import logging
+from .chain import CONTRACT_MAP, build_contract_path, chain_setting, connect_web3, nonce_manager, registry
+from .rpcmetrics import instrument
+
+logger = logging.getLogger(__name__)
+
+# Artifacts deployed by the truffle migrations
+DEPLOYED_ARTIFACTS = sorted(set(CONTRACT_MAP.values()))
+
+# -------------------- In-process Chain --------------------
+
+class BatchingTesterProvider(EthereumTesterProvider, JSONBaseProvider):
+    """eth-tester provider that also answers JSON-RPC batches, one call at a time.
+
+    Ganache takes batches natively; without this web3 refuses
+    `batch_requests()` on the tester and the balance service would fail.
+    """
+
+    def make_batch_request(self, requests):
+        return [self.make_request(method, params) for method, params in requests]
+
+def tester_web3(gas_limit=10 ** 10):
+    """Return a Web3 client on a fresh in-process py-evm chain.
+
+    The block gas limit is raised far above mainnet's so a seeded table of
+    10^5 rows still fits in one setUser/setRide/... transaction.
+    """
+    try:
+        from eth_tester import EthereumTester, PyEVMBackend
+    except ImportError:
+        raise ImportError("The local chain needs eth-tester: pip install 'web3[tester]'")
+    genesis = PyEVMBackend.generate_genesis_params(overrides={'gas_limit': gas_limit})
+    web3 = instrument(Web3(BatchingTesterProvider(EthereumTester(PyEVMBackend(genesis_parameters=genesis)))))
+    web3.eth.default_account = web3.eth.accounts[0]
+    return web3
+
+class LocalChain:
+    """Carpool contracts deployed on a throwaway chain, wired into the registry.
+
+    Bytecode comes from the truffle artifacts in `source_dir` (run
+    `npm run compile` first). The deployed copies are written to `build_dir`
+    with the configured NETWORK_ID, and BLOCKCHAIN['BUILD_DIR'] must point
+    there so the views load them like any other deployment. Pass `rpc_url`
+    to deploy on a running node (e.g. `npm run ganache`) instead of the
+    in-process EVM.
+    """
+
+    def __init__(self, build_dir, source_dir=None, rpc_url=None):
+        self.build_dir = build_dir
+        self.source_dir = source_dir or os.path.dirname(build_contract_path('Carpool'))
+        self.rpc_url = rpc_url
+        self.web3 = None
+        self.addresses = {}
+
+    def start(self):
+        """Connect (or create) the chain and attach it to the contract registry."""
+        self.web3 = connect_web3() if self.rpc_url else tester_web3()
+        registry.attach(self.web3)
+        nonce_manager.reset()
+        return self.web3
+
+    def source_artifact(self, name):
+        path = os.path.join(self.source_dir, f"{name}.json")
+        try:
+            with open(path) as f:
+                artifact = json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Contract JSON not found: {path} (run `npm run compile`)")
+        if not artifact.get('bytecode') or artifact['bytecode'] == '0x':
+            raise ValueError(f"Artifact {path} has no bytecode")
+        return artifact
+
+    def deploy(self):
+        """Deploy every contract the views use; return {artifact name: address}."""
+        os.makedirs(self.build_dir, exist_ok=True)
+        for name in DEPLOYED_ARTIFACTS:
+            artifact = self.source_artifact(name)
+            factory = self.web3.eth.contract(abi=artifact['abi'], bytecode=artifact['bytecode'])
+            receipt = self.web3.eth.wait_for_transaction_receipt(factory.constructor().transact())
+            address = receipt['contractAddress']
+            deployed = {
+                'contractName': name,
+                'abi': artifact['abi'],
+                'networks': {chain_setting('NETWORK_ID'): {'address': address}},
+            }
+            with open(os.path.join(self.build_dir, f"{name}.json"), 'w') as f:
+                json.dump(deployed, f)
+            self.addresses[name] = address
+            logger.info(f"Deployed {name} at {address}")
+        # Deployments used nonces behind the manager's back
+        nonce_manager.reset()
+        return self.addresses
@@ -0,0 +1,72 @@
+import atexit, contextvars, logging, queue, random, uuid
+from logging.handlers import QueueHandler, QueueListener
+
+# Imported by settings.LOGGING before the apps load: keep this to the stdlib.
+
+# -------------------- Request Ids --------------------
+
+_request_id = contextvars.ContextVar('carpool_request_id', default='-')
+
+def new_request_id(incoming=None):
+    """Use the caller's id (X-Request-ID) when it looks sane, else make one; return it."""
+    request_id = incoming if incoming and len(incoming) <= 64 and incoming.isprintable() else uuid.uuid4().hex
+    _request_id.set(request_id)
+    return request_id
+
+def current_request_id():
+    return _request_id.get()
+
+def clear_request_id():
+    _request_id.set('-')
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the id of the request being served ('-' outside one)."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+# -------------------- Sampling --------------------
+
+class SamplingFilter(logging.Filter):
+    """Keeps `rate` of the records at or below `max_level`; anything louder always passes."""
+
+    def __init__(self, rate=1.0, max_level='INFO'):
+        super().__init__()
+        self.rate = float(rate)
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+
+    def filter(self, record):
+        return record.levelno > self.max_level or self.rate >= 1 or random.random() < self.rate
+
+# -------------------- Non-blocking Output --------------------
+
+class QueuedStreamHandler(QueueHandler):
+    """StreamHandler whose formatting and writing happen on a background thread.
+
+    The request thread only puts the record on a bounded queue, so a slow
+    terminal or log pipe cannot hold up a view. When the queue is full the
+    record is dropped and counted in `dropped` rather than blocking.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Formatting is left to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
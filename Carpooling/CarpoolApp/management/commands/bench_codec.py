@@ -0,0 +1,61 @@
+import random, time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from CarpoolApp import codec
+from CarpoolApp.records import TABLE_TYPES, User, Ride, PassengerRequest, Rating
+
+
+def sample_records(rows, seed=1):
+    """Return {contract type: [records]} shaped like the rows the views write."""
+    rng = random.Random(seed)
+    names = [f"user{i}" for i in range(max(rows // 4, 1))]
+    start = date(2026, 1, 1)
+    users, rides, requests, ratings = [], [], [], []
+    for i in range(rows):
+        name = rng.choice(names)
+        wallet = '0x' + ''.join(rng.choice('0123456789abcdef') for _ in range(40))
+        users.append(User(name, 'secret123', f"+1555{rng.randint(1000000, 9999999)}", f"{name}@example.com",
+                          'Toyota Corolla', rng.choice(codec.USER_TYPES), wallet))
+        rides.append(Ride(str(rng.randint(1000, 9999)), name, 'Main Street Station',
+                          f"{rng.uniform(-90, 90):.6f}", f"{rng.uniform(-180, 180):.6f}", str(rng.randint(1, 6)),
+                          (start + timedelta(days=rng.randint(0, 365))).isoformat(),
+                          rng.choice(['waiting', 'completed']),
+                          f"{rng.randint(0, 23):02d}:{rng.choice([0, 15, 30, 45]):02d}",
+                          rng.choice(codec.RECURRENCES)))
+        tx_hash = '0x' + ''.join(rng.choice('0123456789abcdef') for _ in range(64))
+        requests.append(PassengerRequest(str(i + 1), str(rng.randint(1000, 9999)), name, rng.choice(names),
+                                         f"{rng.uniform(0, 30):.2f}", str(rng.randint(5, 200)),
+                                         rng.choice(['0', tx_hash]), '0', rng.choice(['waiting', 'completed', 'paid'])))
+        ratings.append(Rating(rng.choice(names), name, str(rng.randint(1, 5))))
+    return {'signup': users, 'ride': rides, 'passengers': requests, 'ratings': ratings}
+
+
+class Command(BaseCommand):
+    help = "Compare bytes per row and parse throughput of '#' rows and compact (CarpoolApp.codec) rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help='Rows per table')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed parses per table, best one is reported')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'table':<12}{'format':<10}{'bytes/row':>10}{'rows/s':>12}")
+        for contract_type, records in sample_records(options['rows']).items():
+            table_type = TABLE_TYPES[contract_type]
+            width = len(table_type.record_type._fields) - 1
+            blobs = {
+                'text': ''.join('#'.join(r[:width]) + '\n' for r in records),
+                'compact': ''.join(codec.encode_row(table_type.record_type, r[:width]) + '\n' for r in records),
+                'smallest': ''.join(codec.encode_smallest(table_type.record_type, r[:width]) + '\n' for r in records),
+            }
+            for name, blob in blobs.items():
+                table = table_type(blob)
+                assert [r[:width] for r in table] == [r[:width] for r in records], f"{name} rows did not round-trip"
+                best = min(self._time(table_type, blob) for _ in range(options['repeat']))
+                size = len(blob.encode('utf-8')) / len(records)
+                self.stdout.write(f"{contract_type:<12}{name:<10}{size:>10.1f}{len(records) / best:>12,.0f}")
+
+    @staticmethod
+    def _time(table_type, blob):
+        start = time.perf_counter()
+        table_type(blob)
+        return time.perf_counter() - start
@@ -0,0 +1,280 @@
+import json, math, os, platform, random, subprocess, tempfile, time
+from datetime import date, datetime, timedelta, timezone
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+import web3 as web3_module
+from web3 import Web3
+from CarpoolApp.chain import chain_setting, transact, transact_many
+from CarpoolApp.localchain import LocalChain
+from CarpoolApp.rpcmetrics import track
+from CarpoolApp.records import User, Ride, PassengerRequest, Rating, record_to_row
+from CarpoolApp.txtracker import PENDING, tx_tracker
+
+SCENARIOS = ['UserLogin', 'ViewDrivers', 'RideCompleteAction', 'get_pending_payments', 'verify_token_payment']
+CENTER = (40.7128, -74.0060)   # seeded rides are spread around this point
+SPREAD_DEGREES = 0.3
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+# -------------------- Seed Data --------------------
+
+def wallet_for(i):
+    return Web3.to_checksum_address(Web3.keccak(text=f"bench-wallet-{i}")[-20:])
+
+
+def seed_tables(size, rng):
+    """Return ({contract type: blob}, fixtures) for `size` rows per table."""
+    users = [User(f"user{i}", f"pw{i}", f"+1555{i:07d}", f"user{i}@example.com", 'Sedan',
+                  'Driver' if i % 5 == 0 else 'Passenger', wallet_for(i)) for i in range(size)]
+    drivers = [u for u in users if u.user_type == 'Driver']
+    passengers = [u for u in users if u.user_type == 'Passenger'] or users
+    start = date(2026, 1, 1)
+    rides = []
+    for i in range(size):
+        driver = rng.choice(drivers)
+        rides.append(Ride(str(i + 1), driver.username, f"Stop {i}",
+                          f"{CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES):.6f}",
+                          f"{CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES):.6f}",
+                          str(rng.randint(1, 4)), (start + timedelta(days=rng.randint(0, 180))).isoformat(),
+                          'waiting' if rng.random() < 0.9 else 'completed',
+                          f"{rng.randint(6, 22):02d}:{rng.choice([0, 15, 30, 45]):02d}", 'none'))
+    requests = []
+    for i in range(size):
+        ride = rng.choice(rides)
+        completed = rng.random() < 0.5
+        requests.append(PassengerRequest(str(i + 1), ride.ride_id, ride.driver, rng.choice(passengers).username,
+                                         f"{rng.uniform(1, 20):.1f}" if completed else '0',
+                                         str(rng.randint(5, 60)) if completed else '0', '0', '0',
+                                         'completed' if completed else 'waiting'))
+    ratings = [Rating(rng.choice(passengers).username, rng.choice(drivers).username, str(rng.randint(1, 5)))
+               for i in range(size)]
+    blobs = {
+        'signup': ''.join(record_to_row(r) + '\n' for r in users),
+        'ride': ''.join(record_to_row(r) + '\n' for r in rides),
+        'passengers': ''.join(record_to_row(r) + '\n' for r in requests),
+        'ratings': ''.join(record_to_row(r) + '\n' for r in ratings),
+    }
+    fixtures = {
+        'users': {u.username: u for u in users},
+        'drivers': drivers,
+        'passengers': passengers,
+        'completed_requests': [r for r in requests if r.status == 'completed'],
+    }
+    return blobs, fixtures
+
+# -------------------- Benchmark --------------------
+
+class ViewBenchmark:
+    """Drives the views through the Django test client for one table size."""
+
+    def __init__(self, size, fixtures, rng):
+        self.size = size
+        self.fixtures = fixtures
+        self.rng = rng
+        self.clients = {}
+
+    def client(self, username):
+        """Return a client logged in as `username`."""
+        client = self.clients.get(username)
+        if client is None:
+            client = Client()
+            user = self.fixtures['users'][username]
+            client.post(reverse('UserLogin'), {'username': username, 'password': user.password,
+                                               'wallet_address': user.wallet})
+            self.clients[username] = client
+        return client
+
+    def run(self, scenario, iterations, warmup):
+        samples = []
+        for i in range(warmup + iterations):
+            request = getattr(self, f"prepare_{scenario}")()
+            with track(scenario) as stats:
+                start = time.perf_counter()
+                response = request()
+                elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise CommandError(f"{scenario} returned HTTP {response.status_code}: {response.content[:200]!r}")
+            if i >= warmup:
+                samples.append((elapsed, stats.round_trips, stats.bytes,
+                                {method: entry[0] for method, entry in stats.methods.items()}))
+            self.after(response)
+        return summarize(scenario, self.size, samples)
+
+    def after(self, response):
+        """Let background writes from the last request land before the next one."""
+        tx_id = (response.context or {}).get('tx_id') if hasattr(response, 'context') else None
+        deadline = time.monotonic() + chain_setting('TX_RECEIPT_TIMEOUT')
+        while tx_id and time.monotonic() < deadline:
+            job = tx_tracker.status(tx_id)
+            if job is None or job['status'] != PENDING:
+                break
+            time.sleep(0.01)
+
+    def prepare_UserLogin(self):
+        user = self.fixtures['users'][f"user{self.rng.randrange(self.size)}"]
+        data = {'username': user.username, 'password': user.password, 'wallet_address': user.wallet}
+        return lambda: Client().post(reverse('UserLogin'), data)
+
+    def prepare_ViewDrivers(self):
+        client = self.client(self.rng.choice(self.fixtures['passengers']).username)
+        lat = CENTER[0] + self.rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+        lon = CENTER[1] + self.rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+        data = {'t1': 'Downtown', 't2': f"{lat:.6f}", 't3': f"{lon:.6f}"}
+        return lambda: client.post(reverse('ViewDrivers'), data)
+
+    def prepare_RideCompleteAction(self):
+        req = self.rng.choice(self.fixtures['completed_requests'])
+        client = self.client(req.driver)
+        data = {'t1': req.ride_id, 't2': req.passenger, 't3': req.miles, 't4': req.amount}
+        return lambda: client.post(reverse('RideCompleteAction'), data)
+
+    def prepare_get_pending_payments(self):
+        client = self.client(self.rng.choice(self.fixtures['completed_requests']).passenger)
+        return lambda: client.get(reverse('get_pending_payments'))
+
+    def prepare_verify_token_payment(self):
+        req = self.rng.choice(self.fixtures['completed_requests'])
+        driver_wallet = self.fixtures['users'][req.driver].wallet
+        amount = Web3.to_wei(int(req.amount), 'ether')
+        # The passenger's payment, made outside the timed request
+        tx_hash = transact('token', 'transfer', driver_wallet, amount)['transactionHash']
+        client = self.client(req.passenger)
+        body = json.dumps({'tx_hash': Web3.to_hex(tx_hash), 'expected_to': driver_wallet,
+                           'expected_amount': amount, 'passenger': req.passenger, 'rid': req.ride_id})
+        return lambda: client.post(reverse('verify_token_payment'), body, content_type='application/json')
+
+
+def summarize(scenario, size, samples):
+    latencies = sorted(s[0] * 1000 for s in samples)
+    methods = {}
+    for sample in samples:
+        for method, count in sample[3].items():
+            methods[method] = methods.get(method, 0) + count
+    n = len(samples) or 1
+    return {
+        'view': scenario,
+        'size': size,
+        'iterations': len(samples),
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None,
+            'mean': sum(latencies) / n,
+        },
+        'rpc_round_trips': sum(s[1] for s in samples) / n,
+        'rpc_calls': {method: count / n for method, count in sorted(methods.items())},
+        'rpc_bytes': sum(s[2] for s in samples) / n,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Benchmark UserLogin, ViewDrivers, RideCompleteAction, get_pending_payments and "
+            "verify_token_payment against freshly deployed contracts seeded with N rows per table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000', help='Comma-separated rows per table, e.g. 100,1000,100000')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per view and size')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per view and size')
+        parser.add_argument('--views', default=','.join(SCENARIOS), help='Comma-separated subset of views')
+        parser.add_argument('--seed', type=int, default=1, help='Seed for the generated tables and requests')
+        parser.add_argument('--artifacts', default=None, help='Truffle build/contracts directory with bytecode')
+        parser.add_argument('--rpc-url', default=None,
+                            help='Deploy on a running node (e.g. Ganache) instead of the in-process EVM')
+        parser.add_argument('--json', dest='json_path', default=None, help="Write results as JSON to this file ('-' for stdout)")
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        views = [v.strip() for v in options['views'].split(',') if v.strip()]
+        unknown = set(views) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown views: {', '.join(sorted(unknown))}")
+
+        results = []
+        build_dir = tempfile.mkdtemp(prefix='carpool-bench-')
+        blockchain = dict(getattr(settings, 'BLOCKCHAIN', {}), BUILD_DIR=build_dir)
+        if options['rpc_url']:
+            blockchain['RPC_URL'] = options['rpc_url']
+        setup_test_environment()
+        old_db = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(BLOCKCHAIN=blockchain):
+                for size in sizes:
+                    results += self.bench_size(size, views, options, build_dir)
+        finally:
+            connection.creation.destroy_test_db(old_db, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'git_revision': git_revision(),
+                'chain': options['rpc_url'] or 'eth-tester (py-evm)',
+                'record_encoding': blockchain.get('RECORD_ENCODING', 'text'),
+                'sizes': sizes,
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+                'seed': options['seed'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'web3': getattr(web3_module, '__version__', None),
+            },
+            'results': results,
+        }
+        if options['json_path'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        elif options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['json_path']}"))
+
+    def bench_size(self, size, views, options, build_dir):
+        rng = random.Random(options['seed'])
+        chain = LocalChain(build_dir, source_dir=options['artifacts'], rpc_url=options['rpc_url'])
+        try:
+            chain.start()
+            chain.deploy()
+        except (ImportError, FileNotFoundError, ValueError, ConnectionError) as e:
+            raise CommandError(str(e))
+
+        started = time.perf_counter()
+        blobs, fixtures = seed_tables(size, rng)
+        transact_many([('signup', 'setUser', (blobs['signup'],)),
+                       ('ride', 'setRide', (blobs['ride'],)),
+                       ('passengers', 'setPassengers', (blobs['passengers'],)),
+                       ('ratings', 'setRatings', (blobs['ratings'],))])
+        self.stderr.write(f"Seeded {size} rows per table in {time.perf_counter() - started:.1f}s")
+
+        if options['json_path'] != '-':
+            self.stdout.write(f"\n{size} rows per table")
+            self.stdout.write(f"{'view':<24}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'rpc/req':>9}{'KB/req':>10}")
+        bench = ViewBenchmark(size, fixtures, rng)
+        results = []
+        for view in views:
+            result = bench.run(view, options['iterations'], options['warmup'])
+            results.append(result)
+            if options['json_path'] != '-':
+                latency = result['latency_ms']
+                self.stdout.write(f"{view:<24}{latency['p50']:>9.1f}{latency['p90']:>9.1f}{latency['p99']:>9.1f}"
+                                  f"{result['rpc_round_trips']:>9.1f}{result['rpc_bytes'] / 1024:>10.1f}")
+        return results
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from CarpoolApp.dispatch import DISPATCH_MODES, Dispatcher
+
+
+class Command(BaseCommand):
+    help = "Assign open pickup requests to waiting rides with free seats, writing them in one batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=DISPATCH_MODES, default=None, help='Defaults to settings.DISPATCH_MODE')
+        parser.add_argument('--radius', type=float, default=None, help='Pickup radius in miles')
+        parser.add_argument('--dry-run', action='store_true', help='Print the plan without writing it')
+        parser.add_argument('--follow', type=float, default=None, metavar='SECONDS',
+                            help='Keep dispatching every SECONDS')
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher(mode=options['mode'], radius_miles=options['radius'])
+        while True:
+            assignments = dispatcher.run(dry_run=options['dry_run'])
+            for a in assignments:
+                self.stdout.write(f"{a.request.passenger} -> ride {a.ride_id} ({a.driver}), {a.miles:.2f} mi")
+            total = sum(a.miles for a in assignments)
+            self.stdout.write(self.style.SUCCESS(
+                f"{'Planned' if options['dry_run'] else 'Assigned'} {len(assignments)} passengers "
+                f"({dispatcher.mode}, {total:.2f} pickup miles)"))
+            if options['follow'] is None:
+                return
+            try:
+                time.sleep(options['follow'])
+            except KeyboardInterrupt:
+                return
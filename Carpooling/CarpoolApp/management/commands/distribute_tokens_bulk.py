@@ -0,0 +1,54 @@
+import csv, hashlib, sys
+from django.core.management.base import BaseCommand, CommandError
+from CarpoolApp.distribution import MODES, parse_entries, token_distributor
+
+
+class Command(BaseCommand):
+    help = ("Send CPT to many wallets with batchTransfer/batchMint. Reads CSV lines of "
+            "'wallet or username,amount'; running the same file again resumes the job.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV file, '-' for stdin")
+        parser.add_argument('--job', default=None, help='Job name, defaults to one derived from the file contents')
+        parser.add_argument('--mode', choices=sorted(MODES), default='transfer',
+                            help="'transfer' from the server account or 'mint' (owner only)")
+        parser.add_argument('--amount', default=None, help='CPT for lines without an amount')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Recipients per transaction')
+        parser.add_argument('--plan-only', action='store_true', help='Store the chunks without sending them')
+        parser.add_argument('--status', action='store_true', help="Report the job's progress without sending anything")
+
+    def handle(self, *args, **options):
+        if options['file'] == '-':
+            text = sys.stdin.read()
+        else:
+            with open(options['file'], newline='') as f:
+                text = f.read()
+        rows = [row for row in csv.reader(text.splitlines()) if row and row[0].strip() and not row[0].startswith('#')]
+        job = options['job'] or f"{options['mode']}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+        if options['status']:
+            status = token_distributor.status(job)
+            if not status['chunks']:
+                raise CommandError(f"Unknown job {job}")
+            self.stdout.write(f"Job {job}: {status['mined_chunks']}/{status['chunks']} chunks, "
+                              f"{status['mined_recipients']}/{status['recipients']} recipients done"
+                              f"{', failed: ' + status['error'] if status.get('error') else ''}")
+            return
+        try:
+            entries = parse_entries(rows, default_amount=options['amount'])
+            chunks = token_distributor.plan(job, entries, mode=options['mode'], chunk_size=options['chunk_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Job {job}: {len(entries)} recipients in {len(chunks)} chunks")
+        if options['plan_only']:
+            return
+
+        def progress(chunk, status):
+            self.stdout.write(f"  chunk {chunk.index + 1}/{status['chunks']} {chunk.status}"
+                              f"{' ' + chunk.tx_hash if chunk.tx_hash else ''}: "
+                              f"{status['mined_recipients']}/{status['recipients']} recipients done")
+        status = token_distributor.run(job, progress=progress)
+        if status['mined_chunks'] == status['chunks']:
+            self.stdout.write(self.style.SUCCESS(f"Distributed to {status['recipients']} recipients"))
+        else:
+            raise CommandError(f"Stopped after {status['mined_chunks']}/{status['chunks']} chunks "
+                               f"({status.get('error') or 'pending'}); run the same command again to resume")
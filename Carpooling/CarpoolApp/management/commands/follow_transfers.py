@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from CarpoolApp.payments import transfer_follower
+
+
+class Command(BaseCommand):
+    help = "Index CarpoolToken Transfer logs and settle the payments they pay for. Run one per deployment."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Seconds between polls, defaults to BLOCKCHAIN['TRANSFER_FOLLOW_INTERVAL']")
+        parser.add_argument('--once', action='store_true', help='Catch up to the head and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            blocks = 0
+            while True:
+                read = transfer_follower.sync_once()
+                if not read:
+                    break
+                blocks += read
+            self.stdout.write(self.style.SUCCESS(f"Read {blocks} blocks of token transfers"))
+            return
+        self.stdout.write("Following token transfers, Ctrl+C to stop")
+        try:
+            transfer_follower.run(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from CarpoolApp.indexer import ChainIndexer
+
+
+class Command(BaseCommand):
+    help = "Apply new blocks to the local projection tables (users, rides, passengers, ratings, token transfers)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--follow', action='store_true', help='Keep following new blocks')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds between polls with --follow')
+        parser.add_argument('--batch-blocks', type=int, default=None, help='Blocks applied per transaction')
+        parser.add_argument('--reset', action='store_true', help='Clear the projection and replay from block 0')
+
+    def handle(self, *args, **options):
+        indexer = ChainIndexer(batch_blocks=options['batch_blocks'])
+        if options['reset']:
+            indexer.reset()
+        if options['follow']:
+            self.stdout.write("Following new blocks, Ctrl+C to stop")
+            try:
+                indexer.follow(poll_interval=options['poll_interval'])
+            except KeyboardInterrupt:
+                pass
+            return
+        blocks = indexer.sync()
+        checkpoint = indexer.checkpoint()
+        self.stdout.write(self.style.SUCCESS(f"Applied {blocks} blocks, checkpoint at block {checkpoint.block_number}"))
@@ -0,0 +1,114 @@
+import threading
+import numpy as np
+from geopy.distance import geodesic
+import logging
+from .records import load_table
+from .spatial import HAVERSINE_SLACK, haversine_miles_vec, search_radius_miles
+
+logger = logging.getLogger(__name__)
+
+# Largest (queries x rides) distance matrix computed in one go by nearest_many
+MAX_BATCH_CELLS = 4_000_000
+
+# -------------------- Ride Matcher --------------------
+
+class RideMatcher:
+    """Waiting rides held as contiguous coordinate arrays for batched matching.
+
+    The arrays are rebuilt once per ride table version. Every query is a
+    single vectorized haversine pass over all waiting rides; with `exact`
+    the rides near the radius edge are confirmed with geodesic() so the
+    cutoff and reported distances agree with the old per-ride loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table = None
+        # (rides, lat degrees, lon degrees), swapped as one snapshot
+        self._arrays = ([], np.empty(0), np.empty(0))
+
+    def __len__(self):
+        return len(self._arrays[0])
+
+    def load(self, rides):
+        """Replace the indexed rides."""
+        kept, lats, lons = [], [], []
+        for ride in rides:
+            try:
+                lat, lon = float(ride.lat), float(ride.long)
+            except (TypeError, ValueError):
+                continue
+            kept.append(ride)
+            lats.append(lat)
+            lons.append(lon)
+        self._arrays = (kept, np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+
+    def refresh(self, table=None):
+        """Rebuild the arrays if the ride table (or `table`) changed; return the current snapshot.
+
+        Async views pass the table they loaded so no blocking read happens here.
+        """
+        table = table if table is not None else load_table('ride')
+        if table is not self._table:
+            with self._lock:
+                if table is not self._table:
+                    self.load(table.lookup('status', 'waiting'))
+                    self._table = table
+        return self._arrays
+
+    @staticmethod
+    def _select(rides, lat, lon, miles, k, radius_miles, exact):
+        """Turn one row of haversine distances into sorted [(miles, ride)]."""
+        limit = radius_miles * HAVERSINE_SLACK if exact else radius_miles
+        idx = np.flatnonzero(miles <= limit)
+        if k is not None and len(idx) > k:
+            # Keep some spare rides for the exact re-check to reorder
+            spare = min(len(idx), k * 2 if exact else k)
+            idx = idx[np.argpartition(miles[idx], spare - 1)[:spare]]
+        if exact:
+            found = []
+            for i in idx:
+                ride = rides[i]
+                d = geodesic((lat, lon), (float(ride.lat), float(ride.long))).miles
+                if d <= radius_miles:
+                    found.append((d, ride))
+        else:
+            found = [(float(miles[i]), rides[i]) for i in idx]
+        found.sort(key=lambda item: item[0])
+        return found[:k] if k is not None else found
+
+    def nearest(self, lat, lon, k=None, radius_miles=None, exact=True, table=None):
+        """Return up to `k` [(miles, ride)] within the radius, nearest first."""
+        if radius_miles is None:
+            radius_miles = search_radius_miles()
+        arrays = self.refresh(table)
+        if not arrays[0]:
+            return []
+        miles = haversine_miles_vec(lat, lon, arrays[1], arrays[2])
+        return self._select(arrays[0], lat, lon, miles, k, radius_miles, exact)
+
+    def nearest_many(self, queries, k=None, radius_miles=None, exact=True, table=None):
+        """Match many (lat, lon) queries at once for batch dispatch.
+
+        Returns one [(miles, ride)] list per query, in query order. The
+        distance matrix is computed in row chunks to bound memory.
+        """
+        if radius_miles is None:
+            radius_miles = search_radius_miles()
+        arrays = self.refresh(table)
+        if not len(queries):
+            return []
+        if not arrays[0]:
+            return [[] for _ in queries]
+        points = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+        chunk = max(1, MAX_BATCH_CELLS // len(arrays[0]))
+        results = []
+        for start in range(0, len(points), chunk):
+            stop = start + chunk
+            # Query columns against the ride rows broadcast to one distance matrix
+            matrix = haversine_miles_vec(points[start:stop, :1], points[start:stop, 1:], arrays[1], arrays[2])
+            for row, (lat, lon) in zip(matrix, points[start:stop]):
+                results.append(self._select(arrays[0], float(lat), float(lon), row, k, radius_miles, exact))
+        return results
+
+ride_matcher = RideMatcher()
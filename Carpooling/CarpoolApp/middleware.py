@@ -0,0 +1,156 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+import logging
+from .logutils import clear_request_id, new_request_id
+from .rpcmetrics import current_stats, rpc_metrics, track
+
+logger = logging.getLogger('CarpoolApp.rpc')
+
+class RequestIdMiddleware:
+    """Tags each request with an id that every log record made while serving it carries.
+
+    The id is taken from an incoming X-Request-ID header (set by a proxy)
+    or generated, and echoed back in the response's X-Request-ID. Logging
+    picks it up through CarpoolApp.logutils.RequestIdFilter.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.request_id = new_request_id(request.headers.get('X-Request-ID'))
+        try:
+            response = self.get_response(request)
+        finally:
+            clear_request_id()
+        return self.tag(request, response)
+
+    async def __acall__(self, request):
+        request.request_id = new_request_id(request.headers.get('X-Request-ID'))
+        try:
+            response = await self.get_response(request)
+        finally:
+            clear_request_id()
+        return self.tag(request, response)
+
+    def tag(self, request, response):
+        response['X-Request-ID'] = request.request_id
+        if response.streaming:
+            stream = self._astream if response.is_async else self._stream
+            response.streaming_content = stream(response.streaming_content, request.request_id)
+        return response
+
+    def _stream(self, content, request_id):
+        # Chunks (and their log lines) are produced after __call__ returned
+        new_request_id(request_id)
+        try:
+            yield from content
+        finally:
+            clear_request_id()
+
+    async def _astream(self, content, request_id):
+        new_request_id(request_id)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            clear_request_id()
+
+class RpcAccountingMiddleware:
+    """Accounts the JSON-RPC calls each request makes to the chain.
+
+    Every request logs one `rpc` line and feeds the /metrics counters. With
+    DEBUG on, non-streaming responses also carry X-RPC-Calls, X-RPC-Time-Ms,
+    X-RPC-Bytes and X-RPC-Methods headers. Streaming responses are
+    accounted once their content has been sent.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with track() as stats:
+            response = self.get_response(request)
+            if not self.account(stats, response, request):
+                return response
+        self.finish(request, stats, response)
+        return response
+
+    async def __acall__(self, request):
+        # Tasks an async view gathers run in copies of this context, so
+        # their calls are counted here too
+        with track() as stats:
+            response = await self.get_response(request)
+            if not self.account(stats, response, request):
+                return response
+        self.finish(request, stats, response)
+        return response
+
+    def account(self, stats, response, request):
+        """Label the stats; hand streaming responses to _stream. False when deferred."""
+        if stats.view is None:
+            # No view ran (404, redirect by CommonMiddleware, ...)
+            stats.view = 'unresolved'
+        if response.streaming:
+            stream = self._astream if response.is_async else self._stream
+            response.streaming_content = stream(response.streaming_content, stats, request)
+            return False
+        return True
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = current_stats()
+        if stats is not None:
+            match = request.resolver_match
+            stats.view = match.url_name if match and match.url_name else view_func.__name__
+
+    def _stream(self, content, stats, request):
+        # Chunks are produced lazily, so the calls that make them happen here
+        with track(stats.view) as streamed:
+            yield from content
+        self.merge(request, stats, streamed)
+
+    async def _astream(self, content, stats, request):
+        with track(stats.view) as streamed:
+            async for chunk in content:
+                yield chunk
+        self.merge(request, stats, streamed)
+
+    def merge(self, request, stats, streamed):
+        for method, (calls, errors, seconds, size) in streamed.methods.items():
+            entry = stats.methods.setdefault(method, [0, 0, 0.0, 0])
+            entry[0] += calls
+            entry[1] += errors
+            entry[2] += seconds
+            entry[3] += size
+        stats.round_trips += streamed.round_trips
+        self.finish(request, stats, None)
+
+    def finish(self, request, stats, response):
+        rpc_metrics.record_request(stats)
+        debug_headers = response is not None and settings.DEBUG
+        if not (debug_headers or logger.isEnabledFor(logging.INFO)):
+            return
+        summary = stats.summary()
+        methods = ','.join(f"{method}:{entry['calls']}" for method, entry in summary['methods'].items())
+        logger.info("rpc view=%s path=%s calls=%s round_trips=%s ms=%s bytes=%s methods=%s",
+                    summary['view'], request.path, summary['calls'], summary['round_trips'],
+                    summary['ms'], summary['bytes'], methods or '-', extra={'rpc': summary})
+        if debug_headers:
+            response['X-RPC-Calls'] = str(summary['calls'])
+            response['X-RPC-Time-Ms'] = str(summary['ms'])
+            response['X-RPC-Bytes'] = str(summary['bytes'])
+            response['X-RPC-Methods'] = methods
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.4 on 2026-10-17 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('block_number', models.BigIntegerField(default=-1)),
+                ('digest', models.CharField(blank=True, default='', max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChainPassengerRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('v1', 'Carpool string tables'), ('v2', 'CarpoolV2 records')], max_length=2)),
+                ('position', models.PositiveIntegerField()),
+                ('passenger_id', models.CharField(db_index=True, max_length=150)),
+                ('ride_id', models.CharField(blank=True, db_index=True, max_length=32, null=True)),
+                ('driver', models.CharField(blank=True, db_index=True, max_length=150, null=True)),
+                ('passenger', models.CharField(blank=True, db_index=True, max_length=150, null=True)),
+                ('miles', models.CharField(blank=True, max_length=32, null=True)),
+                ('amount', models.CharField(blank=True, max_length=32, null=True)),
+                ('tx_hash', models.CharField(blank=True, max_length=80, null=True)),
+                ('reserved', models.CharField(blank=True, max_length=32, null=True)),
+                ('status', models.CharField(blank=True, db_index=True, max_length=32, null=True)),
+                ('raw', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['source', 'position'],
+                'unique_together': {('source', 'position')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ChainRating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('v1', 'Carpool string tables'), ('v2', 'CarpoolV2 records')], max_length=2)),
+                ('position', models.PositiveIntegerField()),
+                ('user', models.CharField(db_index=True, max_length=150)),
+                ('driver', models.CharField(blank=True, db_index=True, max_length=150, null=True)),
+                ('rating', models.CharField(blank=True, max_length=16, null=True)),
+                ('raw', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['source', 'position'],
+                'unique_together': {('source', 'position')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ChainRide',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('v1', 'Carpool string tables'), ('v2', 'CarpoolV2 records')], max_length=2)),
+                ('position', models.PositiveIntegerField()),
+                ('ride_id', models.CharField(db_index=True, max_length=32)),
+                ('driver', models.CharField(blank=True, db_index=True, max_length=150, null=True)),
+                ('location', models.CharField(blank=True, max_length=255, null=True)),
+                ('lat', models.CharField(blank=True, max_length=32, null=True)),
+                ('long', models.CharField(blank=True, max_length=32, null=True)),
+                ('seats', models.CharField(blank=True, max_length=16, null=True)),
+                ('date', models.CharField(blank=True, max_length=32, null=True)),
+                ('status', models.CharField(blank=True, db_index=True, max_length=32, null=True)),
+                ('time', models.CharField(blank=True, max_length=16, null=True)),
+                ('recurring', models.CharField(blank=True, max_length=32, null=True)),
+                ('raw', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['source', 'position'],
+                'unique_together': {('source', 'position')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ChainUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('v1', 'Carpool string tables'), ('v2', 'CarpoolV2 records')], max_length=2)),
+                ('position', models.PositiveIntegerField()),
+                ('username', models.CharField(db_index=True, max_length=150)),
+                ('password', models.CharField(blank=True, max_length=255, null=True)),
+                ('contact', models.CharField(blank=True, max_length=255, null=True)),
+                ('email', models.CharField(blank=True, max_length=255, null=True)),
+                ('vehicle', models.CharField(blank=True, max_length=255, null=True)),
+                ('user_type', models.CharField(blank=True, db_index=True, max_length=32, null=True)),
+                ('wallet', models.CharField(blank=True, max_length=64, null=True)),
+                ('raw', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['source', 'position'],
+                'unique_together': {('source', 'position')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TokenTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tx_hash', models.CharField(max_length=66)),
+                ('log_index', models.PositiveIntegerField()),
+                ('block_number', models.PositiveBigIntegerField(db_index=True)),
+                ('sender', models.CharField(db_index=True, max_length=42)),
+                ('recipient', models.CharField(db_index=True, max_length=42)),
+                ('value', models.DecimalField(decimal_places=0, max_digits=78)),
+            ],
+            options={
+                'ordering': ['block_number', 'log_index'],
+                'unique_together': {('tx_hash', 'log_index')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CarpoolApp', '0003_credential'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DispatchRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('passenger', models.CharField(db_index=True, max_length=150)),
+                ('lat', models.FloatField()),
+                ('long', models.FloatField()),
+                ('status', models.CharField(choices=[('open', 'Open'), ('assigned', 'Assigned'), ('cancelled', 'Cancelled')], db_index=True, default='open', max_length=16)),
+                ('ride_id', models.CharField(blank=True, max_length=32, null=True)),
+                ('driver', models.CharField(blank=True, max_length=150, null=True)),
+                ('passenger_id', models.CharField(blank=True, max_length=150, null=True)),
+                ('miles', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('assigned_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CarpoolApp', '0004_dispatchrequest'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tokentransfer',
+            index=models.Index(fields=['recipient', 'tx_hash'], name='transfer_to_tx'),
+        ),
+    ]
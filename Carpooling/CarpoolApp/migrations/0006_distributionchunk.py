@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CarpoolApp', '0005_transfer_to_tx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistributionChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(db_index=True, max_length=64)),
+                ('index', models.PositiveIntegerField()),
+                ('mode', models.CharField(max_length=8)),
+                ('batch_id', models.CharField(max_length=66, unique=True)),
+                ('entries', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('mined', 'Mined'), ('failed', 'Failed')], db_index=True, default='pending', max_length=8)),
+                ('tx_hash', models.CharField(blank=True, max_length=66, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['job', 'index'],
+                'unique_together': {('job', 'index')},
+            },
+        ),
+    ]
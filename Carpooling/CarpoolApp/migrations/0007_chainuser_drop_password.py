@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CarpoolApp', '0006_distributionchunk'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='chainuser',
+            name='password',
+        ),
+        migrations.RemoveField(
+            model_name='chainuser',
+            name='raw',
+        ),
+        migrations.AddField(
+            model_name='chainuser',
+            name='digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
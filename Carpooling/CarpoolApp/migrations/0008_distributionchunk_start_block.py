@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CarpoolApp', '0007_chainuser_drop_password'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='distributionchunk',
+            name='start_block',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
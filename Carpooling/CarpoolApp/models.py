@@ -1,3 +1,143 @@
 from django.db import models
 
-# Create your models here.
+# Local projection of on-chain state, kept up to date by CarpoolApp.indexer
+# (`python manage.py sync_chain --follow`). Rows from the v1 string tables
+# are keyed by their position in the string; CarpoolV2 rows by their id.
+
+SOURCE_CHOICES = [('v1', 'Carpool string tables'), ('v2', 'CarpoolV2 records')]
+
+class ChainUser(models.Model):
+    # No password or raw row, which would keep passwords in plain text;
+    # logins use Credential's hashes and `digest` tells changed rows apart
+    source = models.CharField(max_length=2, choices=SOURCE_CHOICES)
+    position = models.PositiveIntegerField()
+    username = models.CharField(max_length=150, db_index=True)
+    contact = models.CharField(max_length=255, blank=True, null=True)
+    email = models.CharField(max_length=255, blank=True, null=True)
+    vehicle = models.CharField(max_length=255, blank=True, null=True)
+    user_type = models.CharField(max_length=32, blank=True, null=True, db_index=True)
+    wallet = models.CharField(max_length=64, blank=True, null=True)
+    digest = models.CharField(max_length=64, blank=True, null=True)
+
+    class Meta:
+        unique_together = [('source', 'position')]
+        ordering = ['source', 'position']
+
+class ChainRide(models.Model):
+    source = models.CharField(max_length=2, choices=SOURCE_CHOICES)
+    position = models.PositiveIntegerField()
+    ride_id = models.CharField(max_length=32, db_index=True)
+    driver = models.CharField(max_length=150, blank=True, null=True, db_index=True)
+    location = models.CharField(max_length=255, blank=True, null=True)
+    lat = models.CharField(max_length=32, blank=True, null=True)
+    long = models.CharField(max_length=32, blank=True, null=True)
+    seats = models.CharField(max_length=16, blank=True, null=True)
+    date = models.CharField(max_length=32, blank=True, null=True)
+    status = models.CharField(max_length=32, blank=True, null=True, db_index=True)
+    time = models.CharField(max_length=16, blank=True, null=True)
+    recurring = models.CharField(max_length=32, blank=True, null=True)
+    raw = models.TextField(blank=True, null=True)
+
+    class Meta:
+        unique_together = [('source', 'position')]
+        ordering = ['source', 'position']
+
+class ChainPassengerRequest(models.Model):
+    source = models.CharField(max_length=2, choices=SOURCE_CHOICES)
+    position = models.PositiveIntegerField()
+    passenger_id = models.CharField(max_length=150, db_index=True)
+    ride_id = models.CharField(max_length=32, blank=True, null=True, db_index=True)
+    driver = models.CharField(max_length=150, blank=True, null=True, db_index=True)
+    passenger = models.CharField(max_length=150, blank=True, null=True, db_index=True)
+    miles = models.CharField(max_length=32, blank=True, null=True)
+    amount = models.CharField(max_length=32, blank=True, null=True)
+    tx_hash = models.CharField(max_length=80, blank=True, null=True)
+    reserved = models.CharField(max_length=32, blank=True, null=True)
+    status = models.CharField(max_length=32, blank=True, null=True, db_index=True)
+    raw = models.TextField(blank=True, null=True)
+
+    class Meta:
+        unique_together = [('source', 'position')]
+        ordering = ['source', 'position']
+
+class ChainRating(models.Model):
+    source = models.CharField(max_length=2, choices=SOURCE_CHOICES)
+    position = models.PositiveIntegerField()
+    user = models.CharField(max_length=150, db_index=True)
+    driver = models.CharField(max_length=150, blank=True, null=True, db_index=True)
+    rating = models.CharField(max_length=16, blank=True, null=True)
+    raw = models.TextField(blank=True, null=True)
+
+    class Meta:
+        unique_together = [('source', 'position')]
+        ordering = ['source', 'position']
+
+class TokenTransfer(models.Model):
+    tx_hash = models.CharField(max_length=66)
+    log_index = models.PositiveIntegerField()
+    block_number = models.PositiveBigIntegerField(db_index=True)
+    sender = models.CharField(max_length=42, db_index=True)
+    recipient = models.CharField(max_length=42, db_index=True)
+    value = models.DecimalField(max_digits=78, decimal_places=0)
+
+    class Meta:
+        unique_together = [('tx_hash', 'log_index')]
+        ordering = ['block_number', 'log_index']
+        # Payment checks look transfers up by (to, tx_hash)
+        indexes = [models.Index(fields=['recipient', 'tx_hash'], name='transfer_to_tx')]
+
+class SyncCheckpoint(models.Model):
+    """Last block applied by the indexer, plus a digest per v1 string table."""
+    name = models.CharField(max_length=64, unique=True)
+    block_number = models.BigIntegerField(default=-1)
+    digest = models.CharField(max_length=64, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+class Wallet(models.Model):
+    """Username -> wallet address, shared by every worker (CarpoolApp.wallets)."""
+    username = models.CharField(max_length=150, unique=True)
+    address = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class Credential(models.Model):
+    """Username -> salted password hash, for logins (CarpoolApp.credentials)."""
+    username = models.CharField(max_length=150, unique=True)
+    password_hash = models.CharField(max_length=255)
+    user_type = models.CharField(max_length=32, blank=True, null=True)
+    wallet = models.CharField(max_length=64, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class DispatchRequest(models.Model):
+    """A passenger's pickup point waiting for CarpoolApp.dispatch to pick a ride."""
+    STATUS_CHOICES = [('open', 'Open'), ('assigned', 'Assigned'), ('cancelled', 'Cancelled')]
+    passenger = models.CharField(max_length=150, db_index=True)
+    lat = models.FloatField()
+    long = models.FloatField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='open', db_index=True)
+    ride_id = models.CharField(max_length=32, blank=True, null=True)
+    driver = models.CharField(max_length=150, blank=True, null=True)
+    passenger_id = models.CharField(max_length=150, blank=True, null=True)
+    miles = models.FloatField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    assigned_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+
+class DistributionChunk(models.Model):
+    """One batchTransfer/batchMint transaction of a bulk token distribution (CarpoolApp.distribution)."""
+    STATUS_CHOICES = [('pending', 'Pending'), ('sent', 'Sent'), ('mined', 'Mined'), ('failed', 'Failed')]
+    job = models.CharField(max_length=64, db_index=True)
+    index = models.PositiveIntegerField()
+    mode = models.CharField(max_length=8)
+    batch_id = models.CharField(max_length=66, unique=True)
+    entries = models.TextField()   # JSON [[checksum address, wei as string], ...]
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default='pending', db_index=True)
+    tx_hash = models.CharField(max_length=66, blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    start_block = models.PositiveBigIntegerField(default=0)   # chain head when the job was planned
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('job', 'index')]
+        ordering = ['job', 'index']
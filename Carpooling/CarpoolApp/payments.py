@@ -0,0 +1,178 @@
+import threading, time
+from collections import deque
+from decimal import Decimal, InvalidOperation
+from django.db import close_old_connections
+from web3 import Web3
+import logging
+from .balances import balance_service
+from .blobcache import update_blob
+from .chain import chain_setting, get_web3, load_contract
+from .models import SyncCheckpoint, TokenTransfer, Wallet
+from .records import PassengerTable, RecordTable, load_table
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = 'transfers'
+UNPAID_TX_HASHES = (None, '', '0')
+
+def transfer_rows(logs):
+    """Return unsaved TokenTransfer rows for decoded Transfer logs."""
+    return [TokenTransfer(
+        tx_hash=Web3.to_hex(log['transactionHash']),
+        log_index=log['logIndex'],
+        block_number=log['blockNumber'],
+        sender=log['args']['from'],
+        recipient=log['args']['to'],
+        value=log['args']['value'],
+    ) for log in logs]
+
+def ingest_transfers(start, end):
+    """Index the CarpoolToken Transfer logs of blocks start..end; return the rows."""
+    token, web3 = load_contract('token')
+    rows = transfer_rows(token.events.Transfer().get_logs(from_block=start, to_block=end))
+    TokenTransfer.objects.bulk_create(rows, ignore_conflicts=True)
+    if rows:
+        balance_service.invalidate(*{a for row in rows for a in (row.sender, row.recipient)})
+    return rows
+
+def find_transfer(to, tx_hash, min_value=0):
+    """Return an indexed transfer of at least `min_value` wei to `to` in `tx_hash`, or None."""
+    try:
+        to = Web3.to_checksum_address(to)
+    except (TypeError, ValueError):
+        return None
+    return TokenTransfer.objects.filter(recipient=to, tx_hash=tx_hash.lower(), value__gte=min_value).first()
+
+def amount_wei(amount):
+    """Return a CPT amount string in wei, or None when it is not a positive number."""
+    try:
+        value = Web3.to_wei(Decimal(str(amount)), 'ether')
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+    return value if value > 0 else None
+
+# -------------------- Payment Settlement --------------------
+
+class PaymentSettler:
+    """Matches completed passenger rows with indexed Transfer logs and marks them paid.
+
+    A completed row is paid by the oldest transfer from the passenger's
+    wallet to the driver's wallet of at least the fare that no paid row
+    claims yet. Wallets come from the wallet registry table; every match
+    found in one pass goes to the chain in a single passengers write.
+    """
+
+    def match_pending(self, passengers=None):
+        """Return {(passenger_id, ride_id): tx_hash} for completed rows with a matching transfer."""
+        passengers = passengers if passengers is not None else load_table('passengers')
+        pending = [req for req in passengers.lookup('status', 'completed') if req.tx_hash in UNPAID_TX_HASHES]
+        if not pending:
+            return {}
+        names = {name for req in pending for name in (req.passenger, req.driver) if name}
+        wallets = {}
+        for username, address in Wallet.objects.filter(username__in=names).values_list('username', 'address'):
+            try:
+                wallets[username] = Web3.to_checksum_address(address)
+            except ValueError:
+                continue
+        claimed = {req.tx_hash.lower() for req in passengers.lookup('status', 'paid') if req.tx_hash}
+
+        senders = {wallets[req.passenger] for req in pending if req.passenger in wallets}
+        recipients = {wallets[req.driver] for req in pending if req.driver in wallets}
+        candidates = {}
+        for transfer in TokenTransfer.objects.filter(sender__in=senders, recipient__in=recipients):
+            if transfer.tx_hash.lower() not in claimed:
+                candidates.setdefault((transfer.sender, transfer.recipient), deque()).append(transfer)
+
+        matches = {}
+        for req in pending:
+            fare = amount_wei(req.amount)
+            queue = candidates.get((wallets.get(req.passenger), wallets.get(req.driver)))
+            if fare is None or not queue:
+                continue
+            for transfer in queue:
+                if transfer.value >= fare:
+                    queue.remove(transfer)
+                    matches[(req.passenger_id, req.ride_id)] = transfer.tx_hash
+                    break
+        return matches
+
+    def settle(self, claims):
+        """Mark the completed rows in {(passenger_id, ride_id): tx_hash} paid in one write.
+
+        Returns the number of rows marked.
+        """
+        if not claims:
+            return 0
+        marked = []
+        def mark_paid(current):
+            marked.clear()
+            updated = []
+            for req in PassengerTable(current):
+                tx_hash = claims.get((req.passenger_id, req.ride_id))
+                if tx_hash and req.status == 'completed':
+                    req = req._replace(tx_hash=tx_hash, status='paid', raw=None)
+                    marked.append(req)
+                updated.append(req)
+            return RecordTable.to_blob(updated)
+        update_blob('passengers', mark_paid)
+        for req in marked:
+            logger.info("Marked request %s for ride %s paid with tx %s", req.passenger_id, req.ride_id, req.tx_hash)
+        return len(marked)
+
+    def settle_pending(self):
+        """Settle every completed row that has a matching transfer; return how many."""
+        return self.settle(self.match_pending())
+
+payment_settler = PaymentSettler()
+
+# -------------------- Transfer Follower --------------------
+
+class TransferFollower:
+    """Background thread that follows CarpoolToken Transfer logs block range by block range.
+
+    New logs go into TokenTransfer (keyed by recipient and tx hash) and
+    each range that brought transfers is followed by one settlement pass.
+    Progress is kept in SyncCheckpoint 'transfers', so a restart resumes
+    where it stopped. It runs in `manage.py follow_transfers`, a single
+    process, rather than in the web workers; `manage.py sync_chain --follow`
+    covers the same logs for deployments that run the full indexer.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+
+    def sync_once(self):
+        """Index the next block range and settle; return the number of blocks read."""
+        web3 = get_web3()
+        head = web3.eth.block_number - chain_setting('INDEXER_CONFIRMATIONS')
+        cp, _ = SyncCheckpoint.objects.get_or_create(name=CHECKPOINT)
+        start = cp.block_number + 1
+        if start > head:
+            return 0
+        end = min(head, start + chain_setting('INDEXER_BATCH_BLOCKS') - 1)
+        rows = ingest_transfers(start, end)
+        cp.block_number = end
+        cp.save()
+        if rows:
+            settled = payment_settler.settle_pending()
+            logger.info("Indexed %d transfers in blocks %d-%d, settled %d payments", len(rows), start, end, settled)
+        return end - start + 1
+
+    def run(self, interval=None):
+        """Follow new blocks every `interval` seconds until stop() is called."""
+        interval = interval or chain_setting('TRANSFER_FOLLOW_INTERVAL')
+        self._stop.clear()
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                while self.sync_once():
+                    pass
+            except Exception as e:
+                logger.warning("Following token transfers failed: %s", e)
+            self._stop.wait(interval)
+
+    def stop(self):
+        self._stop.set()
+
+transfer_follower = TransferFollower()
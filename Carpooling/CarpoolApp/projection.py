@@ -0,0 +1,68 @@
+from .chain import chain_setting
+from .records import TABLE_TYPES, load_table
+from .models import ChainUser, ChainRide, ChainPassengerRequest, ChainRating
+
+# -------------------- Projected Tables --------------------
+
+class ProjectedTable:
+    """Read-only stand-in for a RecordTable backed by the local projection.
+
+    Index names map to indexed model columns, so `lookup()` is a single
+    SQLite query instead of a chain read. Records come back as the same
+    NamedTuples that records.load_table() returns.
+    """
+
+    def __init__(self, model, record_type, indexes):
+        self.model = model
+        self.record_type = record_type
+        self.indexes = indexes
+        # Record fields the model does not store (the user password) read as None
+        columns = {field.name for field in model._meta.concrete_fields}
+        self.fields = [name for name in record_type._fields if name in columns]
+
+    def _records(self, queryset):
+        return [self.record_type(**dict(zip(self.fields, row))) for row in queryset.values_list(*self.fields)]
+
+    def __len__(self):
+        return self.model.objects.count()
+
+    def __iter__(self):
+        return iter(self._records(self.model.objects.all()))
+
+    def lookup(self, index, key):
+        """Return every record whose `index` key equals `key`."""
+        columns = self.indexes[index]
+        values = key if isinstance(columns, tuple) else (key,)
+        columns = columns if isinstance(columns, tuple) else (columns,)
+        return self._records(self.model.objects.filter(**dict(zip(columns, values))))
+
+    def first(self, index, key):
+        """Return the first record whose `index` key equals `key`, or None."""
+        matches = self.lookup(index, key)
+        return matches[0] if matches else None
+
+PROJECTED_TABLES = {
+    'signup': (ChainUser, {'username': 'username', 'user_type': 'user_type'}),
+    'ride': (ChainRide, {'ride_id': 'ride_id', 'driver': 'driver', 'status': 'status'}),
+    'passengers': (ChainPassengerRequest, {
+        'request': ('passenger_id', 'ride_id'),
+        'ride_id': 'ride_id',
+        'driver': 'driver',
+        'passenger': 'passenger',
+        'status': 'status',
+    }),
+    'ratings': (ChainRating, {'user': 'user', 'driver': 'driver'}),
+}
+
+def query_table(contract_type):
+    """Return a table for read-only views.
+
+    Uses the local projection when BLOCKCHAIN['READ_FROM_PROJECTION'] is on,
+    otherwise the chain-backed table from records.load_table(). Views that
+    rewrite a table must keep using load_table() so they never write back a
+    stale projection.
+    """
+    if not chain_setting('READ_FROM_PROJECTION'):
+        return load_table(contract_type)
+    model, indexes = PROJECTED_TABLES[contract_type]
+    return ProjectedTable(model, TABLE_TYPES[contract_type].record_type, indexes)
@@ -0,0 +1,231 @@
+import threading
+from typing import NamedTuple, Optional
+import logging
+from . import codec
+from .blobcache import blob_cache
+from .chain import chain_setting
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Record Types --------------------
+# One row of each '#'-delimited table. Columns missing from short legacy rows
+# are None; `raw` keeps the original row so untouched rows are written back
+# byte for byte.
+
+class User(NamedTuple):
+    username: str
+    password: Optional[str] = None
+    contact: Optional[str] = None
+    email: Optional[str] = None
+    vehicle: Optional[str] = None
+    user_type: Optional[str] = None
+    wallet: Optional[str] = None
+    raw: Optional[str] = None
+
+class Ride(NamedTuple):
+    ride_id: str
+    driver: Optional[str] = None
+    location: Optional[str] = None
+    lat: Optional[str] = None
+    long: Optional[str] = None
+    seats: Optional[str] = None
+    date: Optional[str] = None
+    status: Optional[str] = None
+    time: Optional[str] = None
+    recurring: Optional[str] = None
+    raw: Optional[str] = None
+
+class PassengerRequest(NamedTuple):
+    passenger_id: str
+    ride_id: Optional[str] = None
+    driver: Optional[str] = None
+    passenger: Optional[str] = None
+    miles: Optional[str] = None
+    amount: Optional[str] = None
+    tx_hash: Optional[str] = None
+    reserved: Optional[str] = None
+    status: Optional[str] = None
+    raw: Optional[str] = None
+
+class Rating(NamedTuple):
+    user: str
+    driver: Optional[str] = None
+    rating: Optional[str] = None
+    raw: Optional[str] = None
+
+def parse_record(record_type, row):
+    """Parse one row into `record_type`, either '#'-delimited or compact (see codec)."""
+    width = len(record_type._fields) - 1
+    if codec.is_compact(row):
+        try:
+            name, values, extras = codec.decode_row(row)
+            if name == record_type.__name__:
+                return record_type(*values, raw=row)
+            logger.warning(f"Compact {name} row in a {record_type.__name__} table")
+        except codec.CodecError as e:
+            logger.warning(f"Unreadable compact row, parsing as text: {e}")
+    values = row.split('#')[:width]
+    return record_type(*values, raw=row)
+
+def extra_columns(record):
+    """Return the legacy columns past the record's fields kept in its raw row."""
+    if record.raw is None:
+        return []
+    width = len(record._fields) - 1
+    if codec.is_compact(record.raw):
+        try:
+            return codec.decode_row(record.raw)[2]
+        except codec.CodecError:
+            return []
+    return record.raw.split('#')[width:]
+
+def record_to_row(record):
+    """Return the row for a record, keeping any extra legacy columns.
+
+    Written '#'-delimited, or when BLOCKCHAIN['RECORD_ENCODING'] is
+    'compact' in whichever of the two forms is shorter; parse_record()
+    reads both, so tables can mix them while rows migrate.
+    """
+    width = len(record._fields) - 1
+    # Views may pass numbers straight from JSON; rows hold their text form
+    values = [None if value is None else str(value) for value in record[:width]]
+    while values and values[-1] is None:
+        values.pop()
+    if chain_setting('RECORD_ENCODING') == 'compact':
+        return codec.encode_smallest(type(record), values, extra_columns(record))
+    parts = ['' if value is None else value for value in values]
+    parts += extra_columns(record)
+    return '#'.join(parts)
+
+# -------------------- CarpoolV2 Rows --------------------
+
+def user_from_v2(row):
+    """Convert a CarpoolV2 User struct into a User record."""
+    username, password, contact, email, vehicle, user_type, wallet = row
+    return User(username, password, contact, email, vehicle, user_type, wallet)
+
+def ride_from_v2(row):
+    """Convert a CarpoolV2 Ride struct into a Ride record."""
+    ride_id, driver, location, lat, long, seats, ride_date, status, ride_time, recurring = row
+    return Ride(str(ride_id), driver, location, lat, long, str(seats), ride_date, status, ride_time, recurring)
+
+def request_from_v2(row):
+    """Convert a CarpoolV2 PassengerRequest struct into a PassengerRequest record."""
+    request_id, ride_id, driver, passenger, miles, amount, tx_hash, status = row
+    return PassengerRequest(str(request_id), str(ride_id), driver, passenger, miles, amount, tx_hash, '0', status)
+
+def rating_from_v2(row):
+    """Convert a CarpoolV2 Rating struct into a Rating record."""
+    username, driver_name, rating = row
+    return Rating(username, driver_name, str(rating))
+
+# -------------------- Indexed Tables --------------------
+
+class RecordTable:
+    """Parsed rows of one blob plus hash indexes over them.
+
+    `indexes` maps an index name to a function returning the key for a
+    record (or None to leave it out). Lookups return records in blob order.
+    """
+
+    record_type = None
+    indexes = {}
+
+    def __init__(self, blob=''):
+        self.records = [parse_record(self.record_type, row) for row in blob.split('\n') if row.strip()]
+        self._indexes = {name: {} for name in self.indexes}
+        for record in self.records:
+            for name, key_func in self.indexes.items():
+                key = key_func(record)
+                if key is not None:
+                    self._indexes[name].setdefault(key, []).append(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def lookup(self, index, key):
+        """Return every record whose `index` key equals `key`."""
+        return self._indexes[index].get(key, [])
+
+    def first(self, index, key):
+        """Return the first record whose `index` key equals `key`, or None."""
+        matches = self._indexes[index].get(key)
+        return matches[0] if matches else None
+
+    @staticmethod
+    def to_blob(records):
+        """Serialize records back into a '\\n'-terminated blob."""
+        return ''.join(record_to_row(record) + '\n' for record in records)
+
+class UserTable(RecordTable):
+    record_type = User
+    indexes = {
+        'username': lambda r: r.username,
+        'user_type': lambda r: r.user_type,
+    }
+
+class RideTable(RecordTable):
+    record_type = Ride
+    indexes = {
+        'ride_id': lambda r: r.ride_id,
+        'driver': lambda r: r.driver,
+        'status': lambda r: r.status,
+    }
+
+class PassengerTable(RecordTable):
+    record_type = PassengerRequest
+    indexes = {
+        'request': lambda r: (r.passenger_id, r.ride_id),
+        'ride_id': lambda r: r.ride_id,
+        'driver': lambda r: r.driver,
+        'passenger': lambda r: r.passenger,
+        'status': lambda r: r.status,
+    }
+
+class RatingTable(RecordTable):
+    record_type = Rating
+    indexes = {
+        'user': lambda r: r.user,
+        'driver': lambda r: r.driver,
+    }
+
+TABLE_TYPES = {
+    'signup': UserTable,
+    'ride': RideTable,
+    'passengers': PassengerTable,
+    'ratings': RatingTable,
+}
+
+# -------------------- Table Cache --------------------
+
+_tables = {}   # contract_type -> (blob version, table)
+_tables_lock = threading.Lock()
+
+def load_table(contract_type):
+    """Return the indexed table for a contract type, parsed once per blob version.
+
+    Falls back to an empty table when the chain cannot be read, like the
+    views did with the raw strings.
+    """
+    table_type = TABLE_TYPES[contract_type]
+    try:
+        version, blob = blob_cache.read_versioned(contract_type)
+    except Exception as e:
+        logger.error(f"Error reading {contract_type} from blockchain: {e}")
+        return table_type()
+
+    return table_at(contract_type, version, blob)
+
+def table_at(contract_type, version, blob):
+    """Return the table parsed from `blob`, reusing the one parsed for `version`."""
+    cached = _tables.get(contract_type)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    table = TABLE_TYPES[contract_type](blob)
+    with _tables_lock:
+        _tables[contract_type] = (version, table)
+    return table
@@ -0,0 +1,240 @@
+import contextvars, threading, time
+from contextlib import contextmanager
+from web3.middleware import Web3Middleware
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND = 'background'   # view label for calls made outside any request
+
+def payload_size(value):
+    """Approximate JSON-encoded size in bytes of a request or response."""
+    if value is None or isinstance(value, bool):
+        return 4
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, (bytes, bytearray)):
+        return 2 * len(value) + 4
+    if isinstance(value, int):
+        return len(str(value))
+    if isinstance(value, dict) or hasattr(value, 'items'):
+        return 2 + sum(payload_size(str(k)) + 1 + payload_size(v) + 1 for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 2 + sum(payload_size(v) + 1 for v in value)
+    return len(str(value))
+
+# -------------------- Per-request Accounting --------------------
+
+class RpcStats:
+    """RPC calls made inside one `track()` block, usually one HTTP request.
+
+    `methods` maps an RPC method to [calls, errors, seconds, bytes]. A
+    batch is one round trip; its time is split evenly over its calls.
+    """
+
+    def __init__(self, view=None, parent=None):
+        self.view = view
+        self.parent = parent
+        self.methods = {}
+        self.round_trips = 0
+
+    def record(self, method, seconds, size, error=False, round_trip=True):
+        entry = self.methods.setdefault(method, [0, 0, 0.0, 0])
+        entry[0] += 1
+        entry[1] += int(error)
+        entry[2] += seconds
+        entry[3] += size
+        self.round_trips += int(round_trip)
+
+    @property
+    def calls(self):
+        return sum(entry[0] for entry in self.methods.values())
+
+    @property
+    def seconds(self):
+        return sum(entry[2] for entry in self.methods.values())
+
+    @property
+    def bytes(self):
+        return sum(entry[3] for entry in self.methods.values())
+
+    def summary(self):
+        """Return a JSON-safe dict of the totals and per-method numbers."""
+        return {
+            'view': self.view,
+            'calls': self.calls,
+            'round_trips': self.round_trips,
+            'ms': round(self.seconds * 1000, 3),
+            'bytes': self.bytes,
+            'methods': {method: {'calls': calls, 'errors': errors, 'ms': round(seconds * 1000, 3), 'bytes': size}
+                        for method, (calls, errors, seconds, size) in sorted(self.methods.items())},
+        }
+
+_current = contextvars.ContextVar('carpool_rpc_stats', default=None)
+
+def current_stats():
+    """Return the innermost active RpcStats, or None."""
+    return _current.get()
+
+@contextmanager
+def track(view=None):
+    """Collect the RPC calls made in this block (and this context) into an RpcStats.
+
+    Blocks nest: a call counts towards every enclosing block.
+    """
+    parent = _current.get()
+    stats = RpcStats(view or (parent.view if parent else None), parent)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # An abandoned async stream closed by the loop's generator
+            # finalizer runs in another context; nothing to restore there
+            pass
+
+def record_call(method, seconds, size, error=False, round_trip=True):
+    """Record one RPC call against the active blocks and the process totals."""
+    stats = _current.get()
+    rpc_metrics.record_call(stats.view if stats and stats.view else BACKGROUND, method, seconds, size, error)
+    while stats is not None:
+        stats.record(method, seconds, size, error, round_trip)
+        stats = stats.parent
+
+# -------------------- Process Totals --------------------
+
+class RpcMetrics:
+    """Process-wide RPC and request counters, rendered for Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}      # (view, method) -> [calls, errors, seconds, bytes]
+        self._requests = {}   # view -> [requests, rpc calls, rpc seconds]
+
+    def record_call(self, view, method, seconds, size, error=False):
+        with self._lock:
+            entry = self._calls.setdefault((view, method), [0, 0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += int(error)
+            entry[2] += seconds
+            entry[3] += size
+
+    def record_request(self, stats):
+        with self._lock:
+            entry = self._requests.setdefault(stats.view or 'unknown', [0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += stats.calls
+            entry[2] += stats.seconds
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._requests.clear()
+
+    def render(self):
+        """Return the counters in the Prometheus text exposition format."""
+        with self._lock:
+            calls = sorted(self._calls.items())
+            requests = sorted(self._requests.items())
+        lines = []
+        families = [
+            ('carpool_rpc_calls_total', 'JSON-RPC calls by view and method.', 0),
+            ('carpool_rpc_errors_total', 'JSON-RPC calls that raised, by view and method.', 1),
+            ('carpool_rpc_seconds_total', 'Time spent in JSON-RPC calls, by view and method.', 2),
+            ('carpool_rpc_bytes_total', 'Approximate JSON-RPC request plus response bytes, by view and method.', 3),
+        ]
+        for name, help_text, index in families:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{view="{_label(view)}",method="{_label(method)}"}} {values[index]}'
+                      for (view, method), values in calls]
+        families = [
+            ('carpool_http_requests_total', 'HTTP requests by view.', 0),
+            ('carpool_http_request_rpc_calls_total', 'JSON-RPC calls made while serving requests, by view.', 1),
+            ('carpool_http_request_rpc_seconds_total', 'JSON-RPC time while serving requests, by view.', 2),
+        ]
+        for name, help_text, index in families:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{view="{_label(view)}"}} {values[index]}' for view, values in requests]
+        return '\n'.join(lines) + '\n'
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+rpc_metrics = RpcMetrics()
+
+# -------------------- web3 Middleware --------------------
+
+def record_response(method, params, start, response=None, failed=False):
+    """Record one timed call started at `start` (perf_counter)."""
+    error = failed or (isinstance(response, dict) and 'error' in response)
+    size = payload_size(params) + (0 if failed else payload_size(response))
+    record_call(method, time.perf_counter() - start, size, error=error)
+
+def record_batch(requests_info, start, responses):
+    """Record a timed batch as one round trip; `responses` is None when it raised."""
+    share = (time.perf_counter() - start) / max(len(requests_info), 1)
+    answered = responses if isinstance(responses, list) else [responses] * len(requests_info)
+    for i, ((method, params), response) in enumerate(zip(requests_info, answered)):
+        error = response is None or (isinstance(response, dict) and 'error' in response)
+        record_call(method, share, payload_size(params) + payload_size(response),
+                    error=error, round_trip=i == 0)
+
+class RpcInstrumentationMiddleware(Web3Middleware):
+    """Times every JSON-RPC call and batch and hands it to record_call().
+
+    Works on both Web3 and AsyncWeb3 clients.
+    """
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            start = time.perf_counter()
+            try:
+                response = make_request(method, params)
+            except Exception:
+                record_response(method, params, start, failed=True)
+                raise
+            record_response(method, params, start, response)
+            return response
+        return middleware
+
+    def wrap_make_batch_request(self, make_batch_request):
+        def middleware(requests_info):
+            start = time.perf_counter()
+            responses = None
+            try:
+                responses = make_batch_request(requests_info)
+            finally:
+                record_batch(requests_info, start, responses)
+            return responses
+        return middleware
+
+    async def async_wrap_make_request(self, make_request):
+        async def middleware(method, params):
+            start = time.perf_counter()
+            try:
+                response = await make_request(method, params)
+            except Exception:
+                record_response(method, params, start, failed=True)
+                raise
+            record_response(method, params, start, response)
+            return response
+        return middleware
+
+    async def async_wrap_make_batch_request(self, make_batch_request):
+        async def middleware(requests_info):
+            start = time.perf_counter()
+            responses = None
+            try:
+                responses = await make_batch_request(requests_info)
+            finally:
+                record_batch(requests_info, start, responses)
+            return responses
+        return middleware
+
+def instrument(web3):
+    """Add the RPC instrumentation middleware to a Web3 or AsyncWeb3 client once."""
+    if 'rpc_instrumentation' not in web3.middleware_onion:
+        web3.middleware_onion.add(RpcInstrumentationMiddleware, 'rpc_instrumentation')
+    return web3
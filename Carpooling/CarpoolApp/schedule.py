@@ -0,0 +1,187 @@
+import bisect, heapq, threading
+from datetime import date, datetime, time, timedelta
+from typing import NamedTuple
+from django.conf import settings
+import logging
+from .records import Ride, load_table
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RIDE_TIME = time(12, 0)
+ONE_DAY = timedelta(days=1)
+
+# Recurrence rule -> weekdays it runs on (Monday is 0); the anchor's own
+# weekday for 'weekly'. 'monthly' runs on the anchor's day of the month.
+WEEKDAY_RULES = {
+    'daily': range(7),
+    'weekdays': range(5),
+    'weekends': (5, 6),
+}
+
+class Occurrence(NamedTuple):
+    """One concrete departure of a (possibly recurring) ride."""
+    start: datetime
+    ride: Ride
+
+    def as_ride(self):
+        """Return the ride with `date` set to this occurrence's date."""
+        return self.ride._replace(date=self.start.date().isoformat(), raw=None)
+
+def schedule_window_days():
+    """Return the default length of a schedule query from settings."""
+    return getattr(settings, 'SCHEDULE_WINDOW_DAYS', 7)
+
+def ride_anchor(ride):
+    """Return (first departure, rule) for a ride, or None if its date is unusable."""
+    try:
+        day = date.fromisoformat(ride.date)
+    except (TypeError, ValueError):
+        return None
+    try:
+        at = time.fromisoformat(ride.time) if ride.time else DEFAULT_RIDE_TIME
+    except ValueError:
+        at = DEFAULT_RIDE_TIME
+    return datetime.combine(day, at), (ride.recurring or 'none')
+
+def runs_on(rule, anchor, day):
+    """Return True if a ride with this rule and first departure runs on `day`."""
+    if day < anchor.date():
+        return False
+    if rule == 'weekly':
+        return day.weekday() == anchor.weekday()
+    if rule == 'monthly':
+        return day.day == anchor.day
+    if rule in WEEKDAY_RULES:
+        return day.weekday() in WEEKDAY_RULES[rule]
+    return day == anchor.date()
+
+def occurrences(ride, start, end=None):
+    """Yield the departures of a ride in [start, end), in order.
+
+    Generated one at a time, so an open-ended window (`end=None`) is fine
+    as long as the caller stops reading.
+    """
+    anchor = ride_anchor(ride)
+    if anchor is None:
+        return
+    anchor, rule = anchor
+    if rule not in WEEKDAY_RULES and rule not in ('weekly', 'monthly'):
+        if start <= anchor and (end is None or anchor < end):
+            yield Occurrence(anchor, ride)
+        return
+
+    day = max(anchor.date(), start.date())
+    step = ONE_DAY
+    if rule == 'weekly':
+        day += timedelta(days=(anchor.weekday() - day.weekday()) % 7)
+        step = timedelta(days=7)
+    while True:
+        when = datetime.combine(day, anchor.time())
+        if end is not None and when >= end:
+            return
+        if when >= start and runs_on(rule, anchor, day):
+            yield Occurrence(when, ride)
+        day += step
+
+def merge_occurrences(matches, start, end=None):
+    """Yield (occurrence, miles) for (miles, ride) search matches, earliest first.
+
+    Each ride's series is expanded lazily and the series are merged, so
+    the cost follows the number of occurrences read, not the window size.
+    """
+    def series(seq, miles, ride):
+        for occurrence in occurrences(ride, start, end):
+            yield occurrence.start, seq, occurrence, miles
+    merged = heapq.merge(*(series(seq, miles, ride) for seq, (miles, ride) in enumerate(matches)))
+    for when, seq, occurrence, miles in merged:
+        yield occurrence, miles
+
+# -------------------- Ride Schedule Index --------------------
+
+class RideScheduleIndex:
+    """Waiting rides bucketed by the days they run on.
+
+    One-off rides sit in a bucket per date, weekly/weekday/daily rides in a
+    bucket per weekday and monthly rides in a bucket per day of the month.
+    A window query walks its days and only looks at those buckets, jumping
+    straight between dated buckets when there are no recurring rides, so
+    it never scans the ride table. It is rebuilt when a new ride blob
+    version shows up; the views add rides as they write them.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dates = {}      # date -> [(anchor, seq, ride)]
+        self._sorted_dates = []
+        self._weekdays = {}   # weekday -> [(anchor, seq, rule, ride)]
+        self._monthdays = {}  # day of month -> [(anchor, seq, ride)]
+        self._seq = 0
+        self._table = None
+
+    def _put(self, ride):
+        anchor = ride_anchor(ride)
+        if anchor is None:
+            return
+        anchor, rule = anchor
+        self._seq += 1
+        if rule == 'monthly':
+            self._monthdays.setdefault(anchor.day, []).append((anchor, self._seq, ride))
+        elif rule == 'weekly' or rule in WEEKDAY_RULES:
+            for weekday in WEEKDAY_RULES.get(rule, (anchor.weekday(),)):
+                self._weekdays.setdefault(weekday, []).append((anchor, self._seq, rule, ride))
+        else:
+            day = anchor.date()
+            if day not in self._dates:
+                bisect.insort(self._sorted_dates, day)
+            self._dates.setdefault(day, []).append((anchor, self._seq, ride))
+
+    def add(self, ride):
+        """Index a newly created waiting ride."""
+        if ride.status == 'waiting':
+            with self._lock:
+                self._put(ride)
+
+    def sync(self, table):
+        """Rebuild from a ride table."""
+        with self._lock:
+            self._dates, self._sorted_dates, self._weekdays, self._monthdays = {}, [], {}, {}
+            self._seq = 0
+            for ride in table.lookup('status', 'waiting'):
+                self._put(ride)
+            self._table = table
+
+    def refresh(self, table=None):
+        """Rebuild if the ride table (or `table`) changed since the last call."""
+        table = table if table is not None else load_table('ride')
+        if table is not self._table:
+            self.sync(table)
+
+    def _day(self, day, start, end):
+        with self._lock:
+            due = [(datetime.combine(day, anchor.time()), seq, ride)
+                   for anchor, seq, rule, ride in self._weekdays.get(day.weekday(), ())
+                   if anchor.date() <= day]
+            due += [(datetime.combine(day, anchor.time()), seq, ride)
+                    for anchor, seq, ride in self._monthdays.get(day.day, ()) if anchor.date() <= day]
+            due += [(anchor, seq, ride) for anchor, seq, ride in self._dates.get(day, ())]
+        due.sort(key=lambda item: item[:2])
+        for when, seq, ride in due:
+            if start <= when and (end is None or when < end):
+                yield Occurrence(when, ride)
+
+    def _next_day(self, day):
+        with self._lock:
+            if self._weekdays or self._monthdays:
+                return day + ONE_DAY
+            i = bisect.bisect_right(self._sorted_dates, day)
+            return self._sorted_dates[i] if i < len(self._sorted_dates) else None
+
+    def iter_window(self, start, end=None, table=None):
+        """Yield the Occurrences of waiting rides in [start, end), earliest first."""
+        self.refresh(table)
+        day = start.date()
+        while day is not None and (end is None or datetime.combine(day, time()) < end):
+            yield from self._day(day, start, end)
+            day = self._next_day(day)
+
+ride_schedule = RideScheduleIndex()
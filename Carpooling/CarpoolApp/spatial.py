@@ -0,0 +1,190 @@
+import math, threading
+import numpy as np
+from django.conf import settings
+from geopy.distance import geodesic
+import logging
+from .records import load_table
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_MILES = 3958.7613
+# Shortest degree of latitude (at the equator), so the box never undershoots
+MILES_PER_DEGREE_LAT = 68.7
+# Haversine on a sphere differs from the WGS-84 geodesic by under 0.6%,
+# so anything this much past the radius can be dropped without the exact check.
+HAVERSINE_SLACK = 1.01
+
+def search_radius_miles():
+    """Return the default ride search radius from settings."""
+    return getattr(settings, 'RIDE_SEARCH_RADIUS_MILES', 3)
+
+def haversine_miles_vec(lat, lon, lats, lons):
+    """Haversine miles from one point (degrees) to arrays of points (degrees).
+
+    Matches geopy's WGS-84 geodesic() within 0.6%.
+    """
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlam = np.radians(lons) - np.radians(lon)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def bounding_box(lat, lon, radius_miles):
+    """Return (min_lat, max_lat, min_lon, max_lon) enclosing the radius."""
+    dlat = radius_miles / MILES_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180.0 if cos_lat < 1e-6 else min(180.0, dlat / cos_lat)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+def longitude_ranges(min_lon, max_lon):
+    """Split a bounding box's longitude span into [(lo, hi)] within [-180, 180].
+
+    A box crossing the antimeridian becomes one range on each side of it.
+    """
+    if max_lon - min_lon >= 360.0:
+        return [(-180.0, 180.0)]
+    if min_lon < -180.0:
+        return [(min_lon + 360.0, 180.0), (-180.0, max_lon)]
+    if max_lon > 180.0:
+        return [(min_lon, 180.0), (-180.0, max_lon - 360.0)]
+    return [(min_lon, max_lon)]
+
+# -------------------- Ride Spatial Index --------------------
+
+class RideSpatialIndex:
+    """Grid buckets of waiting rides keyed by (lat, long) cell.
+
+    A search only visits the cells overlapping the query's bounding box,
+    drops candidates with one vectorized haversine pass and runs geodesic()
+    only on the few left inside the radius. The views add and discard
+    rides as they write them; `refresh()` reconciles against the ride table
+    when a new blob version shows up, touching only rides that changed.
+    """
+
+    def __init__(self, cell_degrees=None):
+        self.cell_degrees = cell_degrees or getattr(settings, 'RIDE_INDEX_CELL_DEGREES', 0.05)
+        self._lock = threading.RLock()
+        self._cells = {}     # (i, j) -> {ride_id: entry}
+        self._entries = {}   # ride_id -> (seq, cell, lat, lon, rides)
+        self._seq = 0
+        self._table = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    def _put(self, ride_id, rides, seq=None):
+        try:
+            lat, lon = float(rides[0].lat), float(rides[0].long)
+        except (TypeError, ValueError):
+            return
+        self._remove(ride_id)
+        if seq is None:
+            self._seq += 1
+            seq = self._seq
+        cell = self._cell(lat, lon)
+        entry = (seq, cell, lat, lon, tuple(rides))
+        self._entries[ride_id] = entry
+        self._cells.setdefault(cell, {})[ride_id] = entry
+
+    def _remove(self, ride_id):
+        entry = self._entries.pop(ride_id, None)
+        if entry:
+            bucket = self._cells.get(entry[1])
+            if bucket is not None:
+                bucket.pop(ride_id, None)
+                if not bucket:
+                    del self._cells[entry[1]]
+
+    def add(self, ride):
+        """Index a newly created waiting ride."""
+        if ride.status != 'waiting':
+            return
+        with self._lock:
+            entry = self._entries.get(ride.ride_id)
+            rides = (entry[4] if entry else ()) + (ride,)
+            self._put(ride.ride_id, rides)
+
+    def discard(self, ride_id):
+        """Remove a ride that is no longer waiting."""
+        with self._lock:
+            self._remove(ride_id)
+
+    def sync(self, table):
+        """Reconcile with a ride table, only touching rides that changed."""
+        with self._lock:
+            waiting = {}
+            for ride in table.lookup('status', 'waiting'):
+                waiting.setdefault(ride.ride_id, []).append(ride)
+
+            for ride_id in [rid for rid in self._entries if rid not in waiting]:
+                self._remove(ride_id)
+            for ride_id, rides in waiting.items():
+                entry = self._entries.get(ride_id)
+                if entry is None or entry[4] != tuple(rides):
+                    self._put(ride_id, rides, seq=entry[0] if entry else None)
+            self._table = table
+
+    def refresh(self, table=None):
+        """Sync with the current ride table (or `table`) if it changed since the last call.
+
+        Async views pass the table they loaded so no blocking read happens here.
+        """
+        table = table if table is not None else load_table('ride')
+        if table is not self._table:
+            self.sync(table)
+
+    def _buckets(self, min_lat, max_lat, min_lon, max_lon):
+        """Return the non-empty cells overlapping a box; call with the lock held."""
+        i0, j0 = self._cell(min_lat, min_lon)
+        i1, j1 = self._cell(max_lat, max_lon)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._cells):
+            return [b for (i, j), b in self._cells.items() if i0 <= i <= i1 and j0 <= j <= j1]
+        return [self._cells[(i, j)] for i in range(i0, i1 + 1)
+                for j in range(j0, j1 + 1) if (i, j) in self._cells]
+
+    def candidates(self, lat, lon, radius_miles):
+        """Yield (seq, cell, lat, lon, rides) entries inside the bounding box.
+
+        Near the antimeridian the box is searched as two longitude ranges.
+        """
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_miles)
+        ranges = longitude_ranges(min_lon, max_lon)
+        with self._lock:
+            entries = [entry for lo, hi in ranges for bucket in self._buckets(min_lat, max_lat, lo, hi)
+                       for entry in bucket.values()]
+        for entry in entries:
+            if min_lat <= entry[2] <= max_lat and any(lo <= entry[3] <= hi for lo, hi in ranges):
+                yield entry
+
+    def iter_search(self, lat, lon, radius_miles=None, table=None):
+        """Yield (miles, ride) for waiting rides within the radius, in blob order.
+
+        Candidates are prefiltered in one vectorized pass; geodesic() runs
+        lazily as the caller consumes results, so a client that stops after
+        one page never pays for the rest.
+        """
+        if radius_miles is None:
+            radius_miles = search_radius_miles()
+        self.refresh(table)
+        entries = sorted(self.candidates(lat, lon, radius_miles), key=lambda entry: entry[0])
+        if not entries:
+            return
+        lats = np.fromiter((entry[2] for entry in entries), dtype=np.float64, count=len(entries))
+        lons = np.fromiter((entry[3] for entry in entries), dtype=np.float64, count=len(entries))
+        near = haversine_miles_vec(lat, lon, lats, lons) <= radius_miles * HAVERSINE_SLACK
+        for i in np.flatnonzero(near):
+            seq, cell, ride_lat, ride_lon, rides = entries[i]
+            miles = geodesic((lat, lon), (ride_lat, ride_lon)).miles
+            if miles <= radius_miles:
+                for ride in rides:
+                    yield miles, ride
+
+    def search(self, lat, lon, radius_miles=None):
+        """Return [(miles, ride)] for waiting rides within the radius, in blob order."""
+        return list(self.iter_search(lat, lon, radius_miles))
+
+ride_index = RideSpatialIndex()
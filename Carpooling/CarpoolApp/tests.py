@@ -1,3 +1,614 @@
-from django.test import TestCase
+import math
+from datetime import datetime
+from geopy.distance import geodesic
+import asyncio, threading
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User as DjangoUser
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from web3.exceptions import ContractLogicError
+from . import asyncchain, blobcache, chain, codec
+from .balances import BalanceService
+from .credentials import CredentialIndex
+from .blobcache import WriteConflict, update_blob, update_blobs
+from .dispatch import (Assignment, Dispatcher, free_seats, greedy_assignment, min_cost_assignment,
+                       ride_seats, seats_left)
+from .distribution import token_distributor
+from .models import Credential, DispatchRequest, DistributionChunk, TokenTransfer, Wallet
+from .payments import PaymentSettler
+from .records import (PassengerRequest, PassengerTable, Rating, Ride, RideTable, User, UserTable,
+                      parse_record, record_to_row)
+from .matching import RideMatcher
+from .updates import passenger_deltas, sse_message
+from .wallets import WalletRegistry
+from .spatial import RideSpatialIndex, longitude_ranges
+from .schedule import RideScheduleIndex, merge_occurrences, occurrences
+from .views import schedule_window
 
-# Create your tests here.
+ADDRESS = '0x5B38Da6a701c568545dCfcB03FcB875f56beddC4'
+TX_HASH = '0x' + 'ab' * 32
+
+def blockchain(**overrides):
+    """Return settings.BLOCKCHAIN with some keys replaced, for override_settings."""
+    return {**settings.BLOCKCHAIN, **overrides}
+
+# -------------------- Record codec --------------------
+
+class RecordCodecTests(SimpleTestCase):
+    def assertRoundTrip(self, record):
+        row = record_to_row(record)
+        parsed = parse_record(type(record), row)
+        self.assertEqual(parsed._replace(raw=None), record._replace(raw=None))
+        return row
+
+    def test_compact_rows_round_trip(self):
+        records = [
+            User('alice', 's3cret', '555-0100', 'a@example.com', 'Civic', 'Driver', ADDRESS),
+            Ride('12', 'alice', 'Main St', '40.7128', '-74.006', '3', '2026-10-20', 'waiting', '08:30', 'weekly'),
+            PassengerRequest('7', '12', 'alice', 'bob', '4.5', '9', TX_HASH, '0', 'paid'),
+        ]
+        with override_settings(BLOCKCHAIN=blockchain(RECORD_ENCODING='compact')):
+            for record in records:
+                with self.subTest(record=type(record).__name__):
+                    self.assertRoundTrip(record)
+
+    def test_text_rows_round_trip(self):
+        ride = Ride('12', 'alice', 'Main St', '40.7128', '-74.006', '3', '2026-10-20', 'waiting')
+        with override_settings(BLOCKCHAIN=blockchain(RECORD_ENCODING='text')):
+            self.assertEqual(self.assertRoundTrip(ride), '12#alice#Main St#40.7128#-74.006#3#2026-10-20#waiting')
+
+    def test_numeric_fields_are_written_as_text(self):
+        # schedule_ride passes lat/lng/seats as JSON numbers
+        ride = Ride('1', 'alice', 'Main St', 40.7, -73.9, 3, '2026-10-20', 'waiting')
+        for encoding in ('text', 'compact'):
+            with self.subTest(encoding=encoding), override_settings(BLOCKCHAIN=blockchain(RECORD_ENCODING=encoding)):
+                parsed = parse_record(Ride, record_to_row(ride))
+                self.assertEqual((parsed.lat, parsed.long, parsed.seats), ('40.7', '-73.9', '3'))
+
+    def test_values_outside_their_type_fall_back_to_strings(self):
+        # Not a decimal, not an enum value, lower-case address: all must survive unchanged
+        values = ['12', 'alice', 'Main St', 'north-ish', '-74.0060', '3', 'soon', 'parked', '8h', 'fortnightly']
+        name, decoded, extras = codec.decode_row(codec.encode_row(Ride, values))
+        self.assertEqual((name, decoded, extras), ('Ride', values, []))
+        user = ['bob', 'pw', None, None, None, 'Passenger', ADDRESS.lower()]
+        self.assertEqual(codec.decode_row(codec.encode_row(User, user))[1], user)
+
+    def test_extra_legacy_columns_are_kept(self):
+        row = '12#alice#Main St#40.7#-74.0#3#2026-10-20#waiting#08:30#none#legacy1#legacy2'
+        ride = parse_record(Ride, row)
+        with override_settings(BLOCKCHAIN=blockchain(RECORD_ENCODING='compact')):
+            compact = record_to_row(ride._replace(status='completed'))
+        self.assertTrue(codec.is_compact(compact))
+        self.assertEqual(codec.decode_row(compact)[2], ['legacy1', 'legacy2'])
+
+    def test_smallest_form_is_compact_when_text_cannot_hold_the_row(self):
+        values = ['bob', 'alice', 'great#driver']
+        row = codec.encode_smallest(Rating, values)
+        self.assertTrue(codec.is_compact(row))
+        self.assertEqual(codec.decode_row(row)[1], values)
+
+    def test_garbled_compact_row_is_parsed_as_text(self):
+        ride = parse_record(Ride, '~!!!:12')
+        self.assertEqual(ride.ride_id, '~!!!:12')
+
+# -------------------- Compare-and-set writes --------------------
+
+class UpdateBlobTests(SimpleTestCase):
+    def setUp(self):
+        self.contract = mock.MagicMock()
+        self.web3 = mock.MagicMock()
+        self.web3.eth.wait_for_transaction_receipt.return_value = {'status': 1}
+        self.sent = []
+        patches = [
+            mock.patch.object(blobcache, 'load_contract', return_value=(self.contract, self.web3)),
+            mock.patch.object(blobcache, 'has_function', return_value=True),
+            mock.patch.object(blobcache, 'notify_write'),
+            mock.patch.object(blobcache.nonce_manager, 'send', side_effect=self.send),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.conflicts = 0
+
+    def send(self, web3, function_call):
+        self.sent.append(function_call)
+        if len(self.sent) <= self.conflicts:
+            raise ContractLogicError('execution reverted: version conflict')
+        return b'\x01' * 32
+
+    def reads(self, *versions):
+        self.contract.functions.getPassengersVersioned.return_value.call.side_effect = list(versions)
+
+    def test_conflict_reapplies_the_change_to_a_fresh_read(self):
+        self.conflicts = 1
+        self.reads(('a\n', 1), ('a\nb\n', 2))
+        updated, tx_hash = update_blob('passengers', lambda blob: blob + 'c\n')
+        self.assertEqual(updated, 'a\nb\nc\n')
+        calls = self.contract.functions.setPassengersIfVersion.call_args_list
+        self.assertEqual([c.args for c in calls], [('a\nc\n', 1), ('a\nb\nc\n', 2)])
+
+    def test_reverted_receipt_is_retried(self):
+        self.reads(('a\n', 1), ('a\nb\n', 2))
+        self.web3.eth.wait_for_transaction_receipt.side_effect = [{'status': 0}, {'status': 1}]
+        updated, tx_hash = update_blob('passengers', lambda blob: blob + 'c\n')
+        self.assertEqual(updated, 'a\nb\nc\n')
+        self.assertEqual(len(self.sent), 2)
+
+    @override_settings(BLOCKCHAIN=blockchain(CAS_RETRIES=2))
+    def test_write_conflict_after_the_retries_run_out(self):
+        self.conflicts = 10
+        self.reads(*[('a\n', version) for version in range(3)])
+        with self.assertRaises(WriteConflict):
+            update_blob('passengers', lambda blob: blob + 'c\n')
+        self.assertEqual(len(self.sent), 3)
+
+    def test_other_reverts_are_not_retried(self):
+        self.reads(('a\n', 1))
+        blobcache.nonce_manager.send.side_effect = ContractLogicError('execution reverted: not owner')
+        with self.assertRaises(ContractLogicError):
+            update_blob('passengers', lambda blob: blob)
+
+    def test_several_tables_are_written_in_one_multicall(self):
+        self.conflicts = 1
+        self.reads(('a\n', 1), ('a\nb\n', 2))
+        self.contract.functions.getRideVersioned.return_value.call.side_effect = [('r\n', 7), ('r\n', 7)]
+        self.contract.encode_abi.side_effect = lambda name, args: '0x' + f'{name}:{args}'.encode().hex()
+        updated, tx_hash = update_blobs([('passengers', lambda blob: blob + 'c\n'),
+                                         ('ride', lambda blob: blob.upper())])
+        self.assertEqual(updated, ['a\nb\nc\n', 'R\n'])
+        self.assertEqual(len(self.sent), 2)
+        batch = self.contract.functions.multicall.call_args.args[0]
+        self.assertEqual([call.decode() for call in batch],
+                         ["setPassengersIfVersion:['a\\nb\\nc\\n', 2]", "setRideIfVersion:['R\\n', 7]"])
+        self.contract.functions.setPassengersIfVersion.assert_not_called()
+
+# -------------------- Schedule expansion --------------------
+
+def ride(date, time='08:00', recurring='none', ride_id='1'):
+    return Ride(ride_id, 'alice', 'Main St', '40.7', '-74.0', '3', date, 'waiting', time, recurring)
+
+def departures(ride, start, end):
+    return [o.start for o in occurrences(ride, start, end)]
+
+class ScheduleTests(SimpleTestCase):
+    def test_one_off_ride_inside_and_outside_the_window(self):
+        r = ride('2026-10-20')
+        self.assertEqual(departures(r, datetime(2026, 10, 20), datetime(2026, 10, 21)), [datetime(2026, 10, 20, 8)])
+        self.assertEqual(departures(r, datetime(2026, 10, 20, 9), datetime(2026, 10, 21)), [])
+
+    def test_window_includes_start_and_excludes_end(self):
+        r = ride('2026-10-19', recurring='daily')
+        found = departures(r, datetime(2026, 10, 20, 8), datetime(2026, 10, 22, 8))
+        self.assertEqual(found, [datetime(2026, 10, 20, 8), datetime(2026, 10, 21, 8)])
+
+    def test_weekly_runs_on_the_anchor_weekday(self):
+        r = ride('2026-10-20', recurring='weekly')   # a Tuesday
+        found = departures(r, datetime(2026, 10, 1), datetime(2026, 11, 11))
+        self.assertEqual(found, [datetime(2026, 10, 20, 8), datetime(2026, 10, 27, 8),
+                                 datetime(2026, 11, 3, 8), datetime(2026, 11, 10, 8)])
+
+    def test_monthly_skips_months_without_the_day(self):
+        r = ride('2026-01-31', recurring='monthly')
+        found = departures(r, datetime(2026, 1, 1), datetime(2026, 6, 1))
+        self.assertEqual([d.date().isoformat() for d in found], ['2026-01-31', '2026-03-31', '2026-05-31'])
+
+    def test_weekday_rules(self):
+        start, end = datetime(2026, 10, 19), datetime(2026, 10, 26)   # Monday to Monday
+        weekdays = departures(ride('2026-10-01', recurring='weekdays'), start, end)
+        weekends = departures(ride('2026-10-01', recurring='weekends'), start, end)
+        self.assertEqual([d.weekday() for d in weekdays], [0, 1, 2, 3, 4])
+        self.assertEqual([d.weekday() for d in weekends], [5, 6])
+
+    def test_unusable_date_has_no_departures(self):
+        self.assertEqual(departures(ride('someday', recurring='daily'), datetime(2026, 1, 1), datetime(2027, 1, 1)), [])
+
+    def test_merge_is_earliest_first(self):
+        matches = [(1.0, ride('2026-10-20', '09:00', 'daily', '1')), (2.0, ride('2026-10-20', '07:00', 'daily', '2'))]
+        merged = merge_occurrences(matches, datetime(2026, 10, 20), datetime(2026, 10, 22))
+        self.assertEqual([(o.ride.ride_id, o.start.hour) for o, miles in merged],
+                         [('2', 7), ('1', 9), ('2', 7), ('1', 9)])
+
+    def test_index_matches_per_ride_expansion(self):
+        rides = [ride('2026-10-20', '09:00', 'weekly', '1'), ride('2026-10-31', '10:00', 'monthly', '2'),
+                 ride('2026-10-22', '07:30', 'none', '3'), ride('2026-10-18', '18:00', 'weekends', '4')]
+        table = RideTable(''.join(record_to_row(r) + '\n' for r in rides))
+        start, end = datetime(2026, 10, 19), datetime(2026, 12, 31)
+        expected = sorted((o.start, o.ride.ride_id) for r in table for o in occurrences(r, start, end))
+        found = [(o.start, o.ride.ride_id) for o in RideScheduleIndex().iter_window(start, end, table=table)]
+        self.assertEqual(found, expected)
+
+    @override_settings(SCHEDULE_WINDOW_DAYS=3)
+    def test_window_without_end_is_bounded(self):
+        start, end = schedule_window(QueryDict('from=2026-10-20'))
+        self.assertEqual((start, end), (datetime(2026, 10, 20), datetime(2026, 10, 23)))
+        self.assertEqual(schedule_window(QueryDict('to=2026-10-20'))[1], datetime(2026, 10, 21))
+        self.assertIsNone(schedule_window(QueryDict('')))
+        with self.assertRaises(ValueError):
+            schedule_window(QueryDict('from=tomorrow'))
+
+# -------------------- Assignment and seats --------------------
+
+class AssignmentTests(SimpleTestCase):
+    def test_min_cost_seats_the_passenger_greedy_strands(self):
+        edges = [(1.0, 'p0', 'r0'), (2.0, 'p0', 'r1'), (1.5, 'p1', 'r0')]
+        capacity = {'r0': 1, 'r1': 1}
+        self.assertEqual(greedy_assignment(edges, capacity), {'p0': ('r0', 1.0)})
+        self.assertEqual(min_cost_assignment(edges, capacity), {'p0': ('r1', 2.0), 'p1': ('r0', 1.5)})
+
+    def test_min_cost_minimizes_total_miles(self):
+        edges = [(1.0, 'p0', 'r0'), (5.0, 'p0', 'r1'), (2.0, 'p1', 'r0'), (3.0, 'p1', 'r1')]
+        assigned = min_cost_assignment(edges, {'r0': 1, 'r1': 1})
+        self.assertEqual(assigned, {'p0': ('r0', 1.0), 'p1': ('r1', 3.0)})
+
+    def test_capacity_limits_and_unlimited_rides(self):
+        edges = [(1.0, 'p0', 'r0'), (2.0, 'p1', 'r0'), (3.0, 'p2', 'r0')]
+        self.assertEqual(len(min_cost_assignment(edges, {'r0': 2})), 2)
+        self.assertEqual(len(min_cost_assignment(edges, {'r0': math.inf})), 3)
+        self.assertEqual(min_cost_assignment(edges, {'r0': 0}), {})
+        self.assertEqual(min_cost_assignment([], {'r0': 1}), {})
+
+class RideSeatsTests(SimpleTestCase):
+    def test_seat_counts(self):
+        cases = {'3': 3, '2.0': 2, '0': 0, '-1': 0, '': None, None: None, 'three': None}
+        for seats, expected in cases.items():
+            with self.subTest(seats=seats):
+                self.assertEqual(ride_seats(Ride('1', seats=seats)), expected)
+
+    def test_seats_left(self):
+        self.assertEqual(seats_left(3, 1), 2)
+        self.assertEqual(seats_left(2, 2), 0)
+        self.assertEqual(seats_left(None, 50), math.inf)
+
+    def test_free_seats(self):
+        rides = RideTable('1#a#x#0#0#2#2026-10-20#waiting\n'
+                          '2#a#x#0#0#1#2026-10-20#waiting\n'
+                          '3#a#x#0#0##2026-10-20#waiting\n'
+                          '4#a#x#0#0#4#2026-10-20#completed\n')
+        passengers = PassengerTable('1#1#a#p#0#0#0#0#waiting\n'
+                                    '2#2#a#q#0#0#0#0#accepted\n'
+                                    '3#2#a#r#0#0#0#0#cancelled\n')
+        free = {ride_id: seats for ride_id, (ride, seats) in free_seats(rides, passengers).items()}
+        self.assertEqual(free, {'1': 1, '3': math.inf})
+
+class DispatcherRunTests(TestCase):
+    def setUp(self):
+        self.blob = ''
+        rides = RideTable('1#alice#x#40.7#-74.0#2#2026-10-20#waiting\n')
+        patches = [
+            mock.patch('CarpoolApp.dispatch.load_table', return_value=rides),
+            mock.patch('CarpoolApp.dispatch.update_blob', side_effect=self.update_blob),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def update_blob(self, contract_type, mutate, wait=True):
+        self.blob = mutate(self.blob)
+        return self.blob, TX_HASH
+
+    def test_request_cancelled_during_the_run_is_not_seated(self):
+        kept = DispatchRequest.objects.create(passenger='bob', lat=40.7, long=-74.0)
+        cancelled = DispatchRequest.objects.create(passenger='carol', lat=40.7, long=-74.0)
+        plan = [Assignment(kept, '1', 'alice', 0.1), Assignment(cancelled, '1', 'alice', 0.2)]
+        def plan_then_cancel(requests):
+            DispatchRequest.objects.filter(pk=cancelled.pk).update(status='cancelled')
+            return plan
+        with mock.patch.object(Dispatcher, 'plan', side_effect=plan_then_cancel):
+            written = Dispatcher().run()
+        self.assertEqual([a.request.passenger for a in written], ['bob'])
+        self.assertEqual([row.passenger for row in PassengerTable(self.blob)], ['bob'])
+        self.assertEqual(DispatchRequest.objects.get(pk=cancelled.pk).status, 'cancelled')
+        self.assertEqual(DispatchRequest.objects.get(pk=kept.pk).status, 'assigned')
+
+# -------------------- Bulk distribution --------------------
+
+OTHER = '0xAb8483F64d9C6d1EcF9b849Ae677dD3315835cb2'
+
+class DistributionTests(TestCase):
+    def setUp(self):
+        self.contract = mock.MagicMock()
+        self.web3 = mock.MagicMock()
+        self.web3.eth.block_number = 1234
+        patch = mock.patch.object(token_distributor, '_function',
+                                  return_value=(self.contract, self.web3, mock.MagicMock()))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_replanning_a_job_compares_the_entries(self):
+        entries = [(ADDRESS, 10), (OTHER, 20)]
+        chunks = token_distributor.plan('job', entries, chunk_size=1)
+        self.assertEqual([c.start_block for c in chunks], [1234, 1234])
+        self.assertEqual(len(token_distributor.plan('job', list(entries), chunk_size=5)), 2)
+        for changed in ([(ADDRESS, 10), (OTHER, 21)], [(OTHER, 20), (ADDRESS, 10)], [(ADDRESS, 10)]):
+            with self.subTest(entries=changed), self.assertRaises(ValueError):
+                token_distributor.plan('job', changed)
+        with self.assertRaises(ValueError):
+            token_distributor.plan('job', entries, mode='mint')
+
+    def test_batch_logs_are_read_from_the_planned_block(self):
+        chunk = token_distributor.plan('job', [(ADDRESS, 10)], chunk_size=1)[0]
+        self.contract.functions.batchDone.return_value.call.return_value = True
+        get_logs = self.contract.events.BatchDistributed.return_value.get_logs
+        get_logs.return_value = [{'args': {'count': 1, 'total': 10}}]
+        self.assertTrue(token_distributor._distributed(self.contract, ADDRESS, chunk, [10]))
+        self.assertEqual(get_logs.call_args.kwargs['from_block'], 1234)
+
+    def test_endpoints_are_staff_only(self):
+        body = '{"entries": [["%s", "1"]]}' % ADDRESS
+        self.assertEqual(self.client.post('/bulk_distribute_tokens/', body, content_type='application/json').status_code, 403)
+        self.assertEqual(self.client.get('/distribution_status/job/').status_code, 403)
+        self.client.force_login(DjangoUser.objects.create(username='admin', is_staff=True))
+        with mock.patch.object(token_distributor, 'run_in_background') as run:
+            response = self.client.post('/bulk_distribute_tokens/', body, content_type='application/json')
+        self.assertEqual(response.json()['recipients'], 1)
+        run.assert_called_once_with(response.json()['job'])
+        self.assertEqual(self.client.get(f"/distribution_status/{response.json()['job']}/").json()['chunks'], 1)
+        self.assertFalse(DistributionChunk.objects.exclude(status='pending').exists())
+
+# -------------------- Ride search --------------------
+
+def waiting_rides(*points):
+    """Return a RideTable with one waiting ride per (lat, lon), ids from 1."""
+    return RideTable(''.join(f'{n}#d{n}#x#{lat}#{lon}#3#2026-10-20#waiting\n'
+                             for n, (lat, lon) in enumerate(points, start=1)))
+
+class SpatialIndexTests(SimpleTestCase):
+    def test_longitude_ranges(self):
+        self.assertEqual(longitude_ranges(-10.0, 10.0), [(-10.0, 10.0)])
+        self.assertEqual(longitude_ranges(178.0, 182.0), [(178.0, 180.0), (-180.0, -178.0)])
+        self.assertEqual(longitude_ranges(-182.0, -178.0), [(178.0, 180.0), (-180.0, -178.0)])
+        self.assertEqual(longitude_ranges(-200.0, 200.0), [(-180.0, 180.0)])
+
+    def test_search_across_the_antimeridian(self):
+        table = waiting_rides((0.0, 179.99), (0.0, -179.99), (0.0, 179.0))
+        index = RideSpatialIndex()
+        for lon in (179.995, -179.995):
+            with self.subTest(lon=lon):
+                found = sorted(ride.ride_id for miles, ride in index.iter_search(0.0, lon, 3, table=table))
+                self.assertEqual(found, ['1', '2'])
+
+    def test_radius_and_status(self):
+        table = RideTable('1#a#x#40.7128#-74.0060#3#2026-10-20#waiting\n'
+                          '2#b#x#40.7580#-73.9855#3#2026-10-20#waiting\n'
+                          '3#c#x#40.7130#-74.0050#3#2026-10-20#completed\n')
+        index = RideSpatialIndex()
+        found = [(round(miles, 1), ride.ride_id) for miles, ride in index.iter_search(40.7128, -74.0060, 1, table=table)]
+        self.assertEqual(found, [(0.0, '1')])
+        self.assertEqual(len(list(index.iter_search(40.7128, -74.0060, 5, table=table))), 2)
+
+    def test_add_and_discard(self):
+        table = waiting_rides((10.0, 10.0))
+        index = RideSpatialIndex()
+        index.refresh(table)
+        index.add(Ride('9', 'e', 'x', '10.001', '10.001', '3', '2026-10-20', 'waiting'))
+        self.assertEqual([r.ride_id for m, r in index.iter_search(10.0, 10.0, 1, table=table)], ['1', '9'])
+        index.discard('1')
+        self.assertEqual([r.ride_id for m, r in index.iter_search(10.0, 10.0, 1, table=table)], ['9'])
+        # A new table version reconciles the index with it
+        self.assertEqual([r.ride_id for m, r in index.iter_search(10.0, 10.0, 1, table=waiting_rides((10.0, 10.0)))], ['1'])
+
+class RideMatcherTests(SimpleTestCase):
+    def setUp(self):
+        # Rides 1-4 run north from the origin, 0.5 to 2 miles apart in latitude
+        self.table = waiting_rides((0.0290, 0.0), (0.0072, 0.0), (0.0145, 0.0), (0.0217, 0.0), ('n/a', 0.0))
+        self.matcher = RideMatcher()
+
+    def test_nearest_first_within_the_radius(self):
+        found = self.matcher.nearest(0.0, 0.0, radius_miles=1.6, table=self.table)
+        self.assertEqual([ride.ride_id for miles, ride in found], ['2', '3', '4'])
+        for miles, ride in found:
+            self.assertAlmostEqual(miles, geodesic((0.0, 0.0), (float(ride.lat), 0.0)).miles)
+
+    def test_k_keeps_the_nearest(self):
+        found = self.matcher.nearest(0.0, 0.0, k=2, radius_miles=5, table=self.table)
+        self.assertEqual([ride.ride_id for miles, ride in found], ['2', '3'])
+        self.assertEqual(self.matcher.nearest(0.0, 0.0, k=0, radius_miles=5, table=self.table), [])
+
+    def test_nearest_many_matches_nearest(self):
+        queries = [(0.0, 0.0), (0.03, 0.0), (10.0, 10.0)]
+        batched = self.matcher.nearest_many(queries, radius_miles=1, table=self.table)
+        single = [self.matcher.nearest(lat, lon, radius_miles=1, table=self.table) for lat, lon in queries]
+        self.assertEqual(batched, single)
+        self.assertEqual(batched[2], [])
+
+    def test_distances_wrap_at_the_antimeridian(self):
+        found = self.matcher.nearest(0.0, 179.99, radius_miles=3, table=waiting_rides((0.0, -179.99)))
+        self.assertEqual(len(found), 1)
+        self.assertLess(found[0][0], 3)
+
+    def test_new_table_version_rebuilds_the_arrays(self):
+        self.matcher.nearest(0.0, 0.0, table=self.table)
+        self.assertEqual(len(self.matcher), 4)
+        self.matcher.nearest(0.0, 0.0, table=waiting_rides((0.0, 0.0)))
+        self.assertEqual(len(self.matcher), 1)
+
+# -------------------- Credentials --------------------
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CredentialIndexTests(TestCase):
+    def setUp(self):
+        self.index = CredentialIndex()
+        self.chain = UserTable('')
+        patch = mock.patch('CarpoolApp.credentials.load_table', side_effect=lambda contract_type: self.chain)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_authenticate(self):
+        self.index.add(User('alice', 's3cret', None, None, None, 'Driver', ADDRESS))
+        self.assertEqual(self.index.authenticate('alice', 's3cret').wallet, ADDRESS)
+        self.assertIsNone(self.index.authenticate('alice', 'wrong'))
+        self.assertIsNone(self.index.authenticate('nobody', 's3cret'))
+        self.assertIsNone(self.index.authenticate('alice', None))
+
+    def test_users_not_indexed_yet_are_read_from_the_chain(self):
+        self.chain = UserTable(record_to_row(User('dave', 'pw', user_type='Passenger')) + '\n')
+        self.assertIsNone(self.index.authenticate('dave', 'wrong'))
+        self.assertFalse(Credential.objects.filter(username='dave').exists())
+        self.assertEqual(self.index.authenticate('dave', 'pw').user_type, 'Passenger')
+        self.chain = UserTable('')
+        self.assertIsNotNone(self.index.authenticate('dave', 'pw'))
+
+    def test_first_registration_keeps_the_username(self):
+        self.index.add(User('alice', 'first'))
+        self.index.add(User('alice', 'second'))
+        self.assertIsNotNone(self.index.authenticate('alice', 'first'))
+        self.assertIsNone(self.index.authenticate('alice', 'second'))
+
+    def test_add_many_adds_and_rehashes_changed_passwords(self):
+        self.index.add(User('alice', 'old', user_type='Driver'))
+        added = self.index.add_many([User('alice', 'new', user_type='Driver'), User('bob', 'pw'),
+                                     User('bob', 'later'), User('carol')])
+        self.assertEqual(added, 2)
+        self.assertIsNotNone(self.index.authenticate('alice', 'new'))
+        self.assertIsNotNone(self.index.authenticate('bob', 'pw'))
+        self.assertFalse(Credential.objects.filter(username='carol').exists())
+        self.assertEqual(self.index.add_many([User('alice', 'new')]), 0)
+
+# -------------------- Wallets --------------------
+
+class WalletRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = WalletRegistry()
+        self.chain = UserTable(record_to_row(User('alice', 'pw', wallet=ADDRESS)) + '\n'
+                               + record_to_row(User('bob', 'pw', wallet=OTHER)) + '\n')
+        patch = mock.patch('CarpoolApp.wallets.load_table', side_effect=lambda contract_type: self.chain)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_unknown_username_is_read_from_the_chain_once(self):
+        self.assertEqual(self.registry.get('alice'), ADDRESS)
+        self.chain = UserTable('')
+        self.assertEqual(self.registry.get('alice'), ADDRESS)
+        self.assertIsNone(self.registry.get('nobody'))
+        self.assertIsNone(self.registry.get(''))
+
+    def test_warm_keeps_wallets_stored_at_login(self):
+        self.registry.store('bob', ADDRESS)
+        self.assertEqual(self.registry.warm(), 1)
+        self.assertEqual(dict(Wallet.objects.values_list('username', 'address')), {'alice': ADDRESS, 'bob': ADDRESS})
+        self.assertEqual(self.registry.warm(), 0)
+
+# -------------------- Token balances --------------------
+
+class BalanceCacheTests(SimpleTestCase):
+    @override_settings(BLOCKCHAIN=blockchain(BALANCE_TTL=15))
+    def test_expired_balances_are_evicted_on_write(self):
+        service = BalanceService()
+        with mock.patch('CarpoolApp.balances.time.monotonic') as clock:
+            for now, address in [(0, 'a'), (10, 'b'), (12, 'a'), (20, 'c')]:
+                clock.return_value = now
+                service.remember('token', address, now)
+            self.assertEqual(list(service._cache), [('token', 'b'), ('token', 'a'), ('token', 'c')])
+            self.assertEqual(service.cached('token', 'a'), 12)
+            clock.return_value = 26
+            service.remember('token', 'd', 26)
+            self.assertEqual(list(service._cache), [('token', 'a'), ('token', 'c'), ('token', 'd')])
+            clock.return_value = 100
+            service.remember('token', 'e', 100)
+            self.assertEqual(list(service._cache), [('token', 'e')])
+
+# -------------------- Payment settlement --------------------
+
+class PaymentSettlerTests(TestCase):
+    def setUp(self):
+        Wallet.objects.create(username='alice', address=ADDRESS.lower())
+        Wallet.objects.create(username='drv', address=OTHER)
+        for n, cpt in enumerate([5, 1, 7], start=1):
+            TokenTransfer.objects.create(tx_hash='0x' + f'{n:02x}' * 32, log_index=0, block_number=n,
+                                         sender=ADDRESS, recipient=OTHER, value=cpt * 10 ** 18)
+
+    def test_oldest_unclaimed_transfer_of_the_fare_pays_each_row(self):
+        passengers = PassengerTable('1#1#drv#alice#1#5#0#0#completed\n'
+                                    '2#2#drv#alice#1#1#0#0#completed\n'
+                                    '3#3#drv#alice#1#9#0#0#completed\n'
+                                    '4#4#drv#alice#1#6#0#0#completed\n'
+                                    '5#5#drv#bob#1#1#0#0#completed\n'
+                                    f"6#6#drv#alice#1#7#{'0x' + '03' * 32}#0#paid\n")
+        matches = PaymentSettler().match_pending(passengers)
+        self.assertEqual(matches, {('1', '1'): '0x' + '01' * 32, ('2', '2'): '0x' + '02' * 32})
+
+    def test_settle_marks_the_matched_rows_in_one_write(self):
+        blob = '1#1#drv#alice#1#5#0#0#completed\n2#2#drv#alice#1#5#0#0#waiting\n'
+        written = []
+        def write(contract_type, mutate):
+            written.append(mutate(blob))
+            return written[-1], TX_HASH
+        with mock.patch('CarpoolApp.payments.update_blob', side_effect=write):
+            marked = PaymentSettler().settle({('1', '1'): TX_HASH, ('2', '2'): TX_HASH})
+        [updated] = [PassengerTable(b) for b in written]
+        self.assertEqual(marked, 1)
+        self.assertEqual([(r.status, r.tx_hash) for r in updated], [('paid', TX_HASH), ('waiting', '0')])
+
+# -------------------- Pushed updates --------------------
+
+class UpdateEventTests(SimpleTestCase):
+    def test_passenger_deltas(self):
+        def rows(blob):
+            return {(r.passenger_id, r.ride_id): r for r in PassengerTable(blob)}
+        old = rows('1#1#drv#a#1#5#0#0#waiting\n2#1#drv#b#1#5#0#0#completed\n3#1#drv#c#1#5#0#0#waiting\n')
+        new = rows('1#1#drv#a#1#5#0#0#completed\n2#1#drv#b#1#5#0xab#0#paid\n'
+                   '3#1#drv#c#2#5#0#0#waiting\n4#1#drv#d#1#5#0#0#waiting\n')
+        events = [(event, req.passenger_id) for event, req in passenger_deltas(old, new)]
+        self.assertEqual(events, [('ride_completed', '1'), ('payment_confirmed', '2'),
+                                  ('request_updated', '3'), ('passenger_request', '4')])
+        self.assertEqual(list(passenger_deltas(new, new)), [])
+
+    def test_sse_message(self):
+        self.assertEqual(sse_message('resync', {}, event_id=3), 'id: 3\nevent: resync\ndata: {}\n\n')
+        self.assertEqual(sse_message('ping', [1]), 'event: ping\ndata: [1]\n\n')
+
+# -------------------- RPC sessions --------------------
+
+RPC_REPLY = b'{"jsonrpc": "2.0", "id": 0, "result": "0x539"}'
+
+class ProviderSessionTests(SimpleTestCase):
+    """Our session managers override web3 internals; these fail if an upgrade stops calling them."""
+
+    def test_sync_provider_shares_one_session_between_threads(self):
+        session = mock.MagicMock()
+        session.post.return_value.__enter__.return_value.content = RPC_REPLY
+        with mock.patch.object(chain, 'build_session', return_value=session):
+            provider = chain.build_provider()
+        self.assertIsInstance(provider._request_session_manager, chain.SharedSessionManager)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(provider.make_request('eth_chainId', [])))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([r['result'] for r in results], ['0x539', '0x539'])
+        self.assertEqual(session.post.call_count, 2)
+
+    def test_async_provider_keeps_one_session_per_loop(self):
+        def fake_session():
+            response = mock.MagicMock()
+            response.read = mock.AsyncMock(return_value=RPC_REPLY)
+            session = mock.MagicMock(closed=False)
+            session.post = mock.AsyncMock(return_value=response)
+            return session
+        with mock.patch.object(asyncchain, 'build_async_session', side_effect=fake_session) as build:
+            provider = asyncchain.build_async_provider()
+            self.assertIsInstance(provider._request_session_manager, asyncchain.LoopSessionManager)
+            async def call_twice():
+                return [(await provider.make_request('eth_blockNumber', []))['result'] for _ in range(2)]
+            self.assertEqual(asyncio.run(call_twice()), ['0x539', '0x539'])
+            self.assertEqual(build.call_count, 1)
+            asyncio.run(call_twice())
+            self.assertEqual(build.call_count, 2)
+
+# -------------------- Views --------------------
+
+class RatingsActionTests(TestCase):
+    def test_rating_is_written_in_the_background_and_tracked(self):
+        session = self.client.session
+        session['current_user'] = 'bob'
+        session.save()
+        with mock.patch('CarpoolApp.views.tx_tracker.submit_updates', return_value='job1') as submit, \
+                mock.patch('CarpoolApp.views.get_user_wallet_address', return_value=None), \
+                mock.patch('CarpoolApp.views.get_token_balance', return_value='0'):
+            response = self.client.post('/RatingsAction/', {'t1': 'alice', 't2': '5'})
+        [(contract_type, change)] = submit.call_args.args[0]
+        self.assertEqual((contract_type, change('')), ('ratings', record_to_row(Rating('bob', 'alice', '5')) + '\n'))
+        self.assertContains(response, "watchTransaction('job1')")
@@ -0,0 +1,155 @@
+import threading, uuid
+from concurrent.futures import ThreadPoolExecutor
+from web3 import Web3
+import logging
+from .blobcache import VERSIONED_WRITES, update_blobs
+from .chain import chain_setting, get_web3, group_writes, nonce_manager, notify_write
+
+logger = logging.getLogger(__name__)
+
+PENDING, MINED, FAILED = 'pending', 'mined', 'failed'
+
+def receipt_summary(receipt):
+    """Return the JSON-safe parts of a transaction receipt."""
+    return {
+        'tx_hash': Web3.to_hex(receipt['transactionHash']),
+        'block_number': receipt['blockNumber'],
+        'gas_used': receipt['gasUsed'],
+        'status': receipt['status'],
+    }
+
+# -------------------- Transaction Tracker --------------------
+
+class TransactionTracker:
+    """Submits transactions without holding the request for their receipts.
+
+    submit() sends the transactions in order from the calling thread with
+    consecutive nonces from chain.nonce_manager, stores a job under a fresh tracking
+    id and returns it at once; submit_updates() does the same for
+    compare-and-set table changes, which are sent from the pool. A small thread pool then waits for the
+    receipts and moves the job to mined/failed. Jobs live in Django's cache
+    (BLOCKCHAIN['TX_STATUS_ALIAS']) so any worker can answer tx_status.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[chain_setting('TX_STATUS_ALIAS')]
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=chain_setting('TX_WORKERS'),
+                                                        thread_name_prefix='tx-receipts')
+        return self._executor
+
+    def _key(self, tracking_id):
+        return f'carpool:tx:{tracking_id}'
+
+    def _save(self, job):
+        self.cache.set(self._key(job['id']), job, chain_setting('TX_STATUS_TTL'))
+
+    def status(self, tracking_id):
+        """Return the job stored under `tracking_id`, or None."""
+        return self.cache.get(self._key(tracking_id))
+
+    def submit(self, calls):
+        """Send [(contract_type, function_name, args), ...]; return a tracking id.
+
+        Calls on the same contract are folded into one multicall transaction
+        (see chain.group_writes) and sent with consecutive nonces.
+        """
+        job = {'id': uuid.uuid4().hex, 'status': PENDING, 'transactions': []}
+        sent = []
+        try:
+            writes = group_writes(calls)
+        except Exception as e:
+            logger.error(f"Preparing transactions failed: {e}")
+            writes = []
+            job.update(status=FAILED, error=str(e))
+        web3 = get_web3() if writes else None
+        for contract_types, labels, function_call in writes:
+            tx = {'calls': labels, 'status': PENDING}
+            job['transactions'].append(tx)
+            try:
+                tx_hash = nonce_manager.send(web3, function_call)
+            except Exception as e:
+                logger.error(f"Sending {', '.join(labels)} failed: {e}")
+                tx.update(status=FAILED, error=str(e))
+                job['status'] = FAILED
+                break
+            tx['tx_hash'] = Web3.to_hex(tx_hash)
+            sent.append((contract_types, tx_hash))
+        self._save(job)
+        if sent:
+            self.executor.submit(self._wait, job, sent)
+        return job['id']
+
+    def track(self, contract_type, label, tx_hash):
+        """Track a transaction that was already sent; return a tracking id."""
+        job = {'id': uuid.uuid4().hex, 'status': PENDING,
+               'transactions': [{'calls': [label], 'status': PENDING, 'tx_hash': Web3.to_hex(tx_hash)}]}
+        self._save(job)
+        self.executor.submit(self._wait, job, [([contract_type], tx_hash)])
+        return job['id']
+
+    def submit_updates(self, updates, on_mined=None):
+        """Apply [(contract_type, mutate), ...] with update_blobs() in the background; return a tracking id.
+
+        The changes are compare-and-set writes sent as one multicall
+        transaction and re-applied to fresh reads when they lose a race, so
+        rows other requests add meanwhile are kept.
+        `on_mined()` runs in the pool once the write is mined.
+        """
+        labels = [f'{contract_type}.{VERSIONED_WRITES[contract_type][1]}' for contract_type, mutate in updates]
+        job = {'id': uuid.uuid4().hex, 'status': PENDING,
+               'transactions': [{'calls': labels, 'status': PENDING}]}
+        self._save(job)
+        self.executor.submit(self._update, job, updates, on_mined)
+        return job['id']
+
+    def _update(self, job, updates, on_mined=None):
+        tx = job['transactions'][0]
+        try:
+            updated, tx_hash = update_blobs(updates)
+            tx['tx_hash'] = Web3.to_hex(tx_hash)
+            receipt = get_web3().eth.get_transaction_receipt(tx_hash)
+            tx['receipt'] = receipt_summary(receipt)
+            tx['status'] = MINED if receipt['status'] == 1 else FAILED
+        except Exception as e:
+            logger.error(f"Updating {', '.join(tx['calls'])} failed: {e}")
+            tx.update(status=FAILED, error=str(e))
+        job['status'] = FAILED if any(tx['status'] == FAILED for tx in job['transactions']) else MINED
+        if job['status'] == MINED and on_mined is not None:
+            try:
+                on_mined()
+            except Exception as e:
+                logger.error(f"Completion hook of job {job['id']} failed: {e}")
+        self._save(job)
+        logger.info(f"Transaction job {job['id']} {job['status']}")
+
+    def _wait(self, job, sent):
+        web3 = get_web3()
+        for tx, (contract_types, tx_hash) in zip(job['transactions'], sent):
+            try:
+                receipt = web3.eth.wait_for_transaction_receipt(
+                    tx_hash, timeout=chain_setting('TX_RECEIPT_TIMEOUT'))
+                tx['receipt'] = receipt_summary(receipt)
+                tx['status'] = MINED if receipt['status'] == 1 else FAILED
+            except Exception as e:
+                logger.error(f"Waiting for {tx['tx_hash']} failed: {e}")
+                tx.update(status=FAILED, error=str(e))
+            for contract_type in set(contract_types):
+                notify_write(contract_type)
+        if job['status'] != FAILED:
+            job['status'] = FAILED if any(tx['status'] == FAILED for tx in job['transactions']) else MINED
+        self._save(job)
+        logger.info(f"Transaction job {job['id']} {job['status']}")
+
+tx_tracker = TransactionTracker()
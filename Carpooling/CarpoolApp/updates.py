@@ -0,0 +1,200 @@
+import asyncio, json, threading
+import logging
+from .blobcache import blob_cache
+from .chain import chain_setting, write_hooks
+from .records import table_at
+
+logger = logging.getLogger(__name__)
+
+# Passenger request status -> event pushed when a row enters it
+STATUS_EVENTS = {
+    'completed': 'ride_completed',
+    'paid': 'payment_confirmed',
+}
+NEW_REQUEST_EVENT = 'passenger_request'
+UPDATED_EVENT = 'request_updated'
+# Sent instead of the events a slow subscriber missed; the page reloads everything
+RESYNC_EVENT = 'resync'
+# Events held per subscriber before it has to resync
+SUBSCRIBER_QUEUE_SIZE = 100
+# Seconds of silence after which a comment line keeps proxies from closing the stream
+HEARTBEAT_SECONDS = 15
+
+def request_json(req):
+    """Return the JSON-safe event payload for a passenger request"""
+    return {
+        'passenger_id': req.passenger_id,
+        'ride_id': req.ride_id,
+        'driver': req.driver,
+        'passenger': req.passenger,
+        'miles': req.miles,
+        'amount': req.amount,
+        'tx_hash': req.tx_hash,
+        'status': req.status,
+    }
+
+def passenger_deltas(old, new):
+    """Yield (event type, request) for rows of `new` that are new or changed since `old`.
+
+    Both are {(passenger_id, ride_id): PassengerRequest}.
+    """
+    for key, req in new.items():
+        before = old.get(key)
+        if before is None:
+            yield NEW_REQUEST_EVENT, req
+        elif before.status != req.status:
+            yield STATUS_EVENTS.get(req.status, UPDATED_EVENT), req
+        elif before != req:
+            yield UPDATED_EVENT, req
+
+def sse_message(event, data, event_id=None):
+    """Format one Server-Sent Events message."""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return '\n'.join(lines) + '\n\n'
+
+# -------------------- Subscriptions --------------------
+
+class Subscription:
+    """One open update stream of a user.
+
+    Events are handed over from the hub thread through a bounded
+    asyncio.Queue on the stream's event loop. A subscriber that falls
+    SUBSCRIBER_QUEUE_SIZE events behind gets one `resync` event instead of
+    the ones it missed.
+    """
+
+    def __init__(self, username, loop):
+        self.username = username
+        self.loop = loop
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.lagged = False
+
+    def push(self, message):
+        """Queue a formatted message; safe to call from any thread."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The stream's loop is gone; its stream unsubscribes as it closes
+            pass
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+    def resync(self):
+        """Drop the queued messages; return the `resync` message that replaces them."""
+        self.lagged = False
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        return sse_message(RESYNC_EVENT, {})
+
+# -------------------- Update Hub --------------------
+
+class UpdateHub:
+    """Computes passenger request changes once per block and fans them out.
+
+    While anyone is subscribed, one background thread per process checks
+    the passengers table every BLOCKCHAIN['PUSH_POLL_INTERVAL'] seconds
+    through the block-tagged blob cache, so a new block costs one
+    getPassengers read however many streams are open. Changed rows become
+    `passenger_request`, `ride_completed`, `payment_confirmed` or
+    `request_updated` events for the driver and passenger of the row.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}   # username -> {Subscription}
+        self._wake = threading.Event()
+        self._thread = None
+        self._blob = None
+        self._rows = None        # (passenger_id, ride_id) -> PassengerRequest
+
+    def subscribe(self, username, loop):
+        """Return a Subscription for `username`, starting the hub thread if needed."""
+        subscription = Subscription(username, loop)
+        with self._lock:
+            self._subscribers.setdefault(username, set()).add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='update-hub', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return subscription
+
+    async def astream(self, username):
+        """Yield SSE text for an ASGI response until the client goes away."""
+        subscription = self.subscribe(username, asyncio.get_running_loop())
+        try:
+            yield ': connected\n\n'
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield subscription.resync() if subscription.lagged else message
+        finally:
+            self.unsubscribe(subscription)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.username, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscribers.pop(subscription.username, None)
+
+    def notify_write(self, contract_type):
+        """Write hook: poll right away after one of our own passengers writes."""
+        if contract_type == 'passengers':
+            self._wake.set()
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def poll(self):
+        """Read the passengers table and publish what changed; return the number of events."""
+        version, blob = blob_cache.read_versioned('passengers')
+        if blob == self._blob:
+            return 0
+        rows = {(req.passenger_id, req.ride_id): req for req in table_at('passengers', version, blob)}
+        previous, self._blob, self._rows = self._rows, blob, rows
+        if previous is None:
+            # First read after the hub went idle is the baseline
+            return 0
+        block = version[1]
+        count = 0
+        for event, req in passenger_deltas(previous, rows):
+            self.publish({req.driver, req.passenger}, sse_message(event, request_json(req), block))
+            count += 1
+        if count:
+            logger.info("Pushed %d passenger request updates at block %s", count, block)
+        return count
+
+    def publish(self, usernames, message):
+        """Send a formatted message to every stream of the given users."""
+        with self._lock:
+            targets = [s for name in usernames if name for s in self._subscribers.get(name, ())]
+        for subscription in targets:
+            subscription.push(message)
+
+    def run(self):
+        interval = chain_setting('PUSH_POLL_INTERVAL')
+        while True:
+            self._wake.clear()
+            if not self.subscriber_count():
+                # Idle: forget the snapshot so changes made meanwhile are not replayed
+                self._blob = self._rows = None
+                self._wake.wait()
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning("Polling passenger updates failed: %s", e)
+            self._wake.wait(interval)
+
+update_hub = UpdateHub()
+
+write_hooks.append(update_hub.notify_write)
@@ -14,20 +14,27 @@ urlpatterns = [
     path('get_scheduled_rides/', views.get_scheduled_rides, name='get_scheduled_rides'),
     path('RideCompleteAction/', views.RideCompleteAction, name='RideCompleteAction'),
     path('ViewDrivers/', views.ViewDrivers, name='ViewDrivers'),
+    path('search_rides/', views.search_rides, name='search_rides'),
     path('ShareLocationAction/', views.ShareLocationAction, name='ShareLocationAction'),
+    path('request_dispatch/', views.request_dispatch, name='request_dispatch'),
     path('Ratings/', views.Ratings, name='Ratings'),
     path('RatingsAction/', views.RatingsAction, name='RatingsAction'),
     path('verify_user/', views.verify_user, name='verify_user'),
     path('emergency_contact/', views.emergency_contact, name='emergency_contact'),
     path('distribute_tokens/', views.distribute_tokens, name='distribute_tokens'),
+    path('bulk_distribute_tokens/', views.bulk_distribute_tokens, name='bulk_distribute_tokens'),
+    path('distribution_status/<str:job>/', views.distribution_status, name='distribution_status'),
     path('get_user_token_balance/', views.get_user_token_balance, name='get_user_token_balance'),
     path('get_pending_payments/', views.get_pending_payments, name='get_pending_payments'),
+    path('updates/', views.ride_updates, name='ride_updates'),
     path('get_driver_wallet/', views.get_driver_wallet, name='get_driver_wallet'),  # CHANGED: removed parameter
     path('provide_token_info/', views.provide_token_info, name='provide_token_info'),
     path('verify_token_payment/', views.verify_token_payment, name='verify_token_payment'),
     path('map_view/', views.map_view, name='map_view'),
     path('get_completed_rides_for_passenger/', views.get_completed_rides_for_passenger, name='get_completed_rides_for_passenger'),
     path('notify_passenger_payment/', views.notify_passenger_payment, name='notify_passenger_payment'),
+    path('tx_status/<str:tracking_id>/', views.tx_status, name='tx_status'),
+    path('metrics/', views.rpc_metrics_view, name='rpc_metrics'),
     path('logout/', views.logout_view, name='logout'),  # ADDED: logout endpoint
 	path('get_completed_paid_rides/', views.get_completed_paid_rides, name='get_completed_paid_rides'),
     ]
\ No newline at end of file
@@ -1,102 +1,63 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-import json, os, random, hashlib
+from asgiref.sync import sync_to_async
+import asyncio, json, os, random, hashlib, uuid
 from datetime import date, datetime, timedelta
-from geopy.distance import geodesic
-from web3 import Web3, HTTPProvider
+from itertools import islice
+from web3 import Web3
 import logging
+from .chain import registry, get_web3, load_contract, send_transaction, transact
+from .blobcache import WriteConflict, update_blob
+from .records import (load_table, parse_record, record_to_row, RecordTable, PassengerTable, RideTable,
+                      User, Ride, PassengerRequest, Rating,
+                      user_from_v2, ride_from_v2, request_from_v2, rating_from_v2)
+from .projection import query_table
+from .txtracker import tx_tracker
+from .balances import balance_service
+from .rpcmetrics import rpc_metrics
+from .wallets import wallet_registry
+from .credentials import credential_index
+from .matching import ride_matcher
+from .spatial import ride_index, search_radius_miles
+from .schedule import merge_occurrences, ride_schedule, schedule_window_days
+from .dispatch import RideFull, ride_seats, seats_left, seats_taken
+from .models import DispatchRequest, TokenTransfer
+from .payments import find_transfer, payment_settler, transfer_rows
+from .distribution import parse_entries, token_distributor
+from .asyncchain import alookup, aquery_table, async_balances, awallet_address
+from .updates import update_hub
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# -------------------- Configuration --------------------
-GANACHE_URL = 'http://127.0.0.1:9545'
-DEFAULT_ACCOUNT_INDEX = 0
-CHAIN_NETWORK_ID = '5777'
-
-# -------------------- Wallet Storage --------------------
-# In-memory storage for wallet addresses (for demo - in production use database)
-user_wallets = {}
-
 # -------------------- Session Keys --------------------
 SESSION_USER = 'current_user'
 SESSION_USER_TYPE = 'user_type'
 
 # -------------------- Helpers --------------------
 
-def get_web3():
-    """Return a Web3 instance connected to Ganache and set default account."""
-    web3 = Web3(HTTPProvider(GANACHE_URL))
-    if not web3.is_connected():
-        raise ConnectionError(f"Unable to connect to blockchain at {GANACHE_URL}")
-    try:
-        web3.eth.default_account = web3.eth.accounts[DEFAULT_ACCOUNT_INDEX]
-    except Exception as e:
-        logger.warning(f"Could not set default account: {e}")
-        web3.eth.default_account = None
-    return web3
-
-def build_contract_path(name):
-    """Return absolute path to build/contracts/<name>.json"""
-    root_build_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../build/contracts'))
-    return os.path.join(root_build_dir, f"{name}.json")
-
-def load_contract(contract_type):
-    """Load compiled contract JSON and return (contract, web3)."""
-    contract_map = {
-        'signup': 'Carpool',
-        'ride': 'Carpool', 
-        'passengers': 'Carpool',
-        'ratings': 'Carpool',
-        'token': 'CarpoolToken'
-    }
-    contract_name = contract_map.get(contract_type)
-    if not contract_name:
-        raise ValueError(f"Unknown contract type: {contract_type}")
-
-    path = build_contract_path(contract_name)
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Contract JSON not found: {path}")
-
-    with open(path) as f:
-        contract_json = json.load(f)
-
-    abi = contract_json.get('abi')
-    networks = contract_json.get('networks', {})
-    deployed = networks.get(CHAIN_NETWORK_ID) or (next(iter(networks.values())) if networks else None)
-    if not deployed:
-        raise ValueError(f"Contract {contract_name} has no deployed address in build JSON")
-    address = deployed.get('address')
-
-    web3 = get_web3()
-    contract = web3.eth.contract(address=web3.to_checksum_address(address), abi=abi)
-    return contract, web3
-
-def send_transaction(contract_type, function_name, data):
-    """Send a transaction calling `function_name` with a single string argument `data`."""
-    contract, web3 = load_contract(contract_type)
-    func = getattr(contract.functions, function_name)
-    tx_hash = func(data).transact({'from': web3.eth.default_account})
-    receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
-    return receipt
-
 def get_current_user(request):
     """Get current user from session"""
     return request.session.get(SESSION_USER)
 
+async def aget_current_user(request):
+    """Get current user from session without blocking the event loop"""
+    return await request.session.aget(SESSION_USER)
+
 def get_user_type(request):
     """Get user type from session"""
     return request.session.get(SESSION_USER_TYPE)
 
 def get_user_wallet_address(username):
-    """Get user's wallet address from storage"""
-    return user_wallets.get(username)
+    """Get user's wallet address from the shared wallet registry"""
+    return wallet_registry.get(username)
 
 def store_user_wallet(username, wallet_address):
     """Store user's wallet address"""
-    user_wallets[username] = wallet_address
-    logger.info(f"Stored wallet for {username}: {wallet_address}")
+    wallet_registry.store(username, wallet_address)
 
 def set_user_session(request, username, user_type):
     """Set user session data"""
@@ -115,26 +76,122 @@ def get_token_balance(wallet_address):
     if not wallet_address:
         return "0"
     try:
-        token_contract, web3 = load_contract('token')
-        balance = token_contract.functions.balanceOf(wallet_address).call()
-        return web3.utils.fromWei(balance, 'ether')
+        return str(Web3.from_wei(balance_service.balance(wallet_address), 'ether'))
+    except Exception as e:
+        logger.error(f"Error getting token balance: {e}")
+        return "0"
+
+async def aget_token_balance(wallet_address):
+    """Get token balance for a wallet address in an async view"""
+    if not wallet_address:
+        return "0"
+    try:
+        return str(Web3.from_wei(await async_balances.balance(wallet_address), 'ether'))
     except Exception as e:
         logger.error(f"Error getting token balance: {e}")
         return "0"
 
+async def awallet_and_balance(username):
+    """Return (wallet address, token balance) for a user in an async view"""
+    wallet_address = await awallet_address(username)
+    return wallet_address, await aget_token_balance(wallet_address)
+
+def append_row(row, separator=''):
+    """Return an update_blob() change appending `row` to a table string"""
+    def append(current):
+        if current and current.strip():
+            return current + separator + row
+        return row
+    return append
+
 def checkUser(username):
     """Return True if username exists"""
-    contract_signup, web3 = load_contract('signup')
+    return credential_index.exists(username)
+
+# -------------------- Carpool v2 (per-record storage) --------------------
+# Accessors for CarpoolV2, which stores one struct per row so a write costs
+# O(1) gas instead of rewriting the whole table string. Reads return the same
+# record types as records.load_table().
+
+V2_PAGE_SIZE = 200
+
+def _event_id(contract_type, event_name, receipt):
+    """Return the `id` argument of the first `event_name` log in a receipt."""
+    contract, web3 = load_contract(contract_type)
+    events = getattr(contract.events, event_name)().process_receipt(receipt)
+    return events[0]['args']['id'] if events else None
+
+def add_user_v2(username, password, contact, email, vehicle, user_type, wallet_address):
+    """Add a user row."""
+    web3 = get_web3()
+    return transact('v2', 'addUser', username, password, contact, email, vehicle, user_type,
+                    web3.to_checksum_address(wallet_address))
+
+def add_ride_v2(driver, location, lat, long, seats, ride_date, ride_time, recurring='none'):
+    """Add a waiting ride and return its contract-assigned id."""
+    receipt = transact('v2', 'addRide', driver, location, str(lat), str(long), int(seats or 0),
+                       ride_date, ride_time, recurring)
+    return _event_id('v2', 'RideAdded', receipt)
+
+def update_ride_status_v2(ride_id, status):
+    """Set the status of one ride."""
+    return transact('v2', 'updateRideStatus', int(ride_id), status)
+
+def add_passenger_request_v2(ride_id, driver, passenger):
+    """Add a waiting passenger request for a ride and return its id."""
+    receipt = transact('v2', 'addPassengerRequest', int(ride_id), driver, passenger)
+    return _event_id('v2', 'PassengerRequestAdded', receipt)
+
+def complete_passenger_request_v2(request_id, miles, amount):
+    """Record the miles and fare of a passenger request and mark it completed."""
+    return transact('v2', 'completePassengerRequest', int(request_id), str(miles), str(amount))
+
+def mark_paid_v2(request_id, tx_hash):
+    """Mark a passenger request as paid by token transfer `tx_hash`."""
+    return transact('v2', 'markPaid', int(request_id), tx_hash)
+
+def add_rating_v2(username, driver_name, rating):
+    """Add a driver rating (1-5)."""
+    return transact('v2', 'addRating', username, driver_name, int(rating))
+
+V2_TABLES = {
+    'users': ('getUsers', 'userCount', user_from_v2),
+    'rides': ('getRides', 'rideCount', ride_from_v2),
+    'passengers': ('getPassengerRequests', 'passengerRequestCount', request_from_v2),
+    'ratings': ('getRatings', 'ratingCount', rating_from_v2),
+}
+
+def get_page_v2(table, offset=0, limit=V2_PAGE_SIZE):
+    """Return one page of `table` ('users', 'rides', 'passengers' or 'ratings') as records."""
+    getter, _, convert = V2_TABLES[table]
+    contract, web3 = load_contract('v2')
+    rows = getattr(contract.functions, getter)(int(offset), int(limit)).call()
+    return [convert(row) for row in rows]
+
+def count_v2(table):
+    """Return the number of rows in a v2 table."""
+    _, counter, _ = V2_TABLES[table]
+    contract, web3 = load_contract('v2')
+    return getattr(contract.functions, counter)().call()
+
+def iter_table_v2(table, start=0, page_size=V2_PAGE_SIZE):
+    """Yield every record of a v2 table from `start`, one page per eth_call."""
+    offset = start
+    while True:
+        page = get_page_v2(table, offset, page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        offset += page_size
+
+def get_ride_v2(ride_id):
+    """Return one ride by id, or None if it does not exist."""
+    contract, web3 = load_contract('v2')
     try:
-        stored = contract_signup.functions.getUser().call()
+        return ride_from_v2(contract.functions.getRideById(int(ride_id)).call())
     except Exception as e:
-        stored = ""
-    rows = [r for r in stored.split('\n') if r.strip()]
-    for row in rows:
-        arr = row.split('#')
-        if arr and arr[0] == username:
-            return True
-    return False
+        logger.warning(f"Ride {ride_id} not found in CarpoolV2: {e}")
+        return None
 
 # -------------------- Core Views --------------------
 
@@ -164,21 +221,18 @@ def Signup(request):
 
         if not checkUser(username):
             # Store user data with wallet address
-            data = f"{username}#{password}#{contact}#{email}#{vehicle}#{user_type}#{wallet_address}\n"
-            send_transaction('signup', 'addUser', data)
+            user = User(username, password, contact, email, vehicle, user_type, wallet_address)
+            send_transaction('signup', 'addUser', record_to_row(user) + "\n")
+            credential_index.add(user)
             
             # Store wallet address in our storage
             store_user_wallet(username, wallet_address)
             
-            # Distribute initial tokens to user's MetaMask wallet
+            # Distribute initial tokens to user's MetaMask wallet; the receipt is awaited in the background
             try:
-                token_contract, web3 = load_contract('token')
-                amount = web3.to_wei(500, 'ether')  # 500 CPT tokens
-                tx_hash = token_contract.functions.transfer(
-                    web3.to_checksum_address(wallet_address),
-                    amount
-                ).transact({'from': web3.eth.default_account})
-                logger.info(f"Sent 500 CPT to {wallet_address}")
+                amount = Web3.to_wei(500, 'ether')  # 500 CPT tokens
+                tx_id = tx_tracker.submit([('token', 'transfer', (Web3.to_checksum_address(wallet_address), amount))])
+                logger.info(f"Sent 500 CPT to {wallet_address} (job {tx_id})")
             except Exception as e:
                 logger.error(f"Token distribution failed: {e}")
             
@@ -197,56 +251,31 @@ def UserLogin(request):
         password = request.POST.get('password')
         wallet_address = request.POST.get('wallet_address')
         
-        print(f"🔐 LOGIN ATTEMPT: Username: {username}, Wallet: {wallet_address}")
+        logger.debug("Login attempt username=%s wallet=%s", username, wallet_address or '-')
         
-        contract, web3 = load_contract('signup')
-        try:
-            stored = contract.functions.getUser().call()
-            print(f"📋 Stored users from blockchain: {stored}")
-        except Exception as e:
-            print(f"❌ Error reading from blockchain: {e}")
-            stored = ""
+        user_data = credential_index.authenticate(username, password)
 
-        rows = stored.split('\n')
-        status = 'none'
-        user_data = None
-        
-        for row in rows:
-            if not row.strip():
-                continue
-            arr = row.split('#')
-            print(f"🔍 Checking user: {arr}")
-            if len(arr) > 1 and arr[0] == username and arr[1] == password:
-                status = 'success'
-                user_data = arr
-                print(f"✅ USER FOUND: {arr}")
-                break
-
-        if status == 'success' and user_data:
-            # Use wallet from form or stored wallet from blockchain
+        if user_data:
+            # Use wallet from form or the one registered at signup
             user_wallet = wallet_address
-            if not user_wallet and len(user_data) > 6:
-                user_wallet = user_data[6]
-            
-            print(f"💰 Using wallet: {user_wallet}")
+            if not user_wallet and user_data.wallet is not None:
+                user_wallet = user_data.wallet
             
             # Store wallet in our storage
             if user_wallet:
                 store_user_wallet(username, user_wallet)
             
-            user_type = user_data[5] if len(user_data) > 5 else 'Passenger'
-            print(f"👤 User type: {user_type}")
+            user_type = user_data.user_type if user_data.user_type is not None else 'Passenger'
+            logger.info("Login succeeded username=%s type=%s wallet=%s", username, user_type, user_wallet or '-')
             
             set_user_session(request, username, user_type)
             
             if user_type == 'Driver':
-                print("🚗 Redirecting to DriverScreen")
                 return redirect('DriverScreen')
             else:
-                print("👤 Redirecting to UserScreen")
                 return redirect('UserScreen')
         else:
-            print("❌ LOGIN FAILED: Invalid credentials")
+            logger.warning("Login failed username=%s", username)
             context = {'data': 'Invalid login details'}
             return render(request, 'Login.html', context)
     return redirect('Login')
@@ -305,20 +334,11 @@ def AddRide(request):
         recurring = request.POST.get('recurring', 'none')
         
         ride_id = random.randint(1000, 9999)
-        data = f"{ride_id}#{user}#{location}#{lat}#{long}#{seats}#{ride_date}#waiting#{ride_time}#{recurring}"
-        
-        contract_ride, web3 = load_contract('ride')
-        try:
-            current_rides = contract_ride.functions.getRide().call()
-        except Exception as e:
-            current_rides = ""
-
-        if current_rides and current_rides.strip():
-            updated_rides = current_rides + '\n' + data
-        else:
-            updated_rides = data
+        data = record_to_row(Ride(str(ride_id), user, location, lat, long, seats, ride_date, 'waiting', ride_time, recurring))
         
-        send_transaction('ride', 'setRide', updated_rides)
+        update_blob('ride', append_row(data, '\n'))
+        ride_index.add(parse_record(Ride, data))
+        ride_schedule.add(parse_record(Ride, data))
         
         wallet_address = get_user_wallet_address(user)
         token_balance = get_token_balance(wallet_address)
@@ -351,54 +371,52 @@ def schedule_ride(request):
             recurring = data.get('recurring', 'none')
             
             ride_id = random.randint(1000, 9999)
-            data_str = f"{ride_id}#{user}#{location}#{lat}#{lng}#{seats}#{ride_date}#waiting#{ride_time}#{recurring}"
-            
-            contract_ride, web3 = load_contract('ride')
-            try:
-                current_rides = contract_ride.functions.getRide().call()
-            except Exception as e:
-                current_rides = ""
-
-            if current_rides and current_rides.strip():
-                updated_rides = current_rides + '\n' + data_str
-            else:
-                updated_rides = data_str
+            data_str = record_to_row(Ride(str(ride_id), user, location, lat, lng, seats, ride_date, 'waiting', ride_time, recurring))
             
-            send_transaction('ride', 'setRide', updated_rides)
+            update_blob('ride', append_row(data_str, '\n'))
+            ride_index.add(parse_record(Ride, data_str))
+            ride_schedule.add(parse_record(Ride, data_str))
             
             return JsonResponse({'status': 'success', 'ride_id': ride_id})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)})
     return JsonResponse({'status': 'error', 'message': 'POST required'})
 
-def get_scheduled_rides(request):
-    """Get scheduled rides for a user"""
-    user = get_current_user(request)
+async def get_scheduled_rides(request):
+    """Get upcoming ride departures: ?from=&to=&limit=
+
+    Recurring rides are expanded into one entry per departure. The window
+    defaults to the next SCHEDULE_WINDOW_DAYS days.
+    """
+    user = await aget_current_user(request)
     if not user:
         return JsonResponse({'status': 'error', 'message': 'Not logged in'})
-        
-    contract_ride, web3 = load_contract('ride')
     try:
-        current_rides = contract_ride.functions.getRide().call()
-    except Exception as e:
-        current_rides = ""
-    
+        start, end = schedule_window(request.GET, default_days=schedule_window_days())
+        limit = min(int(request.GET.get('limit') or getattr(settings, 'RIDE_SEARCH_MAX_LIMIT', 500)),
+                    getattr(settings, 'RIDE_SEARCH_MAX_LIMIT', 500))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'from/to must be ISO dates or datetimes'}, status=400)
+
+    rides = await aquery_table('ride')
+    # Expanding the schedule is CPU work (and SQLite queries on the projection)
+    occurrences = await sync_to_async(
+        lambda: list(islice(ride_schedule.iter_window(start, end, table=rides), max(limit, 0))))()
     scheduled_rides = []
-    rows = [r for r in current_rides.split('\n') if r.strip()]
-    for row in rows:
-        arr = row.split('#')
-        if len(arr) > 8:  # Has time info
-            scheduled_rides.append({
-                'id': arr[0],
-                'driver': arr[1],
-                'location': arr[2],
-                'date': arr[6],
-                'time': arr[8],
-                'recurring': arr[9] if len(arr) > 9 else 'none',
-                'status': arr[7]
-            })
+    for occurrence in occurrences:
+        ride = occurrence.ride
+        scheduled_rides.append({
+            'id': ride.ride_id,
+            'driver': ride.driver,
+            'location': ride.location,
+            'date': occurrence.start.date().isoformat(),
+            'time': occurrence.start.strftime('%H:%M'),
+            'recurring': ride.recurring if ride.recurring is not None else 'none',
+            'status': ride.status
+        })
     
-    return JsonResponse({'scheduled_rides': scheduled_rides})
+    return JsonResponse({'scheduled_rides': scheduled_rides,
+                         'from': start.isoformat(), 'to': end.isoformat() if end else None})
 
 def RideCompleteAction(request):
     user = get_current_user(request)
@@ -413,66 +431,46 @@ def RideCompleteAction(request):
 
         logger.info(f"Driver {user} completing ride {rid} for passenger {passenger}, amount: {total_amount} CPT")
 
-        # Update passenger records
-        contract_car, web3 = load_contract('passengers')
-        try:
-            current = contract_car.functions.getPassengers().call()
-        except Exception as e:
-            current = ""
-
-        rows = current.split('\n')
-        record = ''
-        passenger_found = False
-        
-        for row in rows:
-            if not row.strip():
-                continue
-            arr = row.split('#')
-            if arr[0] != passenger or arr[1] != rid:
-                record += row + '\n'
-            else:
-                passenger_found = True
-                # Set the amount and status to completed
-                new_row = [arr[0], arr[1], arr[2], arr[3], miles, total_amount, '0', '0', 'completed']
-                record += '#'.join(new_row) + '\n'
-                logger.info(f"Updated passenger record: {new_row}")
-
-        if not passenger_found:
-            # Create a new passenger record if not found
-            passenger_id = len(rows) + 1 if rows else 1
-            new_record = f"{passenger}#{rid}#{user}#{passenger}#{miles}#{total_amount}#0#0#completed\n"
-            record += new_record
-            logger.info(f"Created new passenger record: {new_record}")
-
-        send_transaction('passengers', 'setPassengers', record)
-
-        # Update ride record status
-        contract_ride, web3 = load_contract('ride')
-        try:
-            current_rides = contract_ride.functions.getRide().call()
-        except Exception as e:
-            current_rides = ""
-
-        ride_rows = current_rides.split('\n')
-        ride_record = ''
-        ride_found = False
-        
-        for row in ride_rows:
-            if not row.strip():
-                continue
-            arr = row.split('#')
-            if arr[0] != rid:
-                ride_record += row + '\n'
-            else:
-                ride_found = True
-                arr[7] = 'completed'
-                ride_record += '#'.join(arr) + '\n'
-                logger.info(f"Updated ride record: {arr}")
-
-        if not ride_found:
-            logger.warning(f"Warning: Ride {rid} not found in ride records")
-
-        send_transaction('ride', 'setRide', ride_record)
+        def complete_request(current):
+            # Re-applied to a fresh read if another write lands first
+            passengers = PassengerTable(current)
+            matches = set(passengers.lookup('request', (passenger, rid)))
+            updated = []
+            for req in passengers:
+                if req in matches:
+                    # Set the amount and status to completed
+                    req = req._replace(miles=miles, amount=total_amount, tx_hash='0', reserved='0', status='completed', raw=None)
+                    logger.info(f"Updated passenger record: {req}")
+                updated.append(req)
+            record = RecordTable.to_blob(updated)
+
+            if not matches:
+                # Create a new passenger record if not found
+                new_record = record_to_row(PassengerRequest(passenger, rid, user, passenger, miles, total_amount, '0', '0', 'completed')) + "\n"
+                record += new_record
+                logger.info(f"Created new passenger record: {new_record}")
+            return record
+
+        def complete_ride(current):
+            rides = RideTable(current)
+            matches = set(rides.lookup('ride_id', rid))
+            if not matches:
+                logger.warning(f"Warning: Ride {rid} not found in ride records")
+                return current
+            updated = []
+            for ride in rides:
+                if ride in matches:
+                    ride = ride._replace(status='completed')
+                    logger.info(f"Updated ride record: {ride}")
+                updated.append(ride)
+            return RecordTable.to_blob(updated)
+
+        # Both writes are confirmed in the background; the page polls tx_status
+        # The ride leaves the search index once the completion is mined
+        tx_id = tx_tracker.submit_updates([
+            ('passengers', complete_request),
+            ('ride', complete_ride),
+        ], on_mined=lambda: ride_index.discard(rid))
 
         wallet_address = get_user_wallet_address(user)
         token_balance = get_token_balance(wallet_address)
@@ -482,59 +480,110 @@ def RideCompleteAction(request):
             'token_hint': True,
             'driver': user,
             'wallet_address': wallet_address,
-            'token_balance': token_balance
+            'token_balance': token_balance,
+            'tx_id': tx_id
         }
         return render(request, 'DriverScreen.html', context)
     return redirect('DriverScreen')
 
-def ViewDrivers(request):
-    user = get_current_user(request)
+RIDE_COLUMNS = ['Ride ID','Driver Name','Location Name','Latitude','Longitude','Available Seats','Ride Date','Time','Share Location']
+
+def ride_row_html(ride):
+    """Return one ViewDrivers table row for a ride"""
+    # Include time if available
+    ride_display = list(ride[:7]) + [ride.time if ride.time is not None else '12:00']
+    cells = ''.join(f'<td>{x}</td>' for x in ride_display)
+    return (f'<tr>{cells}<td><a href="/ShareLocationAction?rid={ride.ride_id}&driver={ride.driver}" '
+            f'class="btn btn-sm btn-primary">Share Location</a></td></tr>')
+
+def ride_json(miles, ride):
+    """Return the JSON-safe search result for a ride"""
+    return {
+        'id': ride.ride_id,
+        'driver': ride.driver,
+        'location': ride.location,
+        'lat': ride.lat,
+        'long': ride.long,
+        'seats': ride.seats,
+        'date': ride.date,
+        'time': ride.time if ride.time is not None else '12:00',
+        'recurring': ride.recurring if ride.recurring is not None else 'none',
+        'miles': round(miles, 3),
+    }
+
+def ride_search_params(params):
+    """Parse lat/long/radius/offset/limit from a QueryDict; raises ValueError"""
+    latitude = float(params.get('lat') or params.get('t2'))
+    longitude = float(params.get('long') or params.get('t3'))
+    radius = float(params.get('radius') or search_radius_miles())
+    offset = max(int(params.get('offset') or 0), 0)
+    max_limit = getattr(settings, 'RIDE_SEARCH_MAX_LIMIT', 500)
+    limit = params.get('limit')
+    limit = min(max(int(limit), 0), max_limit) if limit else None
+    return latitude, longitude, radius, offset, limit
+
+def parse_window_bound(value, is_end=False):
+    """Parse an ISO date or datetime; a bare end date includes that whole day"""
+    if not value:
+        return None
+    when = datetime.fromisoformat(value)
+    if is_end and len(value) == 10:
+        when += timedelta(days=1)
+    return when.replace(tzinfo=None)
+
+def schedule_window(params, default_days=None):
+    """Return (start, end) from ?from=&to=, or None when neither is given.
+
+    With `default_days` a window is always returned, starting now. A
+    missing `to` ends the window `default_days` (else SCHEDULE_WINDOW_DAYS)
+    after its start, as recurring rides would otherwise expand forever.
+    """
+    start = parse_window_bound(params.get('from'))
+    end = parse_window_bound(params.get('to'), is_end=True)
+    if start is None and end is None and default_days is None:
+        return None
+    start = start or datetime.now().replace(second=0, microsecond=0)
+    if end is None:
+        end = start + timedelta(days=default_days if default_days is not None else schedule_window_days())
+    return start, end
+
+def search_matches(latitude, longitude, radius, window=None, table=None):
+    """Yield (miles, ride) near a point; with a window, one per departure in it, earliest first"""
+    matches = ride_index.iter_search(latitude, longitude, radius, table=table)
+    if window is None:
+        return matches
+    return ((miles, occurrence.as_ride()) for occurrence, miles in merge_occurrences(matches, *window))
+
+async def ViewDrivers(request):
+    user = await aget_current_user(request)
     if not user:
         return redirect('Login')
         
     if request.method == 'POST':
-        destination = request.POST.get('t1')
-        latitude = float(request.POST.get('t2'))
-        longitude = float(request.POST.get('t3'))
-        driver_location = [latitude, longitude]
-
-        columns = ['Ride ID','Driver Name','Location Name','Latitude','Longitude','Available Seats','Ride Date','Time','Share Location']
-        output = "<table border=1 align=center class='table table-striped'><tr>"
-        for col in columns:
-            output += f'<th>{col}</th>'
-        output += "</tr>"
-
-        contract_ride, web3 = load_contract('ride')
         try:
-            current_rides = contract_ride.functions.getRide().call()
-        except Exception as e:
-            current_rides = ""
-
-        rows = current_rides.split('\n')
-        for row in rows:
-            if not row.strip():
-                continue
-            arr = row.split('#')
-            if len(arr) > 7 and arr[7] == 'waiting':
-                try:
-                    user_location = [float(arr[3]), float(arr[4])]
-                    miles = geodesic(driver_location, user_location).miles
-                    if miles <= 3:
-                        output += '<tr>'
-                        # Include time if available
-                        ride_display = arr[:7]
-                        if len(arr) > 8:
-                            ride_display.append(arr[8])  # Add time
-                        else:
-                            ride_display.append('12:00')  # Default time
-                        output += ''.join([f'<td>{x}</td>' for x in ride_display])
-                        output += f'<td><a href="/ShareLocationAction?rid={arr[0]}&driver={arr[1]}" class="btn btn-sm btn-primary">Share Location</a></td></tr>'
-                except (ValueError, IndexError) as e:
-                    continue
-        output += "</table>"
-        
-        wallet_address = get_user_wallet_address(user)
-        token_balance = get_token_balance(wallet_address)
+            latitude, longitude, radius, offset, limit = ride_search_params(request.POST)
+            window = schedule_window(request.POST)
+        except (TypeError, ValueError):
+            latitude = window = None
+        # The wallet/balance lookups and the ride table read are independent
+        (wallet_address, token_balance), rides = await asyncio.gather(
+            awallet_and_balance(user), aquery_table('ride'))
+        if latitude is None:
+            output = 'Enter a numeric location and ISO dates to search rides'
+        else:
+            stop = offset + limit if limit is not None else None
+            def find():
+                if window is None:
+                    # One page, nearest first: only the page's rides get the exact geodesic check
+                    return ride_matcher.nearest(latitude, longitude, k=stop, radius_miles=radius, table=rides)[offset:]
+                return islice(search_matches(latitude, longitude, radius, window, table=rides), offset, stop)
+
+            # Matching and schedule expansion are CPU-bound (and SQLite queries on the projection);
+            # keep them off the event loop
+            rows = await sync_to_async(lambda: [ride_row_html(ride) for miles, ride in find()],
+                                       thread_sensitive=False)()
+            header = ''.join(f'<th>{col}</th>' for col in RIDE_COLUMNS)
+            output = f"<table border=1 align=center class='table table-striped'><tr>{header}</tr>{''.join(rows)}</table>"
         
         context = {
             'data': output, 
@@ -542,9 +591,60 @@ def ViewDrivers(request):
             'wallet_address': wallet_address,
             'token_balance': token_balance
         }
-        return render(request, 'UserScreen.html', context)
+        return await sync_to_async(render)(request, 'UserScreen.html', context)
     return redirect('UserScreen')
 
+def search_rides(request):
+    """Ride search API: ?lat=&long=[&radius=&from=&to=&offset=&limit=&format=json|ndjson|html]
+
+    With from/to, recurring rides are expanded and each departure in the
+    window is a match, earliest first; otherwise every waiting ride is. A
+    window without `to` spans SCHEDULE_WINDOW_DAYS from its start.
+
+    `json` returns one page (limit defaults to RIDE_SEARCH_PAGE_SIZE) with the
+    offset of the next one. `ndjson` and `html` stream matches as they are
+    found, one line or table row each, so large result sets never sit in
+    memory.
+    """
+    if not get_current_user(request):
+        return JsonResponse({'status': 'error', 'message': 'Not logged in'}, status=401)
+    params = request.GET if request.method == 'GET' else request.POST
+    try:
+        latitude, longitude, radius, offset, limit = ride_search_params(params)
+    except (TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'lat and long are required numbers'}, status=400)
+    try:
+        window = schedule_window(params)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'from/to must be ISO dates or datetimes'}, status=400)
+    fmt = params.get('format', 'json')
+    matches = search_matches(latitude, longitude, radius, window)
+
+    if fmt == 'json':
+        limit = limit if limit is not None else getattr(settings, 'RIDE_SEARCH_PAGE_SIZE', 50)
+        # Read one extra match to learn whether another page exists
+        page = list(islice(matches, offset, offset + limit + 1))
+        return JsonResponse({
+            'status': 'success',
+            'rides': [ride_json(miles, ride) for miles, ride in page[:limit]],
+            'offset': offset,
+            'next_offset': offset + limit if len(page) > limit else None,
+        })
+
+    matches = islice(matches, offset, offset + limit if limit is not None else None)
+    if fmt == 'ndjson':
+        lines = (json.dumps(ride_json(miles, ride)) + '\n' for miles, ride in matches)
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    if fmt == 'html':
+        def table():
+            header = ''.join(f'<th>{col}</th>' for col in RIDE_COLUMNS)
+            yield f"<table border=1 align=center class='table table-striped'><tr>{header}</tr>"
+            for miles, ride in matches:
+                yield ride_row_html(ride)
+            yield "</table>"
+        return StreamingHttpResponse(table(), content_type='text/html; charset=utf-8')
+    return JsonResponse({'status': 'error', 'message': f'Unknown format: {fmt}'}, status=400)
+
 def ShareLocationAction(request):
     user = get_current_user(request)
     if not user:
@@ -553,35 +653,89 @@ def ShareLocationAction(request):
     if request.method == 'GET':
         rid = request.GET.get('rid')
         driver_name = request.GET.get('driver')
-        contract_pass, web3 = load_contract('passengers')
-        try:
-            current = contract_pass.functions.getPassengers().call()
-        except Exception as e:
-            current = ""
+        request_ids = []
+        ride = load_table('ride').first('ride_id', rid)
+        seats = ride_seats(ride) if ride else None
+
+        def add_request(current):
+            # The id and free seats depend on the rows already there, so recompute them on every retry
+            table = PassengerTable(current)
+            if seats_left(seats, seats_taken(table)[rid]) <= 0:
+                raise RideFull(rid)
+            passenger_id = len(table) + 1
+            request_ids.append(passenger_id)
+            row = record_to_row(PassengerRequest(str(passenger_id), rid, driver_name, user, '0', '0', '0', '0', 'waiting'))
+            return append_row(row + '\n')(current)
 
-        rows = [r for r in current.split('\n') if r.strip()]
-        passenger_id = len(rows) + 1 if rows else 1
-        data = f"{passenger_id}#{rid}#{driver_name}#{user}#0#0#0#0#waiting\n"
-        
-        if current and current.strip():
-            updated_passengers = current + data
-        else:
-            updated_passengers = data
-            
-        send_transaction('passengers', 'setPassengers', updated_passengers)
-        
         wallet_address = get_user_wallet_address(user)
+        if ride is None:
+            context = {
+                'data': f'Ride {rid} was not found',
+                'user': user,
+                'wallet_address': wallet_address,
+                'token_balance': get_token_balance(wallet_address),
+            }
+            return render(request, 'UserScreen.html', context)
+        # Wait for the compare-and-set write to be mined: a conflict found only
+        # then is retried with a new id, so the id is known once this returns
+        try:
+            update_blob('passengers', add_request)
+        except (RideFull, WriteConflict) as e:
+            message = (f'Ride {rid} has no free seats left' if isinstance(e, RideFull)
+                       else 'Too many requests at once, please try again')
+            context = {
+                'data': message,
+                'user': user,
+                'wallet_address': wallet_address,
+                'token_balance': get_token_balance(wallet_address),
+            }
+            return render(request, 'UserScreen.html', context)
+        passenger_id = request_ids[-1]
+        
         token_balance = get_token_balance(wallet_address)
         
         context = {
             'data': f'Your request shared with driver {driver_name} (ID: {passenger_id})', 
             'user': user,
             'wallet_address': wallet_address,
-            'token_balance': token_balance
+            'token_balance': token_balance,
         }
         return render(request, 'UserScreen.html', context)
     return redirect('UserScreen')
 
+@csrf_exempt
+def request_dispatch(request):
+    """Queue a pickup point for the ride dispatcher, or show the latest one.
+
+    POST {"lat": .., "long": ..} replaces the passenger's open request;
+    GET returns the passenger's most recent request and its assignment.
+    """
+    user = get_current_user(request)
+    if not user:
+        return JsonResponse({'status': 'error', 'message': 'Not logged in'})
+
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            lat, lng = float(data.get('lat')), float(data.get('long'))
+        except (TypeError, ValueError):
+            return JsonResponse({'status': 'error', 'message': 'lat and long are required numbers'}, status=400)
+        DispatchRequest.objects.filter(passenger=user, status='open').update(status='cancelled')
+        pickup = DispatchRequest.objects.create(passenger=user, lat=lat, long=lng)
+        return JsonResponse({'status': 'success', 'request_id': pickup.id})
+
+    pickup = DispatchRequest.objects.filter(passenger=user).order_by('-created_at', '-id').first()
+    if pickup is None:
+        return JsonResponse({'status': 'none'})
+    return JsonResponse({
+        'status': pickup.status,
+        'request_id': pickup.id,
+        'ride_id': pickup.ride_id,
+        'driver': pickup.driver,
+        'passenger_id': pickup.passenger_id,
+        'miles': pickup.miles,
+    })
+
 # -------------------- Token & Payment System --------------------
 
 @csrf_exempt
@@ -599,15 +753,13 @@ def distribute_tokens(request):
             wallet_address = get_user_wallet_address(username)
             
             if wallet_address:
-                token_contract, web3 = load_contract('token')
+                web3 = get_web3()
                 amount = web3.to_wei(1000, 'ether')  # 1000 CPT tokens
                 
-                tx_hash = token_contract.functions.transfer(
-                    web3.to_checksum_address(wallet_address),
-                    amount
-                ).transact({'from': web3.eth.default_account})
-                
-                receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+                # Through the nonce manager, so concurrent sends from the server account don't collide
+                receipt = transact('token', 'transfer', web3.to_checksum_address(wallet_address), amount)
+                tx_hash = receipt['transactionHash']
+                balance_service.invalidate(web3.eth.default_account, wallet_address)
                 
                 return JsonResponse({
                     'status': 'success', 
@@ -624,19 +776,53 @@ def distribute_tokens(request):
     
     return JsonResponse({'status': 'error', 'message': 'POST required'})
 
+def is_staff(request):
+    """True for a Django staff account (logged in through /admin/)"""
+    return request.user.is_authenticated and request.user.is_staff
+
+def bulk_distribute_tokens(request):
+    """Start a bulk CPT distribution (staff only)
+
+    POST {"entries": [[wallet or username, amount], ...], "mode": "transfer"|"mint",
+    "job": optional name}. Posting an existing job again resumes it.
+    """
+    if not is_staff(request):
+        return JsonResponse({'status': 'error', 'message': 'Staff only'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'})
+    try:
+        data = json.loads(request.body)
+        job = str(data.get('job') or uuid.uuid4().hex)[:64]
+        entries = parse_entries(data.get('entries') or [], default_amount=data.get('amount'))
+        chunks = token_distributor.plan(job, entries, mode=data.get('mode', 'transfer'),
+                                        chunk_size=data.get('chunk_size'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+    token_distributor.run_in_background(job)
+    return JsonResponse({'status': 'success', 'job': job, 'chunks': len(chunks), 'recipients': len(entries)})
+
+def distribution_status(request, job):
+    """Return the progress of a bulk CPT distribution (staff only)"""
+    if not is_staff(request):
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    summary = token_distributor.status(job)
+    if not summary['chunks']:
+        return JsonResponse({'error': 'Unknown job'}, status=404)
+    return JsonResponse(summary)
+
 @csrf_exempt
-def get_user_token_balance(request):
+async def get_user_token_balance(request):
     """Get token balance for the current user"""
-    user = get_current_user(request)
+    user = await aget_current_user(request)
     if not user:
         return JsonResponse({'status': 'error', 'message': 'Not logged in'})
     
-    wallet_address = get_user_wallet_address(user)
+    wallet_address = await awallet_address(user)
     if wallet_address:
         try:
-            token_contract, web3 = load_contract('token')
-            balance = token_contract.functions.balanceOf(wallet_address).call()
-            balance_tokens = web3.utils.fromWei(balance, 'ether')
+            balance_tokens = str(Web3.from_wei(await async_balances.balance(wallet_address), 'ether'))
             
             return JsonResponse({
                 'status': 'success',
@@ -649,33 +835,45 @@ def get_user_token_balance(request):
     return JsonResponse({'status': 'error', 'message': 'No wallet address found'})
 
 @csrf_exempt
-def get_pending_payments(request):
+async def get_pending_payments(request):
     """Get pending payments for the current user"""
-    user = get_current_user(request)
+    user = await aget_current_user(request)
     if not user:
         return JsonResponse({'status': 'error', 'message': 'Not logged in'})
         
-    contract_pass, web3 = load_contract('passengers')
-    try:
-        current = contract_pass.functions.getPassengers().call()
-    except Exception as e:
-        current = ""
-
     pending_payments = []
-    rows = [r for r in current.split('\n') if r.strip()]
-    for row in rows:
-        arr = row.split('#')
-        if len(arr) > 8 and arr[3] == user and arr[8] == 'completed' and arr[5] != '0':
+    for req in await alookup('passengers', 'passenger', user):
+        if req.status == 'completed' and req.amount != '0':
             pending_payments.append({
-                'passenger_id': arr[0],
-                'ride_id': arr[1],
-                'driver': arr[2],
-                'amount': arr[5],
-                'miles': arr[4]
+                'passenger_id': req.passenger_id,
+                'ride_id': req.ride_id,
+                'driver': req.driver,
+                'amount': req.amount,
+                'miles': req.miles
             })
     
     return JsonResponse({'pending_payments': pending_payments})
 
+async def ride_updates(request):
+    """Server-Sent Events stream of the current user's passenger request changes.
+
+    Pushes `passenger_request`, `ride_completed`, `payment_confirmed` and
+    `request_updated` events (the changed row as JSON, the block as id) so
+    the screens reload their lists only when something changed, instead
+    of polling. Only served under ASGI: under WSGI every open stream would
+    hold a worker thread, so the answer is 204, which tells EventSource not
+    to reconnect and the screens to poll instead.
+    """
+    user = await aget_current_user(request)
+    if not user:
+        return JsonResponse({'status': 'error', 'message': 'Not logged in'}, status=401)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(update_hub.astream(user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @csrf_exempt
 def get_driver_wallet(request):
     """Get driver's wallet address - FIXED VERSION"""
@@ -687,28 +885,12 @@ def get_driver_wallet(request):
             if not driver_username:
                 return JsonResponse({'error': 'No driver username provided'}, status=400)
             
-            # First try to get from our wallet storage
+            # Registry lookup; falls back to the users blob for unknown names
             wallet_address = get_user_wallet_address(driver_username)
             
             if wallet_address:
                 return JsonResponse({'wallet_address': wallet_address})
             
-            # If not found in storage, try to get from blockchain
-            contract_signup, web3 = load_contract('signup')
-            try:
-                stored = contract_signup.functions.getUser().call()
-            except Exception as e:
-                stored = ""
-            
-            rows = [r for r in stored.split('\n') if r.strip()]
-            for row in rows:
-                arr = row.split('#')
-                if arr and arr[0] == driver_username and len(arr) > 6:
-                    wallet_address = arr[6]
-                    # Store it for future use
-                    store_user_wallet(driver_username, wallet_address)
-                    return JsonResponse({'wallet_address': wallet_address})
-            
             # If still not found, return error
             return JsonResponse({'error': 'Driver wallet not found'}, status=404)
             
@@ -720,21 +902,16 @@ def get_driver_wallet(request):
 def provide_token_info(request):
     """Return token ABI & address for frontend"""
     try:
-        token_json_path = build_contract_path('CarpoolToken')
-        if not os.path.exists(token_json_path):
+        try:
+            _, abi, address = registry.artifact('CarpoolToken')
+        except FileNotFoundError:
             return JsonResponse({'error': 'token artifact not found'}, status=500)
-
-        with open(token_json_path) as f:
-            token_json = json.load(f)
-
-        networks = token_json.get('networks', {})
-        deployed = networks.get(CHAIN_NETWORK_ID) or (next(iter(networks.values())) if networks else None)
-        if not deployed:
+        except ValueError:
             return JsonResponse({'error': 'token not deployed'}, status=500)
 
         return JsonResponse({
-            'address': deployed.get('address'),
-            'abi': token_json.get('abi'),
+            'address': address,
+            'abi': abi,
             'decimals': 18
         })
     except Exception as e:
@@ -742,7 +919,11 @@ def provide_token_info(request):
 
 @csrf_exempt
 def verify_token_payment(request):
-    """Verify an ERC-20 token transfer happened on-chain - FIXED VERSION"""
+    """Verify an ERC-20 token transfer happened on-chain
+
+    Looks the transfer up in the local Transfer index first and only reads
+    the receipt over RPC when the follower has not indexed it yet.
+    """
     if request.method != 'POST':
         return JsonResponse({'error': 'POST required'}, status=405)
 
@@ -757,58 +938,38 @@ def verify_token_payment(request):
         if not tx_hash or not expected_to or expected_amount <= 0:
             return JsonResponse({'error': 'missing parameters'}, status=400)
 
-        token_contract, web3 = load_contract('token')
+        transfer = find_transfer(expected_to, tx_hash, expected_amount)
+        if transfer is None:
+            # Not indexed by the transfer follower yet: read the receipt once and index it
+            token_contract, web3 = load_contract('token')
 
-        try:
-            receipt = web3.eth.get_transaction_receipt(tx_hash)
-        except Exception as e:
-            return JsonResponse({'error': f'web3 error: {str(e)}'}, status=500)
+            try:
+                receipt = web3.eth.get_transaction_receipt(tx_hash)
+            except Exception as e:
+                return JsonResponse({'error': f'web3 error: {str(e)}'}, status=500)
 
-        if receipt is None:
-            return JsonResponse({'error': 'transaction not found'}, status=400)
-        
-        if receipt.status != 1:
-            return JsonResponse({'error': 'transaction failed'}, status=400)
+            if receipt is None:
+                return JsonResponse({'error': 'transaction not found'}, status=400)
+            
+            if receipt.status != 1:
+                return JsonResponse({'error': 'transaction failed'}, status=400)
 
-        try:
-            transfer_events = token_contract.events.Transfer().process_receipt(receipt)
-        except Exception as e:
-            return JsonResponse({'error': f'Error processing receipt: {str(e)}'}, status=400)
-
-        matched = False
-        for ev in transfer_events:
-            ev_args = ev['args']
-            to_addr = web3.to_checksum_address(ev_args.get('to'))
-            value = ev_args.get('value')
-            if to_addr.lower() == expected_to.lower() and int(value) >= expected_amount:
-                matched = True
-                break
-
-        if not matched:
+            try:
+                transfer_events = token_contract.events.Transfer().process_receipt(receipt)
+            except Exception as e:
+                return JsonResponse({'error': f'Error processing receipt: {str(e)}'}, status=400)
+
+            rows = transfer_rows(transfer_events)
+            TokenTransfer.objects.bulk_create(rows, ignore_conflicts=True)
+            balance_service.invalidate(*{a for row in rows for a in (row.sender, row.recipient)})
+            transfer = find_transfer(expected_to, tx_hash, expected_amount)
+
+        if transfer is None:
             return JsonResponse({'error': 'No matching token Transfer event found'}, status=400)
 
         # Update passenger record to mark as paid
-        contract_pass, web3 = load_contract('passengers')
-        try:
-            current = contract_pass.functions.getPassengers().call()
-        except Exception as e:
-            current = ""
-
-        rows = [r for r in current.split('\n') if r.strip()]
-        new_record = ''
-        for row in rows:
-            arr = row.split('#')
-            if arr[0] == passenger_username and arr[1] == rid:
-                # Mark as paid
-                arr[6] = tx_hash
-                arr[8] = 'paid'
-                new_record += '#'.join(arr) + '\n'
-                logger.info(f"✅ Marked ride {rid} as paid with tx: {tx_hash}")
-            else:
-                new_record += row + '\n'
-
-        if new_record != current:
-            send_transaction('passengers', 'setPassengers', new_record)
+        if load_table('passengers').first('request', (passenger_username, rid)):
+            payment_settler.settle({(passenger_username, rid): tx_hash})
 
         return JsonResponse({'status': 'ok', 'message': 'Payment verified!'})
         
@@ -817,6 +978,21 @@ def verify_token_payment(request):
 
 # -------------------- Additional Utility Views --------------------
 
+def rpc_metrics_view(request):
+    """Prometheus text exposition of the per-view JSON-RPC counters"""
+    if not getattr(settings, 'RPC_METRICS_ENDPOINT', True):
+        return HttpResponse(status=404)
+    return HttpResponse(rpc_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def tx_status(request, tracking_id):
+    """Return the status of a background transaction job (pending/mined/failed)"""
+    if not get_current_user(request):
+        return JsonResponse({'error': 'Not logged in'}, status=401)
+    job = tx_tracker.status(tracking_id)
+    if job is None:
+        return JsonResponse({'error': 'Unknown transaction id'}, status=404)
+    return JsonResponse(job)
+
 def map_view(request):
     """Display map view for finding rides"""
     user = get_current_user(request)
@@ -834,36 +1010,26 @@ def map_view(request):
     return render(request, 'MapView.html', context)
 
 @csrf_exempt
-def get_completed_rides_for_passenger(request):
+async def get_completed_rides_for_passenger(request):
     """Get completed rides that need payment from the current passenger"""
-    user = get_current_user(request)
+    user = await aget_current_user(request)
     if not user:
         return JsonResponse({'status': 'error', 'message': 'Not logged in'})
         
-    contract_pass, web3 = load_contract('passengers')
-    try:
-        current = contract_pass.functions.getPassengers().call()
-    except Exception as e:
-        current = ""
-
     completed_rides = []
-    rows = [r for r in current.split('\n') if r.strip()]
-    for row in rows:
-        arr = row.split('#')
+    for req in await alookup('passengers', 'passenger', user):
         # Look for rides where: passenger is current user, status is completed, amount > 0, and not paid
-        if (len(arr) > 8 and 
-            arr[3] == user and 
-            arr[8] == 'completed' and 
-            arr[5] != '0' and 
-            arr[5] != '0.0' and
-            (len(arr) <= 6 or arr[6] == '0' or arr[6] == '0#0')):  # Not paid yet
+        if (req.status == 'completed' and 
+            req.amount != '0' and 
+            req.amount != '0.0' and
+            req.tx_hash == '0'):  # Not paid yet
             completed_rides.append({
-                'passenger_id': arr[0],
-                'ride_id': arr[1],
-                'driver': arr[2],
-                'amount': arr[5],
-                'miles': arr[4],
-                'status': arr[8]
+                'passenger_id': req.passenger_id,
+                'ride_id': req.ride_id,
+                'driver': req.driver,
+                'amount': req.amount,
+                'miles': req.miles,
+                'status': req.status
             })
     
     return JsonResponse({'completed_rides': completed_rides})
@@ -891,17 +1057,8 @@ def Ratings(request):
         
     if request.method == 'GET':
         output = '<div class="mb-3"><label class="form-label">Driver Name</label><select name="t1" class="form-select">'
-        contract_signup, web3 = load_contract('signup')
-        try:
-            stored = contract_signup.functions.getUser().call()
-        except Exception as e:
-            stored = ""
-
-        rows = [r for r in stored.split('\n') if r.strip()]
-        for row in rows:
-            arr = row.split('#')
-            if len(arr) > 5 and arr[5] == 'Driver':
-                output += f'<option value="{arr[0]}">{arr[0]}</option>'
+        for driver in query_table('signup').lookup('user_type', 'Driver'):
+            output += f'<option value="{driver.username}">{driver.username}</option>'
         output += "</select></div>"
         
         wallet_address = get_user_wallet_address(user)
@@ -917,36 +1074,25 @@ def Ratings(request):
     return redirect('UserScreen')
 
 @csrf_exempt
-def get_completed_paid_rides(request):
+async def get_completed_paid_rides(request):
     """Get rides that are completed AND paid"""
-    user = get_current_user(request)
+    user = await aget_current_user(request)
     if not user:
         return JsonResponse({'status': 'error', 'message': 'Not logged in'})
         
-    try:
-        contract_pass, web3 = load_contract('passengers')
-        current = contract_pass.functions.getPassengers().call()
-    except Exception as e:
-        current = ""
-
     paid_rides = []
-    rows = [r for r in current.split('\n') if r.strip()]
-    
-    for row in rows:
-        arr = row.split('#')
-        # Look for rides where: driver is current user, status is 'paid'
-        if (len(arr) > 8 and 
-            arr[2] == user and  # driver is current user
-            arr[8] == 'paid' and  # status is paid
-            arr[5] != '0' and arr[5] != '0.0'):  # has payment amount
+    # Look for rides where: driver is current user, status is 'paid'
+    for req in await alookup('passengers', 'driver', user):
+        if (req.status == 'paid' and  # status is paid
+            req.amount != '0' and req.amount != '0.0'):  # has payment amount
             
             paid_rides.append({
-                'ride_id': arr[1],
-                'passenger': arr[3],
-                'amount': arr[5],
-                'miles': arr[4],
-                'tx_hash': arr[6] if len(arr) > 6 else '',
-                'status': arr[8]
+                'ride_id': req.ride_id,
+                'passenger': req.passenger,
+                'amount': req.amount,
+                'miles': req.miles,
+                'tx_hash': req.tx_hash,
+                'status': req.status
             })
     
     return JsonResponse({'paid_rides': paid_rides})
@@ -959,20 +1105,11 @@ def RatingsAction(request):
     if request.method == 'POST':
         driver_name = request.POST.get('t1')
         rating = request.POST.get('t2')
-        data = f"{user}#{driver_name}#{rating}\n"
+        data = record_to_row(Rating(user, driver_name, rating)) + "\n"
         
-        contract_ratings, web3 = load_contract('ratings')
-        try:
-            current = contract_ratings.functions.getRatings().call()
-        except Exception as e:
-            current = ""
-            
-        if current and current.strip():
-            updated_ratings = current + data
-        else:
-            updated_ratings = data
-            
-        send_transaction('ratings', 'setRatings', updated_ratings)
+        # Nothing on the page depends on the new row: write it in the background
+        # and let UserScreen follow the transaction through /tx_status/
+        tx_id = tx_tracker.submit_updates([('ratings', append_row(data))])
         
         wallet_address = get_user_wallet_address(user)
         token_balance = get_token_balance(wallet_address)
@@ -981,7 +1118,8 @@ def RatingsAction(request):
             'data': 'Ratings accepted! Thank you', 
             'user': user,
             'wallet_address': wallet_address,
-            'token_balance': token_balance
+            'token_balance': token_balance,
+            'tx_id': tx_id
         }
         return render(request, 'UserScreen.html', context)
     return redirect('UserScreen')
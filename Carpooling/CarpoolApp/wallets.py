@@ -0,0 +1,85 @@
+import threading
+from django.db import IntegrityError
+import logging
+from .models import Wallet
+from .records import load_table
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Wallet Registry --------------------
+
+class WalletRegistry:
+    """Username -> wallet address lookups shared across worker processes.
+
+    Addresses live in the Wallet table (unique index on username), so a
+    login handled by one worker is visible to every other. Each process
+    warms the table once from the users blob; after that a lookup is a
+    single indexed query and only unknown usernames fall back to the chain.
+    """
+
+    def __init__(self):
+        self._warm_lock = threading.Lock()
+        self._warmed = False
+        self._warm_started = False
+
+    def get(self, username):
+        """Return the wallet address stored for `username`, or None."""
+        if not username:
+            return None
+        address = Wallet.objects.filter(username=username).values_list('address', flat=True).first()
+        if address:
+            return address
+        # Registered before the registry existed, or on a worker that has
+        # not warmed yet: take it from the users blob once.
+        for user in load_table('signup').lookup('username', username):
+            if user.wallet:
+                self.store(username, user.wallet)
+                return user.wallet
+        return None
+
+    def store(self, username, address):
+        """Record `address` as the wallet of `username`."""
+        if not username or not address:
+            return
+        Wallet.objects.update_or_create(username=username, defaults={'address': address})
+        logger.info(f"Stored wallet for {username}: {address}")
+
+    def warm(self):
+        """Add every wallet from the users blob that the table is missing.
+
+        Existing rows are left alone, so a wallet a user logged in with
+        is not replaced by the one they signed up with.
+        """
+        with self._warm_lock:
+            if self._warmed:
+                return 0
+            known = set(Wallet.objects.values_list('username', flat=True))
+            missing = {}
+            for user in load_table('signup'):
+                if user.username and user.wallet and user.username not in known:
+                    missing.setdefault(user.username, user.wallet)
+            try:
+                Wallet.objects.bulk_create(
+                    [Wallet(username=u, address=a) for u, a in missing.items()],
+                    ignore_conflicts=True)
+            except IntegrityError as e:
+                logger.warning(f"Warming wallet registry failed: {e}")
+                return 0
+            self._warmed = True
+        logger.info(f"Warmed wallet registry with {len(missing)} wallets")
+        return len(missing)
+
+    def warm_in_background(self, **kwargs):
+        """request_started receiver: warm once per process without blocking the request."""
+        with self._warm_lock:
+            if self._warm_started:
+                return
+            self._warm_started = True
+        def run():
+            try:
+                self.warm()
+            except Exception as e:
+                logger.warning(f"Warming wallet registry failed: {e}")
+        threading.Thread(target=run, name='wallet-warm', daemon=True).start()
+
+wallet_registry = WalletRegistry()
@@ -8,6 +8,12 @@ contract Carpool {
     string public passengers;
     string public ratings;
     
+    // Bumped on every write so clients can compare-and-set (see set*IfVersion)
+    uint256 public usersVersion;
+    uint256 public ridesVersion;
+    uint256 public passengersVersion;
+    uint256 public ratingsVersion;
+    
     constructor() {
         owner = msg.sender;
         users = "";
@@ -18,6 +24,7 @@ contract Carpool {
     
     function addUser(string memory _userData) public {
         users = string(abi.encodePacked(users, _userData));
+        usersVersion++;
     }
     
     function getUser() public view returns (string memory) {
@@ -27,10 +34,12 @@ contract Carpool {
     // ADD THIS FUNCTION - was missing
     function setUser(string memory _userData) public {
         users = _userData;
+        usersVersion++;
     }
     
     function setRide(string memory _rideData) public {
         rides = _rideData;
+        ridesVersion++;
     }
     
     function getRide() public view returns (string memory) {
@@ -39,6 +48,7 @@ contract Carpool {
     
     function setPassengers(string memory _passengerData) public {
         passengers = _passengerData;
+        passengersVersion++;
     }
     
     function getPassengers() public view returns (string memory) {
@@ -47,12 +57,67 @@ contract Carpool {
     
     function setRatings(string memory _ratingData) public {
         ratings = _ratingData;  // CHANGED: Replace instead of append
+        ratingsVersion++;
     }
     
     function getRatings() public view returns (string memory) {
         return ratings;
     }
     
+    // -------------------- Versioned reads & compare-and-set writes --------------------
+    // Read a table with its version, then write it back only if nobody else
+    // wrote in between; on "version conflict" re-read and re-apply the change.
+    
+    function getUserVersioned() public view returns (string memory, uint256) {
+        return (users, usersVersion);
+    }
+    
+    function getRideVersioned() public view returns (string memory, uint256) {
+        return (rides, ridesVersion);
+    }
+    
+    function getPassengersVersioned() public view returns (string memory, uint256) {
+        return (passengers, passengersVersion);
+    }
+    
+    function getRatingsVersioned() public view returns (string memory, uint256) {
+        return (ratings, ratingsVersion);
+    }
+    
+    function setUserIfVersion(string memory _userData, uint256 _expected) public {
+        require(usersVersion == _expected, "version conflict");
+        setUser(_userData);
+    }
+    
+    function setRideIfVersion(string memory _rideData, uint256 _expected) public {
+        require(ridesVersion == _expected, "version conflict");
+        setRide(_rideData);
+    }
+    
+    function setPassengersIfVersion(string memory _passengerData, uint256 _expected) public {
+        require(passengersVersion == _expected, "version conflict");
+        setPassengers(_passengerData);
+    }
+    
+    function setRatingsIfVersion(string memory _ratingData, uint256 _expected) public {
+        require(ratingsVersion == _expected, "version conflict");
+        setRatings(_ratingData);
+    }
+    
+    // Apply several writes (e.g. setPassengers + setRide) in one transaction.
+    // Each entry is the ABI-encoded call; any failure reverts the whole batch.
+    function multicall(bytes[] calldata _calls) public {
+        for (uint256 i = 0; i < _calls.length; i++) {
+            (bool ok, bytes memory result) = address(this).delegatecall(_calls[i]);
+            if (!ok) {
+                // Re-throw the inner revert so callers still see e.g. "version conflict"
+                assembly {
+                    revert(add(result, 32), mload(result))
+                }
+            }
+        }
+    }
+    
     // Helper function to clear data (for testing)
     function clearAllData() public {
         require(msg.sender == owner, "Only owner can clear data");
@@ -60,5 +125,9 @@ contract Carpool {
         rides = "";
         passengers = "";
         ratings = "";
+        usersVersion++;
+        ridesVersion++;
+        passengersVersion++;
+        ratingsVersion++;
     }
 }
\ No newline at end of file
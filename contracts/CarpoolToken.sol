@@ -19,6 +19,39 @@ contract CarpoolToken is ERC20, Ownable {
         _burn(_msgSender(), amount);
     }
     
+    // Bulk distribution: each sender can use a batch id once, so a client that
+    // resends a chunk after a crash cannot pay the same recipients twice.
+    // Keyed by sender so nobody else can burn an id another account will use.
+    mapping(address => mapping(bytes32 => bool)) public batchDone;
+    
+    event BatchDistributed(address indexed sender, bytes32 indexed batchId, uint256 count, uint256 total);
+    
+    function batchTransfer(bytes32 batchId, address[] calldata recipients, uint256[] calldata amounts) public returns (bool) {
+        uint256 total = _startBatch(batchId, recipients, amounts);
+        for (uint256 i = 0; i < recipients.length; i++) {
+            _transfer(_msgSender(), recipients[i], amounts[i]);
+        }
+        emit BatchDistributed(_msgSender(), batchId, recipients.length, total);
+        return true;
+    }
+    
+    function batchMint(bytes32 batchId, address[] calldata recipients, uint256[] calldata amounts) public onlyOwner {
+        uint256 total = _startBatch(batchId, recipients, amounts);
+        for (uint256 i = 0; i < recipients.length; i++) {
+            _mint(recipients[i], amounts[i]);
+        }
+        emit BatchDistributed(_msgSender(), batchId, recipients.length, total);
+    }
+    
+    function _startBatch(bytes32 batchId, address[] calldata recipients, uint256[] calldata amounts) private returns (uint256 total) {
+        require(recipients.length == amounts.length, "length mismatch");
+        require(!batchDone[_msgSender()][batchId], "batch already distributed");
+        batchDone[_msgSender()][batchId] = true;
+        for (uint256 i = 0; i < amounts.length; i++) {
+            total += amounts[i];
+        }
+    }
+    
     // Transfer function is inherited from ERC20
     // function transfer(address recipient, uint256 amount) public override returns (bool)
 }
\ No newline at end of file
@@ -0,0 +1,223 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+// Per-record storage for the carpool tables. Each write touches one record
+// instead of rewriting a whole '#'-delimited string, and reads are paginated.
+contract CarpoolV2 {
+    struct User {
+        string username;
+        string password;
+        string contact;
+        string email;
+        string vehicle;
+        string userType;
+        address wallet;
+    }
+
+    struct Ride {
+        uint256 id;
+        string driver;
+        string location;
+        string lat;
+        string long;
+        uint256 seats;
+        string date;
+        string status;
+        string time;
+        string recurring;
+    }
+
+    struct PassengerRequest {
+        uint256 id;
+        uint256 rideId;
+        string driver;
+        string passenger;
+        string miles;
+        string amount;
+        string txHash;
+        string status;
+    }
+
+    struct Rating {
+        string user;
+        string driver;
+        uint8 rating;
+    }
+
+    address public owner;
+
+    User[] private users;
+    Ride[] private rides;
+    PassengerRequest[] private passengerRequests;
+    Rating[] private ratings;
+
+    // keccak256(username) / id -> array index + 1 (0 means missing)
+    mapping(bytes32 => uint256) private userIndex;
+    mapping(uint256 => uint256) private rideIndex;
+    mapping(uint256 => uint256) private requestIndex;
+
+    event UserAdded(string username, address wallet);
+    event RideAdded(uint256 indexed id, string driver);
+    event RideStatusUpdated(uint256 indexed id, string status);
+    event PassengerRequestAdded(uint256 indexed id, uint256 indexed rideId, string passenger);
+    event PassengerRequestCompleted(uint256 indexed id, string miles, string amount);
+    event PassengerRequestPaid(uint256 indexed id, string txHash);
+    event RatingAdded(string user, string driver, uint8 rating);
+
+    constructor() {
+        owner = msg.sender;
+    }
+
+    // -------------------- Users --------------------
+
+    function addUser(
+        string memory _username,
+        string memory _password,
+        string memory _contact,
+        string memory _email,
+        string memory _vehicle,
+        string memory _userType,
+        address _wallet
+    ) public {
+        bytes32 key = keccak256(bytes(_username));
+        require(userIndex[key] == 0, "User exists");
+        users.push(User(_username, _password, _contact, _email, _vehicle, _userType, _wallet));
+        userIndex[key] = users.length;
+        emit UserAdded(_username, _wallet);
+    }
+
+    function getUserByName(string memory _username) public view returns (User memory) {
+        uint256 idx = userIndex[keccak256(bytes(_username))];
+        require(idx != 0, "Unknown user");
+        return users[idx - 1];
+    }
+
+    function userCount() public view returns (uint256) {
+        return users.length;
+    }
+
+    function getUsers(uint256 _offset, uint256 _limit) public view returns (User[] memory page) {
+        uint256 end = _pageEnd(users.length, _offset, _limit);
+        page = new User[](end - _offset);
+        for (uint256 i = _offset; i < end; i++) {
+            page[i - _offset] = users[i];
+        }
+    }
+
+    // -------------------- Rides --------------------
+
+    function addRide(
+        string memory _driver,
+        string memory _location,
+        string memory _lat,
+        string memory _long,
+        uint256 _seats,
+        string memory _date,
+        string memory _time,
+        string memory _recurring
+    ) public returns (uint256 id) {
+        id = rides.length + 1;
+        rides.push(Ride(id, _driver, _location, _lat, _long, _seats, _date, "waiting", _time, _recurring));
+        rideIndex[id] = rides.length;
+        emit RideAdded(id, _driver);
+    }
+
+    function updateRideStatus(uint256 _id, string memory _status) public {
+        uint256 idx = rideIndex[_id];
+        require(idx != 0, "Unknown ride");
+        rides[idx - 1].status = _status;
+        emit RideStatusUpdated(_id, _status);
+    }
+
+    function getRideById(uint256 _id) public view returns (Ride memory) {
+        uint256 idx = rideIndex[_id];
+        require(idx != 0, "Unknown ride");
+        return rides[idx - 1];
+    }
+
+    function rideCount() public view returns (uint256) {
+        return rides.length;
+    }
+
+    function getRides(uint256 _offset, uint256 _limit) public view returns (Ride[] memory page) {
+        uint256 end = _pageEnd(rides.length, _offset, _limit);
+        page = new Ride[](end - _offset);
+        for (uint256 i = _offset; i < end; i++) {
+            page[i - _offset] = rides[i];
+        }
+    }
+
+    // -------------------- Passenger Requests --------------------
+
+    function addPassengerRequest(
+        uint256 _rideId,
+        string memory _driver,
+        string memory _passenger
+    ) public returns (uint256 id) {
+        require(rideIndex[_rideId] != 0, "Unknown ride");
+        id = passengerRequests.length + 1;
+        passengerRequests.push(PassengerRequest(id, _rideId, _driver, _passenger, "0", "0", "0", "waiting"));
+        requestIndex[id] = passengerRequests.length;
+        emit PassengerRequestAdded(id, _rideId, _passenger);
+    }
+
+    function completePassengerRequest(uint256 _id, string memory _miles, string memory _amount) public {
+        uint256 idx = requestIndex[_id];
+        require(idx != 0, "Unknown request");
+        PassengerRequest storage req = passengerRequests[idx - 1];
+        req.miles = _miles;
+        req.amount = _amount;
+        req.status = "completed";
+        emit PassengerRequestCompleted(_id, _miles, _amount);
+    }
+
+    function markPaid(uint256 _id, string memory _txHash) public {
+        uint256 idx = requestIndex[_id];
+        require(idx != 0, "Unknown request");
+        PassengerRequest storage req = passengerRequests[idx - 1];
+        req.txHash = _txHash;
+        req.status = "paid";
+        emit PassengerRequestPaid(_id, _txHash);
+    }
+
+    function passengerRequestCount() public view returns (uint256) {
+        return passengerRequests.length;
+    }
+
+    function getPassengerRequests(uint256 _offset, uint256 _limit) public view returns (PassengerRequest[] memory page) {
+        uint256 end = _pageEnd(passengerRequests.length, _offset, _limit);
+        page = new PassengerRequest[](end - _offset);
+        for (uint256 i = _offset; i < end; i++) {
+            page[i - _offset] = passengerRequests[i];
+        }
+    }
+
+    // -------------------- Ratings --------------------
+
+    function addRating(string memory _user, string memory _driver, uint8 _rating) public {
+        ratings.push(Rating(_user, _driver, _rating));
+        emit RatingAdded(_user, _driver, _rating);
+    }
+
+    function ratingCount() public view returns (uint256) {
+        return ratings.length;
+    }
+
+    function getRatings(uint256 _offset, uint256 _limit) public view returns (Rating[] memory page) {
+        uint256 end = _pageEnd(ratings.length, _offset, _limit);
+        page = new Rating[](end - _offset);
+        for (uint256 i = _offset; i < end; i++) {
+            page[i - _offset] = ratings[i];
+        }
+    }
+
+    // -------------------- Helpers --------------------
+
+    function _pageEnd(uint256 _length, uint256 _offset, uint256 _limit) private pure returns (uint256) {
+        if (_offset >= _length) {
+            return _offset;
+        }
+        uint256 end = _offset + _limit;
+        return end > _length ? _length : end;
+    }
+}
@@ -0,0 +1,5 @@
+const CarpoolV2 = artifacts.require("CarpoolV2");
+
+module.exports = function(deployer) {
+  deployer.deploy(CarpoolV2);
+};